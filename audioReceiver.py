@@ -4,6 +4,9 @@ import numpy as np
 from scipy.fft import rfft
 import audioSettings
 import queue
+from audioRingBuffer import AudioRingBuffer
+from ringModulator import RingModulator
+from telegramModulator import TelegramModulator
 import configuration
 import math
 from scipy import signal
@@ -21,6 +24,10 @@ from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives import hashes
 from timeit import default_timer as cProfileTimer
 import random
+import goertzel
+import telegramFec
+from telegramFec import TelegramFec
+import telegramCrc
 
 ''''
 This module implements the right side of this drawing:
@@ -82,16 +89,520 @@ DECODE_DATA_LEN = 4
 DECODE_DATA = 5
 DECODE_END = 6
 DECODE_CHECKSUM = 7
+# telegram with forward error correction: LENGTH and coded BODY after FEC_MARKER (instead of ADDRESS)
+DECODE_FEC_LENGTH = 8
+DECODE_FEC_BODY = 9
 # take also ONE byte from PREAMBLE to avoid detecting START by coincidentially/random correct value
 # we need to do this because otherwise we shall know exactly where the preamble finishes...but that is exactly what we want to find out!
 LAST_PREAMBLE_BYTE_AND_START_BITS = bitarray([True,True,True,True,True,True,True,True,False,True,False,True,False,True,False,True]) # = b"\xFF\x55"
 START_BITS = bitarray([False,True,False,True,False,True,False,True]) # = b"\x55"
+PN_PREAMBLE_BITS = bitarray()
+PN_PREAMBLE_BITS.frombytes(audioSettings.PN_PREAMBLE_BYTES)
 END_BITS = bitarray([True,False,True,False,True,False,True,False]) # = b"\xAA"
+# readers of the RX ring buffer
+READER_DECODER = "decoder"
+READER_PLOTTER = "plotter"
+# size of RX ring buffer in audio chunks, that is, how long the decoder (or plot) may stall without losing samples
+RX_RING_BUFFER_CHUNKS = 16
+# timeout waiting for samples to decode, to check regularly if the stream is still on
+DECODE_WAIT_TIMEOUT_SEC = 0.5
 # definitions for reception state
 IDLE = 0
 CALL_ACCEPTED = 1
 KEY_START_RECEIVED = 2
 KEY_END_RECEIVED = 3
+# band-select and decimation in front of the decoder
+# The code frequencies are band-pass filtered with a FIR filter of DECIMATION_FILTER_TAPS_PER_PHASE*DECIMATION_FACTOR + 1 taps
+# and only every DECIMATION_FACTOR-th output is calculated (polyphase, as a matrix product of the filter with a strided view of the input),
+# so synchronization and demodulation run at DECODER_SAMPLING_FREQUENCY with DECODER_LEN_BIT_ONE samples per bit.
+DECIMATION_FILTER_TAPS_PER_PHASE = 48
+
+
+class Decimator():
+    def __init__(self, max_block_len):
+        self.factor = audioSettings.DECIMATION_FACTOR
+        # delay of the filter in samples at decoder rate
+        self.delay = 0
+        if self.factor > 1:
+            numtaps = DECIMATION_FILTER_TAPS_PER_PHASE*self.factor + 1
+            f_low = min(audioSettings.CODE_SINE_FREQUENCY_ONE, audioSettings.CODE_SINE_FREQUENCY_ZERO) - BPF_LEFT_MARGIN
+            f_high = max(audioSettings.CODE_SINE_FREQUENCY_ONE, audioSettings.CODE_SINE_FREQUENCY_ZERO) + BPF_RIGHT_MARGIN
+            if f_low > 0:
+                self.h = signal.firwin(numtaps, [f_low, f_high], pass_zero=False, fs=audioSettings.SAMPLING_FREQUENCY)
+            else:
+                self.h = signal.firwin(numtaps, f_high, fs=audioSettings.SAMPLING_FREQUENCY)
+            self.delay = DECIMATION_FILTER_TAPS_PER_PHASE//2
+            # filter reversed, so each output is the product of the input window ending at its sample with h_reversed
+            self.h_reversed = np.ascontiguousarray(self.h[::-1])
+            # the last numtaps - 1 input samples of the previous block, followed by the new block
+            # NOTE: numtaps - 1 is a multiple of the factor, so the outputs of all blocks lie on the same grid
+            self.tail_len = numtaps - 1
+            self.extended = np.zeros(self.tail_len + max_block_len)
+            # input windows of numtaps samples, each one factor samples after the previous one (a view, no copy)
+            self.windows = np.lib.stride_tricks.as_strided(self.extended, shape=(max_block_len//self.factor, numtaps),
+                                                           strides=(self.factor*self.extended.strides[0], self.extended.strides[0]), writeable=False)
+            # pre-allocated output, returned as a view (valid until the next call)
+            self.decimated = np.zeros(max_block_len//self.factor)
+
+    # len(samples) shall be a multiple of the factor, returns len(samples)/factor samples
+    def process(self, samples):
+        if self.factor == 1:
+            return samples
+        nr_of_samples = len(samples)
+        extended = self.extended[:self.tail_len + nr_of_samples]
+        extended[self.tail_len:] = samples
+        decimated = self.decimated[:nr_of_samples//self.factor]
+        np.matmul(self.windows[:len(decimated)], self.h_reversed, out=decimated)
+        extended[:self.tail_len] = extended[nr_of_samples:]
+        return decimated
+
+    # forget the input samples of the previous blocks (e.g. after a gap in the input)
+    def reset(self):
+        if self.factor > 1:
+            self.extended[:self.tail_len] = 0.0
+
+
+# batch bit demodulator
+# each bit decision only needs the DFT bins BIN_FREQUENCY_ONE_FINE and BIN_FREQUENCY_ZERO_FINE of one bit-window,
+# (these bins are the same at SAMPLING_FREQUENCY and at DECODER_SAMPLING_FREQUENCY)
+# so instead of calling rfft() once per bit we project a (bits x DECODER_LEN_BIT_ONE) view of the samples
+# on a two-row complex basis containing only these two DFT rows, in a single matrix product.
+# The basis is cached per (DECODER_SAMPLING_FREQUENCY, DECODER_LEN_BIT_ONE, bins) and only re-calculated when one of them changes.
+TONE_BASIS_CACHE = {}
+
+
+def getToneBasis():
+    key = (audioSettings.DECODER_SAMPLING_FREQUENCY, audioSettings.DECODER_LEN_BIT_ONE, audioSettings.BIN_FREQUENCY_ONE_FINE, audioSettings.BIN_FREQUENCY_ZERO_FINE)
+    basis = TONE_BASIS_CACHE.get(key)
+    if basis is None:
+        n = np.arange(audioSettings.DECODER_LEN_BIT_ONE)
+        bins = np.array([[audioSettings.BIN_FREQUENCY_ONE_FINE], [audioSettings.BIN_FREQUENCY_ZERO_FINE]])
+        # scaled to obtain the same levels as 2.0*abs(rfft(bit_samples))/DECODER_LEN_BIT_ONE
+        # stored transposed (DECODER_LEN_BIT_ONE x 2) so we can right-multiply the bit-windows directly
+        basis = np.ascontiguousarray(((2.0/audioSettings.DECODER_LEN_BIT_ONE)*np.exp(-2j*np.pi*bins*n/audioSettings.DECODER_LEN_BIT_ONE)).T)
+        TONE_BASIS_CACHE[key] = basis
+    return basis
+
+
+def demodulateBits(sample_buffer, start, nr_of_bits, use_goertzel):
+    # returns the levels of FREQ_ONE and FREQ_ZERO of nr_of_bits consecutive bits, beginning at sample start (at decoder rate)
+    bit_samples = np.reshape(sample_buffer[start:start + nr_of_bits*audioSettings.DECODER_LEN_BIT_ONE], (nr_of_bits, audioSettings.DECODER_LEN_BIT_ONE))
+    if use_goertzel:
+        # Goertzel evaluates the exact code frequencies, which do not always lie on a DFT bin of a bit-window
+        levels = goertzel.goertzel_level(bit_samples, audioSettings.DECODER_SAMPLING_FREQUENCY, (audioSettings.CODE_SINE_FREQUENCY_ONE, audioSettings.CODE_SINE_FREQUENCY_ZERO))
+    else:
+        levels = np.abs(bit_samples @ getToneBasis())
+    return levels[:, 0], levels[:, 1]
+
+
+# frame synchronizer
+# the waveform of LAST_PREAMBLE_BYTE_AND_START_BITS is rendered exactly as in the transmitter, that is,
+# with ONE and ZERO followed by the band-pass filter, which has a different group delay for each code frequency,
+# and then decimated exactly as the received signal.
+# The template is aligned to the bit-windows with the best separation of ONE and ZERO in START (as the former fine scan did),
+# so the correlation peak directly gives the position used to decode the bits.
+# It is rendered with the same modulator as in TX (also in continuous-phase mode) and cached per (SAMPLING_FREQUENCY, channel, CPFSK, PREAMBLE).
+# With PN_PREAMBLE the last PREAMBLE byte is PN_PREAMBLE_BYTES (after silence) instead of 0xFF.
+SYNC_TEMPLATE_CACHE = {}
+# minimum normalized correlation of a found marker (noise in the complete audio band reduces the value).
+# NOTE: a marker shifted into the PREAMBLE (e.g. START cut at the end of the buffer) still matches about 12 of 16 bits,
+#            these positions are discarded when checking the bits of START.
+SYNC_MIN_QUALITY = 0.3
+# minimum normalized correlation of a marker searched without a detected PREAMBLE (correlation lock with PN_PREAMBLE, and after a telegram).
+# NOTE: on noise the best window of a part reaches about 0.6, a received marker about 0.8 or more.
+SYNC_LOCK_MIN_QUALITY = 0.7
+# maximum correction of the correlation peak by the fine timing on the START bits (in samples at decoder rate)
+SYNC_REFINE_SAMPLES = 4
+# PREAMBLE detector with constant false alarm rate (CFAR), see CfarDetector
+# probability that a part with noise only triggers the search of START
+CFAR_FALSE_ALARM_PROBABILITY = 1e-3
+# the level of a bin with noise only is Rayleigh distributed, with mean m the probability of a level above CFAR_SCALE*m is
+# exp(-(pi/4)*CFAR_SCALE**2) = CFAR_FALSE_ALARM_PROBABILITY
+CFAR_SCALE = math.sqrt(-4.0/math.pi*math.log(CFAR_FALSE_ALARM_PROBABILITY))
+# gain of the exponential average of the noise floor (per part, that is, a time constant of about 20 parts)
+CFAR_NOISE_FLOOR_ALPHA = 0.05
+# reference bins in the same part: up to CFAR_REFERENCE_BINS on each side of the detected bin,
+# without CFAR_GUARD_BINS on each side of the code frequencies (the PREAMBLE leaks into the next bins)
+CFAR_REFERENCE_BINS = 8
+CFAR_GUARD_BINS = 2
+# idle listening (no call active and nothing code-like received): the input is evaluated in blocks of IDLE_LISTENING_PARTS parts
+# only with the energy gate (see listenIdle()), a part is code-like if the level of FREQ_ONE or FREQ_ZERO is above
+# IDLE_GATE_FACTOR times the threshold of the PREAMBLE detector (a PREAMBLE split in two parts has at least half of its level in one of them)
+IDLE_LISTENING_PARTS = 4
+IDLE_GATE_FACTOR = 0.5
+
+
+def getSyncTemplate(sos_bandpass, preamble, use_goertzel):
+    key = (audioSettings.SAMPLING_FREQUENCY, audioSettings.CURRENT_FREQUENCY_CHANNEL, audioSettings.CONTINUOUS_PHASE_FSK, preamble, use_goertzel)
+    template = SYNC_TEMPLATE_CACHE.get(key)
+    if template is None:
+        # render complete PREAMBLE, START and one byte more, in order to have the filter settled and the bits after START
+        # (a short PREAMBLE follows silence, so START is always at TELEGRAM_PREAMBLE_LEN_SAMPLES)
+        silence = np.zeros(audioSettings.TELEGRAM_PREAMBLE_LEN_SAMPLES - len(preamble)*8*audioSettings.LEN_BIT_ONE)
+        rendered = signal.sosfilt(sos_bandpass, np.concatenate([silence, TelegramModulator().renderBytes(preamble + b"\x55\x01")]))
+        decimator = Decimator(len(rendered))
+        rendered = decimator.process(rendered)
+        start_pos = audioSettings.TELEGRAM_PREAMBLE_LEN_SAMPLES//audioSettings.DECIMATION_FACTOR
+        # delay with best worst-case gap between ONE and ZERO in the bits of START
+        # NOTE: the filters may delay the signal by more than one bit, so the gap alone is ambiguous (it repeats every bit),
+        #            we only consider delays where the bits of START are decoded correctly.
+        best_gap = -1.0
+        for delay in range(audioSettings.DECODER_LEN_BIT_ONE*4 + decimator.delay):
+            level_one, level_zero = demodulateBits(rendered, start_pos + delay, audioSettings.START_LEN_BYTES*8, use_goertzel)
+            gap = np.min(np.abs(level_one - level_zero))
+            if (gap > best_gap) and (levelsToBits(level_one, level_zero) == START_BITS):
+                best_gap = gap
+                best_delay = delay
+        template_start = start_pos - 8*audioSettings.DECODER_LEN_BIT_ONE + best_delay
+        template = rendered[template_start:template_start + 8*audioSettings.DECODER_LEN_BIT_ONE + audioSettings.DECODER_START_LEN_SAMPLES]
+        SYNC_TEMPLATE_CACHE[key] = template
+    return template
+
+
+# basis of the single-bin correlation of len_part samples with the given frequencies (one column per frequency)
+def getToneGateBasis(sampling_frequency, len_part, frequencies):
+    n = np.arange(len_part)[:, np.newaxis]
+    return np.exp(-2j*np.pi*np.array(frequencies)*n/sampling_frequency)
+
+
+# energy gate: levels of the tones of the gate basis in each part of samples (len(samples) shall be a multiple of the part length),
+# in O(N) and with the same scaling as the spectrum, that is, 2.0*abs(X)/N
+def getToneLevels(samples, basis):
+    return (2.0/len(basis))*np.abs(np.reshape(samples, (-1, len(basis))) @ basis)
+
+
+def levelsToBits(level_one, level_zero):
+    # code bits according to maximum of FFT(FREQ_ONE) and FFT(FREQ_ZERO)
+    bits = bitarray()
+    bits.pack((level_one > level_zero).tobytes())
+    return bits
+
+
+# level tracker
+# Base of the bit detectors working sample by sample: for every incoming sample they obtain the levels of FREQ_ONE and FREQ_ZERO
+# of the bit-window (DECODER_LEN_BIT_ONE samples) ending at that sample.
+# Each sample is processed only once, no matter how many bit positions or offsets are evaluated afterwards,
+# which become simple look-ups (or an argmax) on the stored traces.
+# The traces of the last history_len samples are kept, the last entry belongs to the last sample passed to update().
+# A detector with a delay > 0 obtains the levels of a bit-window delay samples later, so the caller shall delay its samples accordingly.
+class LevelTracker():
+    def __init__(self, history_len):
+        self.history_len = history_len
+        self.len_bit = audioSettings.DECODER_LEN_BIT_ONE
+        self.delay = 0
+        # traces
+        self.level_one = np.zeros(history_len)
+        self.level_zero = np.zeros(history_len)
+
+    # shift traces and append new levels (nr. of samples x 2), len(levels) shall not exceed history_len
+    def appendLevels(self, levels):
+        nr_of_samples = len(levels)
+        if nr_of_samples == self.history_len:
+            self.level_one[:] = levels[:, 0]
+            self.level_zero[:] = levels[:, 1]
+        else:
+            self.level_one[:-nr_of_samples] = self.level_one[nr_of_samples:]
+            self.level_zero[:-nr_of_samples] = self.level_zero[nr_of_samples:]
+            self.level_one[-nr_of_samples:] = levels[:, 0]
+            self.level_zero[-nr_of_samples:] = levels[:, 1]
+
+    # forget the samples passed to update() before (e.g. after a gap in the input)
+    def reset(self):
+        self.level_one[:] = 0.0
+        self.level_zero[:] = 0.0
+
+    # levels of the bit-windows beginning at positions (any shape) relative to a buffer of length buffer_len,
+    # which ends with the last sample passed to update().
+    # NOTE: positions may also be negative (e.g. cut-bit beginning in the previous part), as long as they are in the history.
+    def levelsAt(self, buffer_len, positions):
+        idx = np.asarray(positions) + (self.history_len - buffer_len + self.len_bit - 1)
+        return self.level_one[idx], self.level_zero[idx]
+
+    # same as demodulateBits() but using the traces
+    def levels(self, buffer_len, start, nr_of_bits):
+        return self.levelsAt(buffer_len, start + self.len_bit*np.arange(nr_of_bits))
+
+    # same as levelsAt() but for fractional positions, linearly interpolated between the samples of the traces
+    def levelsAtFraction(self, buffer_len, positions):
+        idx = np.asarray(positions) + (self.history_len - buffer_len + self.len_bit - 1)
+        idx0 = np.floor(idx).astype(int)
+        fraction = idx - idx0
+        idx1 = np.minimum(idx0 + 1, self.history_len - 1)
+        return (self.level_one[idx0]*(1.0 - fraction) + self.level_one[idx1]*fraction,
+                self.level_zero[idx0]*(1.0 - fraction) + self.level_zero[idx1]*fraction)
+
+
+# timing recovery (Gardner) while decoding a frame with the traces of the bit detector:
+# at a transition between two different bits, the bit-window beginning half a bit before the expected bit position
+# shall contain half of each bit, that is, the same levels of ONE and ZERO.
+# Otherwise its soft value (ONE - ZERO)/(ONE + ZERO) gives the direction and size of the timing error,
+# which corrects the position of the next bits and the nr. of samples per bit (mismatch between the sample clocks of both sound cards)
+# with a proportional-integral loop.
+TIMING_RECOVERY_KP = 0.1 # correction of position, in half bits per unit error
+TIMING_RECOVERY_KI = 0.005 # correction of samples per bit, in half bits per unit error
+TIMING_RECOVERY_MAX_MISMATCH = 0.01 # max. relative clock mismatch
+
+
+# hybrid ARQ with soft combining:
+# for every bit of a telegram we keep its soft value (level(ONE) - level(ZERO))/(level(ONE) + level(ZERO)), the sign gives the bit.
+# The normalization limits the weight of bits hit by noise bursts, which have high levels of both tones.
+# The soft bits of a telegram with CHECKSUM ERROR are stored, keyed by (seqNr, nr. of bits), and added to the soft bits
+# of the next damaged copy, so that bits which are wrong in one copy are corrected by the other copies.
+# The combined bits are decoded again, if the checksum is still wrong the sum is kept for the next copy.
+HARQ_MAX_TELEGRAMS = 8 # max. nr. of damaged telegrams kept (the oldest is dropped)
+HARQ_MAX_DIFFERENT_BITS_RATIO = 0.1 # copies with more different bits are considered different telegrams (e.g. same seqNr during handshake)
+
+
+# tone tracker
+# Sliding DFT of the two code tones, using a running sum of the samples mixed with the
+# DFT basis of BIN_FREQUENCY_ONE_FINE and BIN_FREQUENCY_ZERO_FINE (same levels as demodulateBits()).
+# All intermediate results are calculated in place in a workspace pre-allocated for up to history_len samples per call.
+class ToneTracker(LevelTracker):
+    def __init__(self, history_len):
+        LevelTracker.__init__(self, history_len)
+        self.basis = getToneBasis()
+        # basis repeated periodically, so the rows for any sample counter are a slice (no index array needed)
+        self.basis_periodic = self.basis[np.arange(history_len + self.len_bit)%self.len_bit]
+        # position of the next sample in the DFT basis (= sample counter modulo DECODER_LEN_BIT_ONE)
+        self.basis_pos = 0
+        # workspace: the last DECODER_LEN_BIT_ONE mixed samples of the previous call (needed for the running sum) followed by the new mixed samples
+        self.mixed = np.zeros((self.len_bit + history_len, 2), dtype=complex)
+        self.cumsum = np.zeros((self.len_bit + history_len, 2), dtype=complex)
+        self.window_sums = np.zeros((history_len, 2), dtype=complex)
+        self.levels_new = np.zeros((history_len, 2))
+
+    def update(self, samples):
+        nr_of_samples = len(samples)
+        # bigger blocks are processed in pieces which fit in the workspace
+        if nr_of_samples > self.history_len:
+            for i in range(0, nr_of_samples, self.history_len):
+                self.update(samples[i:i + self.history_len])
+            return
+        mixed = self.mixed[:self.len_bit + nr_of_samples]
+        # NOTE: one tone at a time and real and imaginary parts separately,
+        #            broadcasting or a real times a complex operand would need temporary buffers
+        basis = self.basis_periodic[self.basis_pos:self.basis_pos + nr_of_samples]
+        for tone in range(2):
+            np.multiply(samples, basis[:, tone].real, out=mixed[self.len_bit:, tone].real)
+            np.multiply(samples, basis[:, tone].imag, out=mixed[self.len_bit:, tone].imag)
+        # running sum over the last DECODER_LEN_BIT_ONE mixed samples, for each new sample
+        cumsum = self.cumsum[:self.len_bit + nr_of_samples]
+        np.cumsum(mixed, axis=0, out=cumsum)
+        np.subtract(cumsum[self.len_bit:], cumsum[:nr_of_samples], out=self.window_sums[:nr_of_samples])
+        levels = self.levels_new[:nr_of_samples]
+        np.abs(self.window_sums[:nr_of_samples], out=levels)
+        # store state for next call
+        mixed[:self.len_bit] = mixed[nr_of_samples:]
+        self.basis_pos = (self.basis_pos + nr_of_samples)%self.len_bit
+        self.appendLevels(levels)
+
+    def reset(self):
+        LevelTracker.reset(self)
+        self.mixed[:self.len_bit] = 0.0
+
+
+# FSK discriminator
+# The samples are mixed down to complex baseband around the center of the code frequencies and low-pass filtered,
+# then a quadrature FM discriminator (phase difference between consecutive baseband samples) gives the instantaneous frequency
+# of each sample, normalized to +1 for FREQ_ONE and -1 for FREQ_ZERO, together with the amplitude (envelope).
+# Their mean values over a bit-window are converted to levels comparable to the DFT levels:
+#     level_one = amplitude*(1 + frequency)/2,   level_zero = amplitude*(1 - frequency)/2
+# so a clean ONE with amplitude A gives (A, 0) and a clean ZERO gives (0, A).
+# The low-pass filter is a linear-phase FIR filter with a delay of one bit.
+FSK_DISCRIMINATOR_TAPS = 2 # in bits, the filter has FSK_DISCRIMINATOR_TAPS*DECODER_LEN_BIT_ONE + 1 taps
+
+
+class FskDiscriminator(LevelTracker):
+    def __init__(self, history_len):
+        LevelTracker.__init__(self, history_len)
+        fs = audioSettings.DECODER_SAMPLING_FREQUENCY
+        f_center = (audioSettings.CODE_SINE_FREQUENCY_ONE + audioSettings.CODE_SINE_FREQUENCY_ZERO)/2.0
+        # frequency of ONE relative to the center, used to normalize the instantaneous frequency
+        self.deviation = audioSettings.CODE_SINE_FREQUENCY_ONE - f_center
+        # mixer repeated periodically (as the basis in ToneTracker)
+        # NOTE: a center frequency with digits after the comma is rounded to the next integer to obtain the period
+        self.period = int(fs//math.gcd(int(fs), int(round(f_center))))
+        self.mixer = np.exp(-2j*np.pi*f_center*(np.arange(self.period + history_len)%self.period)/fs)
+        self.mixer_pos = 0
+        # low-pass filter, passing the baseband tones at +/- deviation and removing the images at -(FREQ + center)
+        numtaps = FSK_DISCRIMINATOR_TAPS*self.len_bit + 1
+        self.h = signal.firwin(numtaps, 2.0*abs(self.deviation), fs=fs)
+        # filter reversed (and complex as the mixed samples), each baseband sample is the product of the mixed samples ending at it with h_reversed
+        self.h_reversed = np.ascontiguousarray(self.h[::-1], dtype=complex)
+        self.delay = (numtaps - 1)//2
+        # workspace: the last numtaps - 1 mixed samples of the previous call followed by the new mixed samples (the state of the filter)
+        self.tail_len = numtaps - 1
+        self.mixed = np.zeros(self.tail_len + history_len, dtype=complex)
+        # windows of numtaps mixed samples, one ending at each new sample (a view, no copy)
+        self.windows = np.lib.stride_tricks.as_strided(self.mixed, shape=(history_len, numtaps), strides=(self.mixed.strides[0], self.mixed.strides[0]), writeable=False)
+        # the last baseband sample of the previous call followed by the new baseband samples (for the phase difference)
+        self.baseband = np.zeros(1 + history_len, dtype=complex)
+        self.product = np.zeros(history_len, dtype=complex)
+        self.phase = np.zeros(history_len)
+        # last DECODER_LEN_BIT_ONE values of frequency and amplitude of the previous call followed by the new ones (for the running sums)
+        self.values = np.zeros((self.len_bit + history_len, 2))
+        self.cumsum = np.zeros((self.len_bit + history_len, 2))
+        self.mean = np.zeros((history_len, 2))
+        self.levels_new = np.zeros((history_len, 2))
+
+    def update(self, samples):
+        nr_of_samples = len(samples)
+        # bigger blocks are processed in pieces which fit in the workspace
+        if nr_of_samples > self.history_len:
+            for i in range(0, nr_of_samples, self.history_len):
+                self.update(samples[i:i + self.history_len])
+            return
+        # mix down and low-pass filter
+        mixed = self.mixed[:self.tail_len + nr_of_samples]
+        # NOTE: real and imaginary parts separately (see ToneTracker)
+        mixer = self.mixer[self.mixer_pos:self.mixer_pos + nr_of_samples]
+        np.multiply(samples, mixer.real, out=mixed[self.tail_len:].real)
+        np.multiply(samples, mixer.imag, out=mixed[self.tail_len:].imag)
+        self.mixer_pos = (self.mixer_pos + nr_of_samples)%self.period
+        baseband = self.baseband[:1 + nr_of_samples]
+        np.matmul(self.windows[:nr_of_samples], self.h_reversed, out=baseband[1:])
+        mixed[:self.tail_len] = mixed[nr_of_samples:]
+        # quadrature discriminator: phase difference between consecutive samples = instantaneous frequency
+        product = self.product[:nr_of_samples]
+        np.conjugate(baseband[:-1], out=product)
+        np.multiply(baseband[1:], product, out=product)
+        baseband[0] = baseband[-1]
+        values = self.values[:self.len_bit + nr_of_samples]
+        phase = self.phase[:nr_of_samples]
+        np.arctan2(product.imag, product.real, out=phase)
+        np.multiply(phase, audioSettings.DECODER_SAMPLING_FREQUENCY/(2.0*np.pi*self.deviation), out=phase)
+        np.clip(phase, -1.0, 1.0, out=values[self.len_bit:, 0])
+        # NOTE: mixing a sine with amplitude A gives a baseband amplitude A/2
+        np.abs(baseband[1:], out=values[self.len_bit:, 1])
+        np.multiply(values[self.len_bit:, 1], 2.0, out=values[self.len_bit:, 1])
+        # mean values over the last DECODER_LEN_BIT_ONE samples, for each new sample
+        cumsum = self.cumsum[:self.len_bit + nr_of_samples]
+        np.cumsum(values, axis=0, out=cumsum)
+        mean = self.mean[:nr_of_samples]
+        np.subtract(cumsum[self.len_bit:], cumsum[:nr_of_samples], out=mean)
+        np.divide(mean, self.len_bit, out=mean)
+        values[:self.len_bit] = values[nr_of_samples:]
+        # level_one = amplitude*(1 + frequency)/2 and level_zero = amplitude*(1 - frequency)/2 = amplitude - level_one
+        levels = self.levels_new[:nr_of_samples]
+        np.add(mean[:, 0], 1.0, out=levels[:, 0])
+        np.multiply(levels[:, 0], mean[:, 1], out=levels[:, 0])
+        np.multiply(levels[:, 0], 0.5, out=levels[:, 0])
+        np.subtract(mean[:, 1], levels[:, 0], out=levels[:, 1])
+        self.appendLevels(levels)
+
+    def reset(self):
+        LevelTracker.reset(self)
+        self.mixed[:self.tail_len] = 0.0
+        self.baseband[0] = 0.0
+        self.values[:self.len_bit] = 0.0
+
+
+# PREAMBLE detector with adaptive threshold:
+# the noise floor of each bin is the exponential average of its level in the parts searched for a PREAMBLE,
+# with levels above the threshold limited to the threshold (censored), so a telegram does not raise the noise floor
+# but a rising noise (or voice) level is followed.
+# The threshold of each bin is CFAR_SCALE times its noise floor, which keeps the false alarm rate constant independent of the noise level,
+# FFT_DETECTION_LEVEL is only the lower limit (e.g. in silence).
+# Non-stationary signals like voice are louder than their average, so the noise floor is the greater of the average
+# and the mean level of the reference bins around the detected bin in the same part (greatest-of CFAR):
+# the PREAMBLE is a single tone, whereas voice and noise have similar levels in the neighbouring bins.
+# With PREAMBLE_CFAR = False the threshold is fixed to FFT_DETECTION_LEVEL.
+class CfarDetector():
+    # reference_bins: indexes of the reference bins in levels (if None, the bins around the detected bin in an FFT of N samples)
+    def __init__(self, nr_of_bins, reference_bins=None):
+        self.noise_floor = np.zeros(nr_of_bins)
+        self.threshold = np.full(nr_of_bins, audioSettings.FFT_DETECTION_LEVEL)
+        self.censored = np.zeros(nr_of_bins)
+        # reference bins of each detected bin
+        self.reference_bins = {}
+        self.fixed_reference_bins = reference_bins
+        # metrics: parts evaluated, triggers (start of a search for START) and false triggers (search without START found)
+        self.nr_of_parts = 0
+        self.nr_of_triggers = 0
+        self.nr_of_false_triggers = 0
+
+    # levels of all bins of a part, returns True if the level of bin_index is above its threshold
+    def detect(self, levels, bin_index):
+        self.nr_of_parts += 1
+        if not audioSettings.PREAMBLE_CFAR:
+            return levels[bin_index] > audioSettings.FFT_DETECTION_LEVEL
+        detected = levels[bin_index] > max(self.threshold[bin_index], CFAR_SCALE*self.getReferenceLevel(levels, bin_index))
+        # update noise floor and threshold of all bins
+        np.minimum(levels, self.threshold, out=self.censored)
+        self.noise_floor += CFAR_NOISE_FLOOR_ALPHA*(self.censored - self.noise_floor)
+        np.maximum(CFAR_SCALE*self.noise_floor, audioSettings.FFT_DETECTION_LEVEL, out=self.threshold)
+        return detected
+
+    # stage before detect(): returns False if the level of bin_index is not above its threshold, the part is then evaluated completely
+    # (only the noise floor of bin_index is updated), otherwise detect() shall be called with the levels of all bins
+    def precheck(self, level, bin_index):
+        if level > self.getThreshold(bin_index):
+            return True
+        self.nr_of_parts += 1
+        if audioSettings.PREAMBLE_CFAR:
+            self.noise_floor[bin_index] += CFAR_NOISE_FLOOR_ALPHA*(level - self.noise_floor[bin_index])
+            self.threshold[bin_index] = max(CFAR_SCALE*self.noise_floor[bin_index], audioSettings.FFT_DETECTION_LEVEL)
+        return False
+
+    # mean level of the reference bins in the same part
+    def getReferenceLevel(self, levels, bin_index):
+        reference_bins = self.reference_bins.get(bin_index, self.fixed_reference_bins)
+        if reference_bins is None:
+            bins = np.arange(max(bin_index - CFAR_REFERENCE_BINS, 0), min(bin_index + CFAR_REFERENCE_BINS + 1, len(levels)))
+            guard = np.zeros(len(bins), dtype=bool)
+            for code_bin in (bin_index, audioSettings.BIN_FREQUENCY_ONE, audioSettings.BIN_FREQUENCY_ZERO):
+                guard |= np.abs(bins - code_bin) <= CFAR_GUARD_BINS
+            reference_bins = bins[~guard]
+            self.reference_bins[bin_index] = reference_bins
+        if len(reference_bins) == 0:
+            return 0.0
+        return np.mean(levels[reference_bins])
+
+    def getThreshold(self, bin_index):
+        if not audioSettings.PREAMBLE_CFAR:
+            return audioSettings.FFT_DETECTION_LEVEL
+        return self.threshold[bin_index]
+
+    # false triggers per part evaluated (ideally CFAR_FALSE_ALARM_PROBABILITY)
+    def getFalseTriggerRate(self):
+        return self.nr_of_false_triggers/max(self.nr_of_parts, 1)
+
+
+# windowed ARQ (selective repeat)
+# the data of a pure ACK (COMMAND_NONE | COMMAND_TELEGRAM_ACK) contains:
+#     byte 0:   receive window, that is, nr. of telegrams we can still accept after seqNrAck (flow control)
+#     byte 1..: bitmap of the telegrams received out of order, bit i (LSB first) = seqNrAck + 2 + i
+# seqNrAck itself (cumulative ACK) is transmitted in the header.
+def encodeSelectiveAck(seqNrAck, reorder_buffer):
+    bitmap = 0
+    for seqNr in reorder_buffer:
+        bitmap |= 1 << ((seqNr - seqNrAck - 2)%255)
+    window = audioSettings.ARQ_WINDOW_SIZE - len(reorder_buffer)
+    return bytearray([window]) + bitmap.to_bytes((audioSettings.ARQ_WINDOW_SIZE + 7)//8, byteorder='little')
+
+
+# returns the receive window and the list of seqNrs acknowledged selectively
+def decodeSelectiveAck(seqNrAck, data):
+    bitmap = int.from_bytes(data[1:], byteorder='little')
+    seqNrs = [(seqNrAck + 2 + i)%255 for i in range(bitmap.bit_length()) if (bitmap >> i) & 1]
+    return data[0], seqNrs
+
+
+# frame aggregation: the data of COMMAND_AGGREGATE contains sub-messages COMMAND | DATA_SIZE | DATA,
+# returns the list of (command, data) of the sub-messages (a sub-message which exceeds the data is discarded)
+def decodeAggregate(data):
+    sub_messages = []
+    pos = 0
+    while pos + audioSettings.AGGREGATE_SUB_HEADER_LEN_BYTES <= len(data):
+        command = data[pos]
+        data_len = data[pos + audioSettings.COMMAND_LEN_BYTES]
+        pos += audioSettings.AGGREGATE_SUB_HEADER_LEN_BYTES
+        if pos + data_len > len(data):
+            logging.error("ERROR: sub-message of AGGREGATE with length = "+str(data_len)+" exceeds data, discarded")
+            break
+        sub_messages.append((command & audioSettings.COMMAND_MASK, data[pos:pos + data_len]))
+        pos += data_len
+    return sub_messages
 
 
 class AudioReceiver():
@@ -113,6 +624,8 @@ class AudioReceiver():
     receive_on_ref = None # reference to flag for half-duplex communication
     ack_received = [False, 0] # reference to flag for ACK received
     send_ack = [False] # reference to flag for send ACK
+    send_nack = [False] # reference to flag for send NACK
+    nack_received = [False, 0] # reference to flag for NACK received
     call = False
     call_accepted = False
     call_rejected = False
@@ -122,6 +635,13 @@ class AudioReceiver():
     startup_data_received = False
     comm_token = [255]
     have_token = True
+    # condition notified on communication events (e.g. ACK received or to be sent), shared with audioTransmitter and soundDeviceManager
+    comm_event = None
+    # windowed ARQ: telegrams received out of order as {seqNr: (masked_command, data)},
+    # data of the ACK to be sent and window and selective ACKs received from the other side
+    reorder_buffer = None
+    sack_to_send = [bytearray(0)]
+    sack_received = [audioSettings.ARQ_WINDOW_SIZE, []]
     # reception state
     rx_state = IDLE
     # constant definitions which depend on configuration settings
@@ -130,11 +650,6 @@ class AudioReceiver():
     BPF_F2 = audioSettings.CODE_SINE_FREQUENCY_ZERO + BPF_RIGHT_MARGIN
     BSF_F1 = audioSettings.CODE_SINE_FREQUENCY_ONE - BSF_LEFT_MARGIN
     BSF_F2 = audioSettings.CODE_SINE_FREQUENCY_ZERO + BSF_RIGHT_MARGIN
-    # constants for detection algorithm
-    BIG_SCAN_ROUNDS = 4
-    BIG_STEP = audioSettings.LEN_BIT_ONE//BIG_SCAN_ROUNDS
-    SMALL_SCAN_ROUNDS = (audioSettings.LEN_BIT_ONE//BIG_SCAN_ROUNDS)*2
-    SMALL_STEP = 1
     # state parse and decode
     parse_state = SEARCH_PREAMBLE
     decode_state = DECODE_ADDRESS
@@ -145,11 +660,11 @@ class AudioReceiver():
     # communication statistics
     telRxOk = 0
     telRxNok = 0
+    # ring buffer with audio data from RX in -> to be decoded AND to be plotted in "main loop",
+    # each reader with its own cursor (see audioRingBuffer.py)
+    rxRingBuffer = None
+    rx_overruns = 0
     # queues
-    qplot = queue.Queue() # to update matplotlib plot in "main loop"
-    # NOTE: for some reason, qin works better than using a circular buffer as we do in audioTransmitter
-    # here we don't have "bursts" of chunks that want to be put into buffer all at once as in the case of transmission
-    qin = queue.Queue() # audio data from RX in -> to be decoded AND to be forwarded to matplot over qplot
     # input messages to be read e.g. by chat in GUI
     inMessageQueue = queue.Queue() 
     inCommStatusQueue = queue.Queue()
@@ -159,6 +674,11 @@ class AudioReceiver():
     telegram_bits = None
     telegram_bits_start_pos = 0
     telegram_bits_end_pos = 0
+    # hybrid ARQ: soft bits in the same positions as telegram_bits, damaged telegrams as {(seqNr, nr_of_bits): soft bits}
+    # and flag set while decoding combined bits
+    telegram_soft_bits = None
+    harq_buffer = None
+    harq_combined = False
     # filter BAND-PASS
     # WARNING: BPF only to hear and/or plot CODE-Frequencies but NOT for decoding!
     #################################################
@@ -170,12 +690,23 @@ class AudioReceiver():
     # NOTCH filter
     sos_notch = None
     zNotch = None
-    # helper variable
+    # timing recovery: position of the next bit relative to the next part (negative = cut-bit beginning in the previous part)
+    # and correction of the nr. of samples per bit (clock mismatch)
+    next_bit_pos = 0.0
+    bit_len_correction = 0.0
+    last_bit = False
+    # helper variables: samples of the "cut-bit" at the end of the previous part (pre-allocated for a complete bit, bit_prev_len are valid)
     bit_prev = None
-    # definition and variable used to recover cut-bits between audio-chunks or parts of size N of audio-chunk
+    bit_prev_len = 0
+    # pre-allocated workspace to join the cut-bit (only needed with DETECT_USING_GROETZEL)
+    cut_bit_samples = None
+    # definition used to recover a "cut" PREAMBLE-LAST-BYTE + START marker between parts of size N:
+    # nr. of samples of the previous part which are read again together with the next part (in general the used nr. of samples will be lower)
     PREVIOUS_SAMPLES = 0
-    # samples from last round (or previous call) containing enough info to hold a complete "cut" PREAMBLE-LAST-BYTE + START marker (in general the used nr. of samples will be lower)
-    data_prev = None
+    # bit detector working sample by sample (ToneTracker or FskDiscriminator), updated with every part of size N
+    levelTracker = None
+    # samples delayed by the bit detector
+    delay_line = None
     
     @dataclass
     class StartupDataClass:
@@ -191,9 +722,13 @@ class AudioReceiver():
         data_length: int # int8
         data: bytearray # [audioSettings.DATA_MAX_LEN_BYTES]
         end: int # int8
-        checksum: int # int8 # calculated on bytes from START to last byte of DATA
+        checksum: int # XOR checksum calculated on bytes from START to last byte of DATA, or CRC calculated on bytes from START to END
         decodedDataBytes: int # int8
         seqNrRepeated: bool
+        fec: bool = False # telegram with forward error correction
+        fec_body_len: int = 0 # nr. of bytes of the coded BODY
+        frame_format: int = audioSettings.FRAME_FORMAT_XOR # frame check, given by ADDRESS
+        address_pos: int = 0 # position of ADDRESS in telegram_bits (beginning of the bytes checked with CRC)
     telegram = TelegramClass(0,0,0,0,0,bytearray(audioSettings.DATA_MAX_LEN_BYTES),0,0,0,False)
     data_part = bytearray(audioSettings.MAX_TEXT_LEN)
     part_end_idx = 0
@@ -202,6 +737,8 @@ class AudioReceiver():
         self.stream_on = glob_vars[0].stream_on
         self.ack_received = glob_vars[0].ack_received
         self.send_ack = glob_vars[0].send_ack
+        self.send_nack = glob_vars[0].send_nack
+        self.nack_received = glob_vars[0].nack_received
         self.transmit_on_ref = glob_vars[0].transmit_on_ref
         self.receive_on_ref = glob_vars[0].receive_on_ref
         self.seqNrAck = glob_vars[0].seqNrAck
@@ -210,6 +747,11 @@ class AudioReceiver():
         self.private_key = glob_vars[0].private_key
         self.cipher = glob_vars[0].cipher
         self.comm_token = glob_vars[0].comm_token
+        self.comm_event = glob_vars[0].comm_event
+        self.sack_to_send = glob_vars[0].sack_to_send
+        self.sack_received = glob_vars[0].sack_received
+        self.peer_capabilities = glob_vars[0].peer_capabilities
+        self.reorder_buffer = {}
         self.comm_token[0] = random.randint(0, 255)
         self.have_token = True # assume for now we have the token
         self.session_code = ""
@@ -217,10 +759,64 @@ class AudioReceiver():
         self.telRxOk = 0
         self.telRxNok = 0
         self.rx_state = IDLE
-        self.PREVIOUS_SAMPLES = audioSettings.START_LEN_SAMPLES + 8*audioSettings.LEN_BIT_ONE
-        self.data_prev = np.array([0.0]*(audioSettings.N + self.PREVIOUS_SAMPLES))
+        self.PREVIOUS_SAMPLES = audioSettings.DECODER_START_LEN_SAMPLES + 8*audioSettings.DECODER_LEN_BIT_ONE
+        # PREAMBLEs searched by the frame synchronizer, the short PN PREAMBLE is sent by the other side only if we announce it
+        self.sync_preambles = [b"\xFF"*audioSettings.TELEGRAM_PREAMBLE_LEN_BYTES]
+        if audioSettings.PN_PREAMBLE:
+            self.sync_preambles.append(audioSettings.PN_PREAMBLE_BYTES)
+        # RX ring buffer
+        self.rxRingBuffer = AudioRingBuffer(RX_RING_BUFFER_CHUNKS*audioSettings.AUDIO_RX_CHUNK_SAMPLES_LEN)
+        self.rxRingBuffer.addReader(READER_DECODER)
+        self.rxRingBuffer.addReader(READER_PLOTTER)
+        self.rx_overruns = 0
+        # detection method read once, the PREAMBLE detector and the bit detector are built for it
+        # (DETECT_USING_GROETZEL changed in the GUI takes effect with the next start of the receiver)
+        self.detect_using_goertzel = audioSettings.DETECT_USING_GROETZEL
+        # PREAMBLE detector on the bins of the FFT,
+        # or with Goertzel on the levels of FREQ_ONE and of the frequencies of the reference bins around it
+        if self.detect_using_goertzel:
+            bin_width = audioSettings.DECODER_SAMPLING_FREQUENCY/audioSettings.DECODER_N
+            self.preamble_frequencies = [audioSettings.CODE_SINE_FREQUENCY_ONE]
+            for k in range(CFAR_GUARD_BINS + 1, CFAR_REFERENCE_BINS + 1):
+                for frequency in (audioSettings.CODE_SINE_FREQUENCY_ONE - k*bin_width, audioSettings.CODE_SINE_FREQUENCY_ONE + k*bin_width):
+                    if (frequency > 0.0) and (abs(frequency - audioSettings.CODE_SINE_FREQUENCY_ZERO) > CFAR_GUARD_BINS*bin_width):
+                        self.preamble_frequencies.append(frequency)
+            self.preambleDetector = CfarDetector(len(self.preamble_frequencies), np.arange(1, len(self.preamble_frequencies)))
+            self.preamble_bin = 0
+            gate_frequency_one = audioSettings.CODE_SINE_FREQUENCY_ONE
+        else:
+            self.preambleDetector = CfarDetector(audioSettings.DECODER_N//2)
+            self.preamble_bin = audioSettings.BIN_FREQUENCY_ONE
+            gate_frequency_one = audioSettings.BIN_FREQUENCY_ONE*audioSettings.DECODER_SAMPLING_FREQUENCY/audioSettings.DECODER_N
+        # energy gate in front of the PREAMBLE detector on the decoded parts, and on the input parts in idle listening
+        self.gate_basis = getToneGateBasis(audioSettings.DECODER_SAMPLING_FREQUENCY, audioSettings.DECODER_N, (gate_frequency_one, audioSettings.CODE_SINE_FREQUENCY_ZERO))
+        self.idle_basis = getToneGateBasis(audioSettings.SAMPLING_FREQUENCY, audioSettings.N, (gate_frequency_one, audioSettings.CODE_SINE_FREQUENCY_ZERO))
+        self.idle_listening = False
+        self.quiet_parts = 0
+        self.previous_gate_passed = False
+        # band-select and decimation, the decoder works on the last PREVIOUS_SAMPLES + DECODER_N decimated samples
+        self.decimator = Decimator(audioSettings.N)
+        self.decoder_buffer = np.zeros(self.PREVIOUS_SAMPLES + audioSettings.DECODER_N)
+        # the bit detector keeps traces for the complete buffer passed to getStartSamplePosition()
+        if audioSettings.DETECT_USING_DISCRIMINATOR:
+            self.levelTracker = FskDiscriminator(self.PREVIOUS_SAMPLES + audioSettings.DECODER_N)
+        else:
+            self.levelTracker = ToneTracker(self.PREVIOUS_SAMPLES + audioSettings.DECODER_N)
+        self.delay_line = np.zeros(self.levelTracker.delay)
+        # pre-allocated buffers for the cut-bit
+        self.bit_prev = np.zeros(audioSettings.DECODER_LEN_BIT_ONE)
+        self.bit_prev_len = 0
+        self.cut_bit_samples = np.zeros(audioSettings.DECODER_LEN_BIT_ONE)
         # TODO: better module variable?
         self.telegram_bits = bitarray(audioSettings.TELEGRAM_MAX_LEN_BITS)
+        self.telegram_soft_bits = np.zeros(audioSettings.TELEGRAM_MAX_LEN_BITS)
+        # forward error correction of telegrams
+        self.telegramFec = TelegramFec()
+        self.fec_max_body_len = self.telegramFec.getMaxBodyLen()
+        # frame check of telegrams with CRC
+        self.crc16 = telegramCrc.getCrc16(audioSettings.TELEGRAM_MAX_LEN_BYTES)
+        self.crc32 = telegramCrc.getCrc32(audioSettings.TELEGRAM_MAX_LEN_BYTES)
+        self.harq_buffer = {}
         # filter BAND-PASS
         # WARNING: BPF only to hear and/or plot CODE-Frequencies but NOT for decoding!
         #################################################
@@ -240,7 +836,8 @@ class AudioReceiver():
         # IMPORTANT: we need this TRICK to filter audio signal "in chunks":
         self.zBandStop = np.zeros((self.sos_bandstop.shape[0], 2))
          # flag timer thread for half-duplex communication
-        receive_on_timer_thread = threading.Thread(target=self.thread_receive_on_timer,  args=(1,))
+        # NOTE: daemon, this thread never leaves its loop and shall not keep the process alive
+        receive_on_timer_thread = threading.Thread(target=self.thread_receive_on_timer,  args=(1,), daemon=True)
         receive_on_timer_thread.start()
         # NOTCH filter
         # TODO: in case "both" sides need a carrier then the frequencies need to be different, therefore we need a new definition different to CARRIER_FREQUENCY_HZ
@@ -249,45 +846,15 @@ class AudioReceiver():
         Z, P, K = signal.tf2zpk(b, a)
         self.sos_notch = signal.zpk2sos(Z, P, K)
         self.zNotch = np.zeros((self.sos_notch.shape[0], 2))
+        # un-distort voice (inverse of distort in audioTransmitter)
+        # TODO: cannot invert if we are NOT exactly synchronized with the phase of the transmitter, right?
+        self.undistortModulator = RingModulator(f0, audioSettings.SAMPLING_FREQUENCY, audioSettings.AUDIO_RX_CHUNK_SAMPLES_LEN, inverse=True)
         # start decoder thread
         decode = threading.Thread(target=self.thread_decode,  args=(1,))
         decode.start()
         # status
         self.inCommStatusQueue.put("") # ("RX:")
         
-    ################################################################
-    # TODO: cannot invert if we are NOT exactly synchronized, right? we have different starts for currSample in RX
-    #            investigate and correct this mess...use or implement something better..
-    currSample = 0
-    def undistortFunction(self,  x):
-        # need to revert: ret = x*math.sin(2 * np.pi *f0*self.currSample/audioSettings.SAMPLING_FREQUENCY)*2
-        #                                                      ret = x * sin (F * sample) * 2
-        #                        TEST3 below is ==>  ret = x / (2 * sin(F * sample))
-        #############################################################
-        # TEST1
-        #####
-        # ret= math.asin(x) * (2 * np.pi *f0*self.currSample/audioSettings.SAMPLING_FREQUENCY) * 2
-        # ret = ret/audioSettings.N
-        #####
-        # TEST2
-        #####
-        # if self.currSample == 0:
-        #     ret = 0
-        # else:
-        #     ret= math.asin(x/2) / (2 * np.pi *f0*self.currSample/audioSettings.SAMPLING_FREQUENCY)
-        # ret = ret/audioSettings.N
-        #####
-        # TEST3
-        #####
-        if math.sin(2 * np.pi *f0*self.currSample/audioSettings.SAMPLING_FREQUENCY) == 0:
-            ret = 0
-        else:
-            ret = x / (2*math.sin(2 * np.pi *f0*self.currSample/audioSettings.SAMPLING_FREQUENCY))
-        self.currSample += 1
-        return ret
-    undistort = np.vectorize(undistortFunction, otypes=[float])
-    ##############################################################
-    
     def callback_wire_in(self,  indata, outdata, frames, time, status):
         # store time between callbacks in ms
         self.avg_rx_time_ms = (float(time.currentTime) - self.time_old)*1000.0
@@ -303,7 +870,7 @@ class AudioReceiver():
             ############
             # UN-DISTORT voice
             # if configuration.IN_RX_UNDISTORT:
-            #    outdata[:frames, audioSettings.DEFAULT_CHANNEL] = self.undistort(self, indata[:frames, audioSettings.DEFAULT_CHANNEL])
+            #    self.undistortModulator.process(indata[:frames, audioSettings.DEFAULT_CHANNEL], outdata[:frames, audioSettings.DEFAULT_CHANNEL])
                 # RX in -> BAND_STOP -> Voice
             #    outdata[:, audioSettings.DEFAULT_CHANNEL], self.zBandStop = signal.sosfilt(self.sos_bandstop, outdata[:, audioSettings.DEFAULT_CHANNEL], zi=self.zBandStop)
             # else:
@@ -318,7 +885,7 @@ class AudioReceiver():
                 outdata[:, audioSettings.DEFAULT_CHANNEL], self.zNotch = signal.sosfilt(self.sos_notch, outdata[:, audioSettings.DEFAULT_CHANNEL], zi=self.zNotch)
             # UN-DISTORT voice
             if configuration.IN_RX_UNDISTORT:
-                outdata[:frames, audioSettings.DEFAULT_CHANNEL] = self.undistort(self, outdata[:frames, audioSettings.DEFAULT_CHANNEL])
+                self.undistortModulator.process(outdata[:frames, audioSettings.DEFAULT_CHANNEL], outdata[:frames, audioSettings.DEFAULT_CHANNEL])
         else:
             # filter coding-range (remove left and right frequencies with Voice content)
             # RX in -> BAND_PASS -> Code
@@ -326,8 +893,8 @@ class AudioReceiver():
         # pass input audio to decoder
         ################
         ### if self.transmit_on_ref[0] == False: # half-duplex communication
-        # this is a BLOCKING call
-        self.qin.put(indata[:, audioSettings.DEFAULT_CHANNEL])
+        # NON-blocking, samples are copied into the preallocated ring buffer
+        self.rxRingBuffer.write(indata[:, audioSettings.DEFAULT_CHANNEL])
            
     def callback_rx_in(self,  indata, frames, time, status):
         # TODO: BUT: time is always zero, why? HW-Bug???
@@ -340,262 +907,190 @@ class AudioReceiver():
         # pass input audio to decoder
         ################
         ### if self.transmit_on_ref[0] == False: # half-duplex communication
-        # this is a BLOCKING call
-        self.qin.put(indata[:, audioSettings.DEFAULT_CHANNEL])
+        # NON-blocking, samples are copied into the preallocated ring buffer
+        self.rxRingBuffer.write(indata[:, audioSettings.DEFAULT_CHANNEL])
     
+    # Frame synchronizer:
+    # correlate the buffer against the known waveform of the last PREAMBLE byte followed by START (see getSyncTemplate()),
+    # using FFT convolution, which gives us the correlation for ALL sample offsets at once.
+    # With PN_PREAMBLE the buffer is correlated against both templates (long and short PREAMBLE), the best match is taken.
+    # The correlation is normalized with the energy of the buffer in each window, so the quality is in [-1, 1],
+    # with 1 meaning a perfect match independent of the received volume.
+    # Windows with a level below FFT_DETECTION_LEVEL are not considered (e.g. silence with small noise, which may correlate by chance).
+    # Return value: (startSamplePosition, quality, preamble), where startSamplePosition is the sample where START begins,
+    # or -1 if no window could be evaluated, and preamble the PREAMBLE of the best template.
+    def synchronizeFrame(self, sample_buffer):
+        best_position = -1
+        best_quality = 0.0
+        best_preamble = None
+        for preamble in self.sync_preambles:
+            template = getSyncTemplate(self.sos_bandpass, preamble, self.detect_using_goertzel)
+            len_template = len(template)
+            if len(sample_buffer) < len_template:
+                return -1, 0.0, None
+            # energy of each window
+            energy_cumsum = np.concatenate(([0.0], np.cumsum(np.square(sample_buffer, dtype=np.float64))))
+            energy = energy_cumsum[len_template:] - energy_cumsum[:-len_template]
+            # NOTE: a sine with amplitude A has energy (A**2)/2 per sample
+            min_energy = len_template*(audioSettings.FFT_DETECTION_LEVEL**2)/2.0
+            # energy gate: no correlation needed if no window is strong enough
+            if np.max(energy) <= min_energy:
+                continue
+            # correlation for each window beginning at sample i (= convolution with reversed template)
+            correlation = signal.fftconvolve(sample_buffer, template[::-1], mode='valid')
+            quality = np.where(energy > min_energy, correlation/np.sqrt(np.maximum(energy, min_energy)*np.dot(template, template)), -1.0)
+            best = int(np.argmax(quality))
+            if (quality[best] != -1.0) and ((best_position < 0) or (quality[best] > best_quality)):
+                best_position = best + 8*audioSettings.DECODER_LEN_BIT_ONE
+                best_quality = float(quality[best])
+                best_preamble = preamble
+        return best_position, best_quality, best_preamble
+
+    # levels of FREQ_ONE and FREQ_ZERO of nr_of_bits consecutive bits beginning at sample start of sample_buffer,
+    # which shall end with the last part passed to the bit detector.
+    def bitLevels(self, sample_buffer, start, nr_of_bits):
+        if self.detect_using_goertzel:
+            return demodulateBits(sample_buffer, start, nr_of_bits, True)
+        return self.levelTracker.levels(len(sample_buffer), start, nr_of_bits)
+
+    # search the position with the best worst-case gap between ONE and ZERO in the bits of START,
+    # within +/- SYNC_REFINE_SAMPLES around startSamplePosition.
+    # The gaps of all candidate positions are taken from the traces of the bit detector, no new DFTs are calculated.
+    def refineStartSamplePosition(self, buffer_len, startSamplePosition):
+        nr_of_bits = audioSettings.START_LEN_BYTES*8
+        # START shall completely fit in the buffer
+        last_offset = min(SYNC_REFINE_SAMPLES, buffer_len - startSamplePosition - nr_of_bits*audioSettings.DECODER_LEN_BIT_ONE)
+        offsets = np.arange(-SYNC_REFINE_SAMPLES, last_offset + 1)
+        if len(offsets) == 0:
+            return startSamplePosition
+        positions = startSamplePosition + offsets[:, np.newaxis] + audioSettings.DECODER_LEN_BIT_ONE*np.arange(nr_of_bits)
+        level_one, level_zero = self.levelTracker.levelsAt(buffer_len, positions)
+        min_gaps = np.min(np.abs(level_one - level_zero), axis=1)
+        return startSamplePosition + int(offsets[np.argmax(min_gaps)])
+
     # If START is correctly detected, then
     # return sample position of field START (*** WARNING: this is RELATIVE to argument sample_buffer but the caller may pass another buffer with a different buffer offset !!!).
     # If available, telegram contents starting and including ADDRESS,etc. are already copied to permanent bitarray buffer.
     # NOTE: the algorithm is:
-    #            rough-scan to detect "best" bit-gap in marker = START, coding with threshold between FFT(one) and FFT(zero), but first we find marker = last-PREAMBLE-byte followed by START
-    #            fine-scan to detect START at approx. position found in rough-scan (moving left to right), considering best result given by "maximum minimum gap" between FFT(one) and FFT(zero) in any START-bit.
-    #            Markers (PRE+START for rough scan and START for fine scan) shall be checked every time, otherwise we may be considering good gaps which belong to shifted and incorrect samples!
-    #            Note that all bits in buffer will only be used in the especial case where START is found at fine-scan-step == 0, otherwise we always discard the last bit, because due to the offset it is "cut".
-    #            In that case we will have some rest_samples which will be joined togeher with samples input to putInBitArrayBuffer() in the following call, in order to restore the "cut-bit".
-    '''
-        Example with bit-width = 40 samples
-                          rough-scan-step = 10
-                          fine-scan-step = 1
-                          
-                 ---------------------
-                |      |      |      |      |
-                 ---------------------
-                       10    20    30           (3 rough steps,
-                                                     best found in 30)
-                              ^             ^
-                              |              |
-                               \________/
-                                    (20 fine scans around 30,
-                                    between 20 and 40,
-                                    best found in 33)
-    # '''
+    #            synchronizeFrame() finds the sample-accurate position of last-PREAMBLE-byte followed by START with a single correlation.
+    #            A poor correlation quality (e.g. START cut at the end of the buffer, where the marker matches only partially with the PREAMBLE) is discarded.
+    #            The bits of START are then demodulated and checked, otherwise we may be considering a shifted and incorrect position.
+    #            Note that all bits in buffer will only be used in the especial case where the last bit finishes exactly at the end of the buffer,
+    #            otherwise we have some rest_samples which will be joined togeher with samples input to putInBitArrayBuffer() in the following call, in order to restore the "cut-bit".
     ################################################################################################################
-    def getStartSamplePosition(self, sample_buffer):
-        # return value (default is error)
-        startSamplePosition = -1 
-        # gap variables
-        max_min_rough_gap = 0
-        startSamplePositionRough = 0
-        # bit array
-        # we subtract one bit because in 39 out of 40 cases we will always have an offset and therefore have a cut-bit which needs to be discarded
-        # in the case where offset = 0, that is, where PRE+START are found at sample zero, we shall consider the last bit again
-        # but that is no longer relevant for bits[] becuase in that case what matters is tel_bits[], and its bits are re-calculated based e.g. on len(sample_buffer),
-        # therefore, not losing any bit.
-        NR_OF_BITS = int(len(sample_buffer)/audioSettings.LEN_BIT_ONE) - 1
-        # TODO: pre-allocate memory and set to zero here if necessary
-        bits = bitarray(NR_OF_BITS)
-        # search marker = last PREAMBLE byte followed by START in rough scan over complete buffer
-        # PRE+START shall be detectable already in at least one of these "rough" steps
-        ############################################
-        for offset in range(self.BIG_STEP, self.BIG_SCAN_ROUNDS*self.BIG_STEP, self.BIG_STEP):
-            logging.debug("Rough scan on PRE+START with offset = " + str(offset) + " on nr. of bits = " + str(NR_OF_BITS))
-            # scan complete bit-stream with offset (rough scan)
-            # coding criteria: maximum of FFT(FREQ_ONE) and FFT(FREQ_ZERO)
-            #########################################
-            for i in range(NR_OF_BITS):
-                ffty = rfft(sample_buffer[offset + i*audioSettings.LEN_BIT_ONE:offset + (i+1)*audioSettings.LEN_BIT_ONE])
-                absfft = 2.0 * abs(ffty[:audioSettings.LEN_BIT_ONE//2])/audioSettings.LEN_BIT_ONE
-                # code bit according to FFT threshold
-                if absfft[audioSettings.BIN_FREQUENCY_ONE_FINE] > absfft[audioSettings.BIN_FREQUENCY_ZERO_FINE]:
-                    bits[i] = True
-                else:
-                    bits[i] = False
-            logging.debug("Bit stream in buffer with offset = " + str(offset))
-            logging.debug(bits)
-            # search start of frame by detecting pattern/marker in bits = last PREAMBLE-byte followed by START
-            iter = bits.itersearch(LAST_PREAMBLE_BYTE_AND_START_BITS)
-            startPosition = -1
-            for markerPosition in iter:
-                startPosition = markerPosition + 8 # +8 because we also searched for last byte of preamble..
-             # found PRE+START in complete bit-stream?
-             #########################
-            if startPosition != -1:
-                # translate startPosition to absolute samples coordinate system:
-                startSamplePositionRoughTemp = startPosition*audioSettings.LEN_BIT_ONE + offset
-                min_rough_gap = 999999
-                # TODO: average all gaps instead?
-                # determine GAPs of START considering offset (rough step)
-                ##################################
-                for i in range(audioSettings.START_LEN_BYTES*8):
-                    ffty = rfft(sample_buffer[startSamplePositionRoughTemp + i*audioSettings.LEN_BIT_ONE:startSamplePositionRoughTemp + (i + 1)*audioSettings.LEN_BIT_ONE])
-                    absfft = 2.0 * abs(ffty[:audioSettings.LEN_BIT_ONE//2])/audioSettings.LEN_BIT_ONE
-                    diff_rough = abs(absfft[audioSettings.BIN_FREQUENCY_ONE_FINE] - absfft[audioSettings.BIN_FREQUENCY_ZERO_FINE])
-                    # we search for minimum gap between ONE and ZERO in each of the bits in START
-                    if diff_rough < min_rough_gap:
-                        min_rough_gap = diff_rough
-                # we search for maximum min_gap in BIG_SCAN_ROUNDS
-                if min_rough_gap > max_min_rough_gap:
-                        max_min_rough_gap = min_rough_gap
-                        startSamplePositionRough = startSamplePositionRoughTemp
-            # found best PRE+START in rough scan?
-            ######################
-            if (offset == (self.BIG_SCAN_ROUNDS - 1)*self.BIG_STEP):
-                if max_min_rough_gap != 0:
-                    logging.debug("Best START at best worst-case rough_gap = " + str(max_min_rough_gap))
-                    logging.debug("               startSamplePositionRough = " + str(startSamplePositionRough))
-                    # gap
-                    max_min_gap = 0
-                    diff = 0
-                    # bitarray
-                    # TODO: pre-allocate memory instead..
-                    bits_start = bitarray(audioSettings.START_LEN_BYTES*8)
-                    # fine scan on detected START with an accuracy given by SMALL_SCAN_ROUNDS
-                    # we scan left and right of startSamplePositionRough.
-                    # (from here onwards we don't care about PREAMBLE anymore)
-                    for m in range(startSamplePositionRough - self.SMALL_SCAN_ROUNDS//2, startSamplePositionRough + self.SMALL_SCAN_ROUNDS//2, self.SMALL_STEP):
-                        min_gap = 999999
-                        # TODO: average all gaps instead?
-                        # fine scan bits of START considerung:
-                        # offset (rough step) and m (small step)
-                        # coding criteria: maximum of minimum gaps between FFT(FREQ_ONE) and FFT(FREQ_ZERO)
-                        #####################################################
-                        for i in range(audioSettings.START_LEN_BYTES*8):
-                            ffty = rfft(sample_buffer[m + i*audioSettings.LEN_BIT_ONE:m + (i + 1)*audioSettings.LEN_BIT_ONE])
-                            absfft = 2.0 * abs(ffty[:audioSettings.LEN_BIT_ONE//2])/audioSettings.LEN_BIT_ONE
-                            # code bit according to FFT threshold
-                            if absfft[audioSettings.BIN_FREQUENCY_ONE_FINE] > absfft[audioSettings.BIN_FREQUENCY_ZERO_FINE]:
-                                bits_start[i] = True
-                            else:
-                                bits_start[i] = False
-                            # gaps
-                            diff = abs(absfft[audioSettings.BIN_FREQUENCY_ONE_FINE] - absfft[audioSettings.BIN_FREQUENCY_ZERO_FINE])
-                            # we search for minimum gap between ONE and ZERO in each of the bits in START
-                            if diff < min_gap:
-                                min_gap = diff
-                        logging.debug("Bit stream in approx. START with fine scan step sample = " + str(m))
-                        logging.debug(bits_start)
-                        # search start of frame by detecting pattern/marker in bits = last PREAMBLE-byte followed by START
-                        iter = bits_start.itersearch(START_BITS)
-                        startPosition = -1
-                        for markerPosition in iter:
-                            startPosition = markerPosition
-                        # found START marker?
-                        if startPosition == 0:
-                            # we search for maximum min_gap in SMALL_SCAN_ROUNDS
-                            if min_gap > max_min_gap:
-                                max_min_gap = min_gap
-                                # return value
-                                startSamplePosition = m
-                        # found best START in fine scan?
-                        ###################
-                        if m == startSamplePositionRough + self.SMALL_SCAN_ROUNDS//2 - self.SMALL_STEP:
-                            if max_min_gap != 0:
-                                # update RX volume for visualization
-                                # RX volume based on signal coding START which contains both ones and zeros in the same amount
-                                self.updateRxVolume(sample_buffer[startSamplePosition:startSamplePosition + audioSettings.START_LEN_SAMPLES])
-                                # log
-                                logging.debug("Best START at best worst-case fine gap = " + str(max_min_gap))
-                                logging.debug("               bit start position fine = " + str(startPosition))
-                                logging.debug("              startSamplePosition fine = " + str(startSamplePosition))
-                                # calculate telegram bits using best result, beginning with ADDRESS
-                                #######################################
-                                sample_pos_address = startSamplePosition + audioSettings.START_LEN_SAMPLES
-                                #######################################
-                                #######################################
-                                # WORKAROUND: we need to add 3 to sample_pos_address
-                                # TODO: find out why we need this
-                                # TODO: find out if we are losing/discarding the last bit in the stream (?)
-                                sample_pos_address = sample_pos_address + 3
-                                #######################################
-                                #######################################
-                                # final values
-                                ########
-                                rest_samples = (len(sample_buffer) - sample_pos_address)%audioSettings.LEN_BIT_ONE
-                                BITS_FROM_ADDRESS = (len(sample_buffer) - sample_pos_address - rest_samples)//audioSettings.LEN_BIT_ONE
-                                ########################################################
-                                # WORKAROND not working: sometimes we obtain BITS_FROM_ADDRESS = -1 so we set it to zero in such case
-                                # TODO: see why this happens
-                                if BITS_FROM_ADDRESS < 0:
-                                    logging.error("ERROR: BITS_FROM_ADDRESS = " + str(BITS_FROM_ADDRESS)) #  + ", we set it to zero.")
-                                    ### BITS_FROM_ADDRESS = 0
-                                    #######
-                                    return -1
-                                    #######
-                                ########################################################
-                                logging.debug("sample_pos_address = "+str(sample_pos_address))
-                                logging.debug("nr. of rest samples = "+str(rest_samples))
-                                logging.debug("BITS_FROM_ADDRESS = "+str(BITS_FROM_ADDRESS))
-                                # allocate memory for tel_bits
-                                # TODO: pre-allocate fix-memory instead and set to zero here if necessary
-                                tel_bits = bitarray(BITS_FROM_ADDRESS)
-                                # final scan with BEST found position
-                                for i in range(BITS_FROM_ADDRESS):
-                                    ffty = rfft(sample_buffer[sample_pos_address + i*audioSettings.LEN_BIT_ONE:sample_pos_address + (i+1)*audioSettings.LEN_BIT_ONE])
-                                    absfft = 2.0 * abs(ffty[:audioSettings.LEN_BIT_ONE//2])/audioSettings.LEN_BIT_ONE
-                                    # code bit according to FFT threshold
-                                    if absfft[audioSettings.BIN_FREQUENCY_ONE_FINE] > absfft[audioSettings.BIN_FREQUENCY_ZERO_FINE]:
-                                        # now that we stopped scanning with offsets which may lead to insufficient signal-levels we need to check if we actually have a strong enough signal
-                                        if absfft[audioSettings.BIN_FREQUENCY_ONE_FINE] > audioSettings.FFT_DETECTION_LEVEL:
-                                            tel_bits[i] = True
-                                        else:
-                                            logging.error("ERROR: START not found, bit ONE too weak with level = " + str(absfft[audioSettings.BIN_FREQUENCY_ONE_FINE]))
-                                            # return with error
-                                            return -1
-                                    else:
-                                        # now that we stopped scanning with offsets which may lead to insufficient signal-levels we need to check if we actually have a strong enough signal
-                                        if absfft[audioSettings.BIN_FREQUENCY_ZERO_FINE] > audioSettings.FFT_DETECTION_LEVEL:
-                                            tel_bits[i] = False
-                                        else:
-                                            logging.error("ERROR: START not found, bit ZERO too weak with level = " + str(absfft[audioSettings.BIN_FREQUENCY_ZERO_FINE]))
-                                            # return with error
-                                            return -1
-                                # init variable
-                                self.telegram.decodedDataBytes = 0
-                                # store bits of telegram part
-                                self.telegram_bits_start_pos = 0
-                                self.telegram_bits_end_pos = BITS_FROM_ADDRESS # which is = len(tel_bits)
-                                self.telegram_bits[self.telegram_bits_start_pos:self.telegram_bits_end_pos] = tel_bits[:]
-                                # store last samples
-                                '''
-                                    If fine_step is NOT zero, then we definitely have a "cut-bit" at the end of the buffer.
-                                    Example of a ZERO cut-bit:
-
-                                    rest_samples (17)   first_samples (23)
-
-                                     |   _---_         |  _---_             |
-                                     |  /       \        | /       \            |
-                                     | /         \        /          \         /|
-                                     |             \_  _/            \_    _/ |
-                                     |                -  |               -.-    |
-                                # '''
-                                # TODO: avoid this memory allocation and set to zero here if necessary
-                                self.bit_prev = np.array([0.0]*(rest_samples))
-                                self.bit_prev[0:rest_samples] = sample_buffer[len(sample_buffer) - rest_samples:]
-                                logging.debug("telegram_bits:")
-                                logging.debug(self.telegram_bits[self.telegram_bits_start_pos:self.telegram_bits_end_pos])
-                                # START detected successfully!
-                                # set half-duplex flag
-                                if self.receive_on_ref[0]==False:
-                                    self.receive_on_timer_event.set()
-                            else:
-                                logging.error("ERROR: START not found in fine scan.")
-                else:
-                    logging.error("ERROR: START not found in rough scan.")
+    def getStartSamplePosition(self, sample_buffer, sync=None, min_quality=SYNC_MIN_QUALITY):
+        # sync = result of synchronizeFrame() if already calculated
+        if sync is None:
+            sync = self.synchronizeFrame(sample_buffer)
+        startSamplePosition, quality, preamble = sync
+        logging.debug("Frame synchronization at sample " + str(startSamplePosition) + " with quality = " + str(quality))
+        if startSamplePosition < 0:
+            logging.error("ERROR: START not found, signal too weak.")
+            return -1
+        if quality < min_quality:
+            logging.error("ERROR: START not found, correlation quality = " + str(quality))
+            return -1
+        # fine timing around the correlation peak (argmax on the traces of the bit detector)
+        if not self.detect_using_goertzel:
+            startSamplePosition = self.refineStartSamplePosition(len(sample_buffer), startSamplePosition)
+        # check bits of START at found position
+        level_one, level_zero = self.bitLevels(sample_buffer, startSamplePosition, audioSettings.START_LEN_BYTES*8)
+        bits_start = levelsToBits(level_one, level_zero)
+        logging.debug("Bit stream in START:")
+        logging.debug(bits_start)
+        if bits_start != START_BITS:
+            logging.error("ERROR: START not found, bits = " + str(bits_start))
+            return -1
+        # the short PN PREAMBLE is checked as well (the bits inside the buffer)
+        if preamble == audioSettings.PN_PREAMBLE_BYTES:
+            nr_of_bits = min(len(PN_PREAMBLE_BITS), startSamplePosition//audioSettings.DECODER_LEN_BIT_ONE)
+            level_one, level_zero = self.bitLevels(sample_buffer, startSamplePosition - nr_of_bits*audioSettings.DECODER_LEN_BIT_ONE, nr_of_bits)
+            bits_preamble = levelsToBits(level_one, level_zero)
+            if bits_preamble != PN_PREAMBLE_BITS[len(PN_PREAMBLE_BITS) - nr_of_bits:]:
+                logging.error("ERROR: START not found, bits of PN PREAMBLE = " + str(bits_preamble))
+                return -1
+        # update RX volume for visualization
+        # RX volume based on signal coding START which contains both ones and zeros in the same amount
+        self.updateRxVolume(sample_buffer[startSamplePosition:startSamplePosition + audioSettings.DECODER_START_LEN_SAMPLES])
+        # calculate telegram bits using found position, beginning with ADDRESS
+        #######################################
+        sample_pos_address = startSamplePosition + audioSettings.DECODER_START_LEN_SAMPLES
+        # final values
+        ########
+        rest_samples = (len(sample_buffer) - sample_pos_address)%audioSettings.DECODER_LEN_BIT_ONE
+        BITS_FROM_ADDRESS = (len(sample_buffer) - sample_pos_address - rest_samples)//audioSettings.DECODER_LEN_BIT_ONE
+        logging.debug("sample_pos_address = "+str(sample_pos_address))
+        logging.debug("nr. of rest samples = "+str(rest_samples))
+        logging.debug("BITS_FROM_ADDRESS = "+str(BITS_FROM_ADDRESS))
+        # final scan with found position (all bits in one batch)
+        level_one, level_zero = self.bitLevels(sample_buffer, sample_pos_address, BITS_FROM_ADDRESS)
+        # we need to check if we actually have a strong enough signal
+        level_bit = np.maximum(level_one, level_zero)
+        weak_bits = np.flatnonzero(level_bit <= audioSettings.FFT_DETECTION_LEVEL)
+        if len(weak_bits) > 0:
+            if level_one[weak_bits[0]] > level_zero[weak_bits[0]]:
+                logging.error("ERROR: START not found, bit ONE too weak with level = " + str(level_bit[weak_bits[0]]))
+            else:
+                logging.error("ERROR: START not found, bit ZERO too weak with level = " + str(level_bit[weak_bits[0]]))
+            # return with error
+            return -1
+        tel_bits = levelsToBits(level_one, level_zero)
+        # init variable
+        self.telegram.decodedDataBytes = 0
+        self.telegram.fec = False
+        self.harq_combined = False
+        # store bits of telegram part
+        self.telegram_bits_start_pos = 0
+        self.telegram_bits_end_pos = 0
+        self.appendSoftBits(level_one, level_zero)
+        self.telegram_bits_end_pos = BITS_FROM_ADDRESS # which is = len(tel_bits)
+        self.telegram_bits[self.telegram_bits_start_pos:self.telegram_bits_end_pos] = tel_bits[:]
+        # store last samples
+        '''
+            If rest_samples is NOT zero, then we definitely have a "cut-bit" at the end of the buffer.
+            Example of a ZERO cut-bit:
+
+            rest_samples (17)   first_samples (23)
+
+             |   _---_         |  _---_             |
+             |  /       \        | /       \            |
+             | /         \        /          \         /|
+             |             \_  _/            \_    _/ |
+             |                -  |               -.-    |
+        # '''
+        self.storeCutBit(sample_buffer, rest_samples)
+        # new frame, timing recovery starts without correction of the bit length
+        self.bit_len_correction = 0.0
+        self.last_bit = bool(tel_bits[-1]) if len(tel_bits) > 0 else START_BITS[-1]
+        logging.debug("telegram_bits:")
+        logging.debug(self.telegram_bits[self.telegram_bits_start_pos:self.telegram_bits_end_pos])
+        # START detected successfully!
+        # set half-duplex flag
+        if self.receive_on_ref[0]==False:
+            self.receive_on_timer_event.set()
         # return of getStartSamplePosition()
         return startSamplePosition
         
     def putInBitArrayBuffer(self, sample_buffer):
-        # calculate telegram bits using offset determined by len(self.bit_prev)  (previous rest_samples)
-        startSamplePosition = audioSettings.LEN_BIT_ONE - len(self.bit_prev)
-        rest_samples = (len(sample_buffer) - startSamplePosition)%audioSettings.LEN_BIT_ONE
-        BITS_FROM_TEL_PART = (len(sample_buffer) - startSamplePosition - rest_samples)//audioSettings.LEN_BIT_ONE
-        tel_bits = bitarray(BITS_FROM_TEL_PART)
+        # with the bit detectors working sample by sample we have timing recovery
+        if not self.detect_using_goertzel:
+            self.putInBitArrayBufferWithTimingRecovery(sample_buffer)
+            return
+        # calculate telegram bits using offset determined by self.bit_prev_len  (previous rest_samples)
+        startSamplePosition = audioSettings.DECODER_LEN_BIT_ONE - self.bit_prev_len
+        rest_samples = (len(sample_buffer) - startSamplePosition)%audioSettings.DECODER_LEN_BIT_ONE
+        BITS_FROM_TEL_PART = (len(sample_buffer) - startSamplePosition - rest_samples)//audioSettings.DECODER_LEN_BIT_ONE
         logging.debug("*** putInBitArrayBuffer():")
         logging.debug("startSamplePosition = "+str(startSamplePosition))
         logging.debug("nr. of rest samples = "+str(rest_samples))
         logging.debug("BITS_FROM_TEL_PART = "+str(BITS_FROM_TEL_PART))
-        # scan with found position
-        for i in range(BITS_FROM_TEL_PART):
-            ffty = rfft(sample_buffer[startSamplePosition + i*audioSettings.LEN_BIT_ONE:startSamplePosition + (i+1)*audioSettings.LEN_BIT_ONE])
-            absfft = 2.0 * abs(ffty[:audioSettings.LEN_BIT_ONE//2])/audioSettings.LEN_BIT_ONE
-            # code bit according to FFT threshold
-            # TODO: if we knew that this is a valid bit inside a "telegram-byte" we shall always check if we have a strong enough signal using FFT_DETECTION_LEVEL.
-            #            Because we don't have that information (we should NOT have it at this "abstraction level"?) then we don't check that.
-            #            We may have some "noise" after the telegram, which is also decoded...just to be discarded by the telegram-decoder afterwards.
-            if absfft[audioSettings.BIN_FREQUENCY_ONE_FINE] > absfft[audioSettings.BIN_FREQUENCY_ZERO_FINE]:
-                tel_bits[i] = True
-            else:
-                tel_bits[i] = False
+        # scan with found position (all bits in one batch)
+        bit_level_one, bit_level_zero = self.bitLevels(sample_buffer, startSamplePosition, BITS_FROM_TEL_PART)
+        # code bit according to FFT threshold
+        # TODO: if we knew that this is a valid bit inside a "telegram-byte" we shall always check if we have a strong enough signal using FFT_DETECTION_LEVEL.
+        #            Because we don't have that information (we should NOT have it at this "abstraction level"?) then we don't check that.
+        #            We may have some "noise" after the telegram, which is also decoded...just to be discarded by the telegram-decoder afterwards.
+        tel_bits = levelsToBits(bit_level_one, bit_level_zero)
         # management of cut-bits
         ##############
         '''
@@ -612,44 +1107,243 @@ class AudioReceiver():
         # '''
         # recover cut-bit
         ##########
-        if startSamplePosition > 0: # this is the same as: if len(self.bit_prev) > 0:
-            complete_bit_samples = np.append(self.bit_prev, sample_buffer[:startSamplePosition])
-            ffty = rfft(complete_bit_samples)
-            absfft = 2.0 * abs(ffty[:audioSettings.LEN_BIT_ONE//2])/audioSettings.LEN_BIT_ONE
+        if startSamplePosition > 0: # this is the same as: if self.bit_prev_len > 0:
+            # join the cut-bit in the pre-allocated workspace
+            self.cut_bit_samples[:self.bit_prev_len] = self.bit_prev[:self.bit_prev_len]
+            self.cut_bit_samples[self.bit_prev_len:] = sample_buffer[:startSamplePosition]
+            level_one, level_zero = demodulateBits(self.cut_bit_samples, 0, 1, True)
             # code bit according to FFT threshold
-            bit = False
-            if absfft[audioSettings.BIN_FREQUENCY_ONE_FINE] > absfft[audioSettings.BIN_FREQUENCY_ZERO_FINE]:
-                bit = True
+            bit = bool(level_one[0] > level_zero[0])
             logging.debug("cut-bit:")
             logging.debug(bit)
             # copy cut-bit to telegram_bits
             ##################
+            self.appendSoftBits(level_one, level_zero)
             self.telegram_bits[self.telegram_bits_end_pos:self.telegram_bits_end_pos+1] = bit
             self.telegram_bits_end_pos += 1
         # now add tel_bits to telegram_bits
         #####################
+        self.appendSoftBits(bit_level_one, bit_level_zero)
         self.telegram_bits[self.telegram_bits_end_pos:self.telegram_bits_end_pos+len(tel_bits)] = tel_bits[:]
         self.telegram_bits_end_pos += len(tel_bits)
         # store rest samples
         ############
-        # TODO: avoid this memory allocation and set to zero instead if required
-        self.bit_prev = np.array([0.0]*(rest_samples))
-        self.bit_prev[0:rest_samples] = sample_buffer[len(sample_buffer) - rest_samples:]
+        self.storeCutBit(sample_buffer, rest_samples)
         logging.debug("telegram_bits including cut-bit and next part:")
         logging.debug(self.telegram_bits[self.telegram_bits_start_pos:self.telegram_bits_end_pos])
         
+    # bit positions are not restricted to whole samples nor to multiples of DECODER_LEN_BIT_ONE,
+    # the levels are interpolated on the traces of the bit detector (a cut-bit is simply a bit beginning at a negative position)
+    def putInBitArrayBufferWithTimingRecovery(self, sample_buffer):
+        buffer_len = len(sample_buffer)
+        len_bit = audioSettings.DECODER_LEN_BIT_ONE
+        half_bit = len_bit/2.0
+        max_correction = TIMING_RECOVERY_MAX_MISMATCH*len_bit
+        # offsets of the window between the previous bit and this bit, and of the window of this bit
+        offsets = np.array([-half_bit, 0.0])
+        bit_values = []
+        soft_values = []
+        soft_zero_values = []
+        pos = self.next_bit_pos
+        # bits which end inside the buffer
+        while pos <= buffer_len - len_bit:
+            level_one, level_zero = self.levelTracker.levelsAtFraction(buffer_len, pos + offsets)
+            bit = bool(level_one[1] > level_zero[1])
+            # timing error at transitions (if we have a signal)
+            timing_error = 0.0
+            if (bit != self.last_bit) and (level_one[0] + level_zero[0] > audioSettings.FFT_DETECTION_LEVEL):
+                # soft value of window between bits, > 0 = more ONE than ZERO
+                soft_value = (level_one[0] - level_zero[0])/(level_one[0] + level_zero[0])
+                # e.g. previous bit ONE and this bit ZERO: too much ONE means we are too early, that is, a positive error
+                if self.last_bit:
+                    timing_error = soft_value
+                else:
+                    timing_error = -soft_value
+            # loop filter
+            self.bit_len_correction = min(max(self.bit_len_correction + TIMING_RECOVERY_KI*half_bit*timing_error, -max_correction), max_correction)
+            pos += len_bit + self.bit_len_correction + TIMING_RECOVERY_KP*half_bit*timing_error
+            bit_values.append(bit)
+            soft_values.append(level_one[1])
+            soft_zero_values.append(level_zero[1])
+            self.last_bit = bit
+        self.next_bit_pos = pos - buffer_len
+        tel_bits = bitarray(bit_values)
+        logging.debug("*** putInBitArrayBufferWithTimingRecovery():")
+        logging.debug("next bit position = "+str(self.next_bit_pos)+", bit length correction = "+str(self.bit_len_correction))
+        # add tel_bits to telegram_bits
+        #####################
+        self.appendSoftBits(np.array(soft_values), np.array(soft_zero_values))
+        self.telegram_bits[self.telegram_bits_end_pos:self.telegram_bits_end_pos+len(tel_bits)] = tel_bits[:]
+        self.telegram_bits_end_pos += len(tel_bits)
+        logging.debug("telegram_bits including next part:")
+        logging.debug(self.telegram_bits[self.telegram_bits_start_pos:self.telegram_bits_end_pos])
+        
+    # store the soft bits (ONE - ZERO)/(ONE + ZERO) of the bits to be appended at telegram_bits_end_pos
+    # NOTE: bits after the longest telegram are not needed (they will not be combined) and are not stored
+    def appendSoftBits(self, level_one, level_zero):
+        nr_of_bits = min(len(level_one), len(self.telegram_soft_bits) - self.telegram_bits_end_pos)
+        if nr_of_bits > 0:
+            level_one = level_one[:nr_of_bits]
+            level_zero = level_zero[:nr_of_bits]
+            self.telegram_soft_bits[self.telegram_bits_end_pos:self.telegram_bits_end_pos + nr_of_bits] = \
+                (level_one - level_zero)/np.maximum(level_one + level_zero, audioSettings.FFT_DETECTION_LEVEL)
+        
+    # hybrid ARQ: called on CHECKSUM ERROR, when the telegram bits from ADDRESS to CHECKSUM have been decoded.
+    # The soft bits of a previous damaged copy of this telegram (same seqNr and length, similar bits) are added to the soft bits of this copy,
+    # the combined bits replace the telegram bits and shall be decoded again (returns True).
+    # Otherwise the soft bits are kept for the next copy (returns False).
+    def combineSoftBits(self):
+        nr_of_bits = self.telegram_bits_start_pos
+        soft_bits = self.telegram_soft_bits[:nr_of_bits]
+        key = (self.telegram.seqNr, nr_of_bits)
+        if self.harq_combined:
+            # combined bits still wrong, keep the sum for the next copy
+            self.harq_combined = False
+            self.storeSoftBits(key, soft_bits)
+            return False
+        stored = self.harq_buffer.pop(key, None)
+        if (stored is None) or (np.count_nonzero((stored > 0.0) != (soft_bits > 0.0)) > HARQ_MAX_DIFFERENT_BITS_RATIO*nr_of_bits):
+            self.storeSoftBits(key, soft_bits)
+            return False
+        soft_bits += stored
+        self.telegram_bits[:nr_of_bits] = bitarray((soft_bits > 0.0).tolist())
+        # decode again from ADDRESS
+        self.telegram_bits_start_pos = 0
+        self.telegram.decodedDataBytes = 0
+        self.telegram.fec = False
+        self.decode_state = DECODE_ADDRESS
+        self.harq_combined = True
+        logging.info("HARQ: combined soft bits of telegram with SeqNr = "+str(self.telegram.seqNr)+", decode again")
+        return True
+        
+    def storeSoftBits(self, key, soft_bits):
+        self.harq_buffer[key] = soft_bits.copy()
+        if len(self.harq_buffer) > HARQ_MAX_TELEGRAMS:
+            del self.harq_buffer[next(iter(self.harq_buffer))]
+        
+    # store the rest_samples at the end of sample_buffer (beginning of a cut-bit) in the pre-allocated buffer
+    def storeCutBit(self, sample_buffer, rest_samples):
+        self.bit_prev_len = rest_samples
+        self.bit_prev[:rest_samples] = sample_buffer[len(sample_buffer) - rest_samples:]
+        self.next_bit_pos = -float(rest_samples)
+        
+    # process a correct telegram with increased seqNr, in the order of the sequence numbers
+    # data contains the data bytes of the telegram
+    def processSequencedTelegram(self, masked_command, data):
+        # now update seqNrAck (the complete telegram was correct and had an increased seqNr)
+        self.seqNrAck[0] = (self.seqNrAck[0] + 1)%255
+        # statistics
+        self.telRxOk += 1
+        # frame aggregation: demultiplex the sub-messages, which are processed in order as if received in separate telegrams
+        if masked_command == audioSettings.COMMAND_AGGREGATE:
+            for sub_command, sub_data in decodeAggregate(data):
+                logging.info("AGGREGATE contains COMMAND = "+str(sub_command)+" ("+audioSettings.CMD_STR[sub_command]+")")
+                self.processSequencedCommand(sub_command, sub_data)
+        else:
+            self.processSequencedCommand(masked_command, data)
+        
+    # process a command with increased seqNr (of a telegram or of a sub-message of COMMAND_AGGREGATE)
+    def processSequencedCommand(self, masked_command, data):
+        # process commands with increased seqNr
+        ########################
+        if masked_command == audioSettings.COMMAND_CHAT_DATA:
+            # TODO: need to consider "\n" or hyperlink stuff, etc. ?
+            decryptor = self.cipher[0].decryptor()
+            data = decryptor.update(data) + decryptor.finalize()
+            unpadder = padding.PKCS7(configuration.PADDING_BITS_LEN).unpadder()
+            unpadded_data = unpadder.update(data)
+            decryptedData = unpadded_data + unpadder.finalize()
+            decryptedData = decryptedData.decode('utf-8')
+            self.inMessageQueue.put(decryptedData)
+            self.inCommStatusQueue.put("RX: DATA")
+            logging.info("Received DATA: "+str(decryptedData))
+        elif masked_command == audioSettings.COMMAND_CHAT_DATA_START:
+            self.part_end_idx = 0
+            # TODO: need to consider "\n" or hyperlink stuff, etc. ?
+            self.data_part[self.part_end_idx:self.part_end_idx + len(data)] = data
+            self.part_end_idx += len(data)
+            self.inCommStatusQueue.put("RX: Receiving data..")
+            self.inCommStatusQueue.put("RX: DATA START")
+            logging.info("Received DATA START: "+str(data))
+        elif masked_command == audioSettings.COMMAND_CHAT_DATA_PART:
+            # TODO: need to consider "\n" or hyperlink stuff, etc. ?
+            self.data_part[self.part_end_idx:self.part_end_idx + len(data)] = data
+            self.part_end_idx += len(data)
+            self.inCommStatusQueue.put("RX: DATA PART")
+            logging.info("Received DATA PART: "+str(data))
+        elif masked_command == audioSettings.COMMAND_CHAT_DATA_END:
+            # TODO: need to consider "\n" or hyperlink stuff, etc. ?
+            self.data_part[self.part_end_idx:self.part_end_idx + len(data)] = data
+            self.part_end_idx += len(data)
+            decryptor = self.cipher[0].decryptor()
+            data = decryptor.update(self.data_part[0:self.part_end_idx]) + decryptor.finalize()
+            unpadder = padding.PKCS7(configuration.PADDING_BITS_LEN).unpadder()
+            unpadded_data = unpadder.update(data)
+            decryptedData = unpadded_data + unpadder.finalize()
+            decryptedData = decryptedData.decode('utf-8')
+            self.inMessageQueue.put(decryptedData)
+            self.inCommStatusQueue.put("RX: DATA END")
+            logging.info("Received DATA END: "+str(decryptedData))
+        elif masked_command == audioSettings.COMMAND_CALL_REJECTED:
+            self.call_rejected = True
+            self.inCommStatusQueue.put("RX: CALL REJECTED")
+            logging.info("Received CALL REJECTED")
+        elif masked_command == audioSettings.COMMAND_CALL_END:
+            # set flag to reset sequence numbers
+            # TODO: check this removal from 2021.02.07-15:24 - remove permanently
+            # we need to ACK already with reset SeqNr because recepient has already reset seqNr too..
+            ### resetSeqNrFlags = True
+            self.seqNrAck[0] = 0
+            self.seqNrAckRx[0] = 0
+            self.seqNrTx[0] = 0
+            self.reorder_buffer.clear()
+            # set flag
+            self.call_end = True
+            self.inCommStatusQueue.put("RX: CALL END")
+            logging.info("Received CALL END")
+            logging.info("SeqNrs reset!")
+        elif (masked_command == audioSettings.COMMAND_STARTUP_DATA_COMPLETE):
+            # TODO: add check against reception of retransmissions?
+            decryptor = self.cipher[0].decryptor()
+            data = decryptor.update(data) + decryptor.finalize()
+            unpadder = padding.PKCS7(configuration.PADDING_BITS_LEN).unpadder()
+            unpadded_data = unpadder.update(data)
+            self.startup_data.comm_partner = unpadded_data + unpadder.finalize()
+            self.startup_data.comm_partner = self.startup_data.comm_partner.decode('utf-8')
+            self.startup_data_received = True
+            self.inCommStatusQueue.put("RX: STARTUP COMPLETE")
+            logging.info("Received STARTUP_DATA COMPLETE, COMM_PARTNER: "+str(self.startup_data.comm_partner))
+        # elif XXX: TODO: add here processing of other commands..
+        ##################################
+        
+    # a damaged telegram was received: trigger a NACK to ask the other side for the retransmission of the expected seqNr
+    # without waiting for its timeout (thread_send_message limits the rate of NACKs).
+    # Only while a call is established, otherwise there is no telegram of the other side to be re-sent.
+    def triggerNack(self):
+        if self.rx_state == IDLE:
+            return
+        self.send_nack[0] = True
+        with self.comm_event:
+            self.comm_event.notify_all()
+        
     def decodeTelegram(self):
         while (self.telegram_bits_end_pos - self.telegram_bits_start_pos) >= 8:
             if self.decode_state == DECODE_ADDRESS:
                 self.telegram.address = ba2int(self.telegram_bits[self.telegram_bits_start_pos:self.telegram_bits_start_pos+audioSettings.START_LEN_BYTES*8])
+                self.telegram.address_pos = self.telegram_bits_start_pos
                 self.telegram_bits_start_pos += audioSettings.START_LEN_BYTES*8
                 logging.info("ADDRESS = "+str(self.telegram.address))
-                # check address
-                # TODO: remove this hard-coded check...
-                if self.telegram.address == 1:
+                # check address, which gives the frame format
+                if self.telegram.address in audioSettings.FRAME_CHECK_LEN_BYTES:
+                     self.telegram.frame_format = self.telegram.address
                      self.decode_state = DECODE_SEQ_NR
+                # telegram with forward error correction? (the marker is recognized even with bit errors)
+                elif (self.telegram.fec == False) and telegramFec.isFecMarker(self.telegram.address):
+                    self.telegram.fec = True
+                    self.decode_state = DECODE_FEC_LENGTH
                 else:
                     # ADDRESS ERROR: we just go back to PREAMBLE search state
+                    # no NACK, an unreadable ADDRESS does not tell if this was a telegram of the other side at all (e.g. noise)
                     # the transmitter will re-send on timeout
                     self.parse_state = SEARCH_PREAMBLE
                     # WARNING: always reset sub-state when going back to SEARCH_PREAMBLE
@@ -659,31 +1353,81 @@ class AudioReceiver():
                         self.receive_on_timer_event.set()
                     # statistics
                     self.telRxNok += 1
-                    logging.error("ADDRESS ERROR, address = "+str(self.telegram.address)+" not expected one = 1")
+                    logging.error("ADDRESS ERROR, address = "+str(self.telegram.address)+" not one of the frame formats "+str(list(audioSettings.FRAME_CHECK_LEN_BYTES)))
                     ###################################################
                     # TODO: shall we do something like this to avoid trying to decode wrong data on next call?
                     # self.telegram_bits_start_pos = 0
                     # self.telegram_bits_end_pos = 0
                     ###################################################
                     return # force return, dont delete this line!
+            elif self.decode_state == DECODE_FEC_LENGTH:
+                # wait for both bytes of LENGTH
+                if (self.telegram_bits_end_pos - self.telegram_bits_start_pos) < telegramFec.FEC_LENGTH_LEN_BYTES*8:
+                    return
+                self.telegram.fec_body_len = self.telegramFec.decodeLength(self.telegram_soft_bits[self.telegram_bits_start_pos:self.telegram_bits_start_pos+telegramFec.FEC_LENGTH_LEN_BYTES*8])
+                self.telegram_bits_start_pos += telegramFec.FEC_LENGTH_LEN_BYTES*8
+                logging.info("FEC LENGTH = "+str(self.telegram.fec_body_len))
+                if telegramFec.FEC_MIN_BODY_LEN_BYTES <= self.telegram.fec_body_len <= self.fec_max_body_len:
+                    self.decode_state = DECODE_FEC_BODY
+                else:
+                    # FEC LENGTH ERROR: we just go back to PREAMBLE search state
+                    # the transmitter will re-send on timeout
+                    self.parse_state = SEARCH_PREAMBLE
+                    # WARNING: always reset sub-state when going back to SEARCH_PREAMBLE
+                    self.decode_state = DECODE_ADDRESS
+                    # reset half-duplex flag
+                    if self.receive_on_ref[0]==True:
+                        self.receive_on_timer_event.set()
+                    # statistics
+                    self.telRxNok += 1
+                    logging.error("FEC LENGTH ERROR, length = "+str(self.telegram.fec_body_len)+" shall be in ["+str(telegramFec.FEC_MIN_BODY_LEN_BYTES)+", "+str(self.fec_max_body_len)+"]")
+                    return # force return # DONT DELETE THIS LINE
+            elif self.decode_state == DECODE_FEC_BODY:
+                # wait for the complete coded BODY
+                coded_len = self.telegramFec.getCodedLenBits(self.telegram.fec_body_len)
+                if (self.telegram_bits_end_pos - self.telegram_bits_start_pos) < coded_len:
+                    return
+                body_bits = self.telegramFec.decodeBody(self.telegram_soft_bits[self.telegram_bits_start_pos:self.telegram_bits_start_pos+coded_len], self.telegram.fec_body_len)
+                # the decoded BODY replaces the last bits of the coded BODY and is decoded as a telegram without FEC,
+                # so the CHECKSUM is decoded at the end of the coded BODY (the soft bits of the coded telegram are combined on CHECKSUM ERROR)
+                self.telegram_bits_start_pos += coded_len - len(body_bits)
+                self.telegram_bits[self.telegram_bits_start_pos:self.telegram_bits_start_pos+len(body_bits)] = bitarray(body_bits.tolist())
+                self.decode_state = DECODE_ADDRESS
             elif self.decode_state == DECODE_SEQ_NR:
                 self.telegram.seqNr = ba2int(self.telegram_bits[self.telegram_bits_start_pos:self.telegram_bits_start_pos+audioSettings.SEQ_NR_LEN_BYTES*8])
                 self.telegram_bits_start_pos += audioSettings.SEQ_NR_LEN_BYTES*8
                 logging.info("SEQ_NR = "+str(self.telegram.seqNr))
+                # NOTE: seqNr is checked together with COMMAND (see DECODE_COMMAND)
+                self.decode_state = DECODE_SEQ_NR_ACK
+            elif self.decode_state == DECODE_SEQ_NR_ACK:
+                self.telegram.seqNrAck = ba2int(self.telegram_bits[self.telegram_bits_start_pos:self.telegram_bits_start_pos+audioSettings.SEQ_NR_ACK_LEN_BYTES*8])
+                self.telegram_bits_start_pos += audioSettings.SEQ_NR_ACK_LEN_BYTES*8
+                logging.info("SEQ_NR_ACK = "+str(self.telegram.seqNrAck))
+                self.decode_state = DECODE_COMMAND
+            elif self.decode_state == DECODE_COMMAND:
+                self.telegram.command = ba2int(self.telegram_bits[self.telegram_bits_start_pos:self.telegram_bits_start_pos+audioSettings.COMMAND_LEN_BYTES*8])
+                self.telegram_bits_start_pos += audioSettings.COMMAND_LEN_BYTES*8
+                self.decode_state = DECODE_DATA_LEN
+                logging.info("COMMAND = "+str(self.telegram.command)+" ("+audioSettings.CMD_STR[self.telegram.command]+")")
                 ### if self.rx_state == KEY_END_RECEIVED:
                 # check if seqNr ok
                 expectedSeqNr = (self.seqNrAck[0] + 1)%255
-                # new telegram?
-                if self.telegram.seqNr == expectedSeqNr:
+                # position of seqNr relative to the last seqNr received in order (with stop-and-wait only +1 = new and 0 = repeated are valid)
+                seqNrOffset = (self.telegram.seqNr - self.seqNrAck[0])%255
+                # NACK? it is not part of the sequence, the seqNr requested is in DATA.
+                # Its seqNr (the last one acknowledged by us as seen by the other side) is one behind our seqNrAck if our ACK was lost,
+                # so it is processed like a repeated telegram whatever its seqNr
+                if (self.telegram.command & audioSettings.COMMAND_MASK) == audioSettings.COMMAND_TELEGRAM_NACK:
+                    self.telegram.seqNrRepeated = True
+                # new telegram? (in order, or inside the ARQ window and not yet received)
+                elif (1 <= seqNrOffset <= audioSettings.ARQ_WINDOW_SIZE) and (self.telegram.seqNr not in self.reorder_buffer):
                     self.telegram.seqNrRepeated = False
                     # we dont increment seqNrAck yet, we do that when we checked all other fields, especially the CRC
-                    self.decode_state = DECODE_SEQ_NR_ACK
-                # repeated telegram?
-                elif self.telegram.seqNr == self.seqNrAck[0]:
+                # repeated telegram? (already received, the ACK may have been lost)
+                elif (seqNrOffset <= audioSettings.ARQ_WINDOW_SIZE) or ((-seqNrOffset)%255 < audioSettings.ARQ_WINDOW_SIZE):
                     # we dont increment or reset seqNr
                     # telegram will be discarded and acknowledged at the end if CRC and other things are ok
                     self.telegram.seqNrRepeated = True
-                    self.decode_state = DECODE_SEQ_NR_ACK
                 # incorrect seqNrAck
                 else:
                     # SEQ ERROR: we just go back to PREAMBLE search state
@@ -698,19 +1442,6 @@ class AudioReceiver():
                     self.telRxNok += 1
                     logging.error("SEQ_NR ERROR, seqNr = "+str(self.telegram.seqNr)+" not expected one = "+str(expectedSeqNr))
                     return # force return # DONT DELETE THIS LINE
-                ### else:
-                    ### self.decode_state = DECODE_SEQ_NR_ACK
-                    ### logging.info("SEQ_NR not yet evaluated!")
-            elif self.decode_state == DECODE_SEQ_NR_ACK:
-                self.telegram.seqNrAck = ba2int(self.telegram_bits[self.telegram_bits_start_pos:self.telegram_bits_start_pos+audioSettings.SEQ_NR_ACK_LEN_BYTES*8])
-                self.telegram_bits_start_pos += audioSettings.SEQ_NR_ACK_LEN_BYTES*8
-                logging.info("SEQ_NR_ACK = "+str(self.telegram.seqNrAck))
-                self.decode_state = DECODE_COMMAND
-            elif self.decode_state == DECODE_COMMAND:
-                self.telegram.command = ba2int(self.telegram_bits[self.telegram_bits_start_pos:self.telegram_bits_start_pos+audioSettings.COMMAND_LEN_BYTES*8])
-                self.telegram_bits_start_pos += audioSettings.COMMAND_LEN_BYTES*8
-                self.decode_state = DECODE_DATA_LEN
-                logging.info("COMMAND = "+str(self.telegram.command)+" ("+audioSettings.CMD_STR[self.telegram.command]+")")
             elif self.decode_state == DECODE_DATA_LEN:
                 self.telegram.data_length = ba2int(self.telegram_bits[self.telegram_bits_start_pos:self.telegram_bits_start_pos+audioSettings.DATA_SIZE_LEN_BYTES*8])
                 self.telegram_bits_start_pos += audioSettings.DATA_SIZE_LEN_BYTES*8
@@ -763,113 +1494,75 @@ class AudioReceiver():
                     logging.error("END ERROR, END = "+str(self.telegram.end)+" not expected one = 0xAA")
                     return # dont remove this line!
             elif self.decode_state == DECODE_CHECKSUM:
-                self.telegram.checksum = ba2int(self.telegram_bits[self.telegram_bits_start_pos:self.telegram_bits_start_pos+audioSettings.CHECKSUM_LEN_BYTES*8])
-                self.telegram_bits_start_pos += audioSettings.CHECKSUM_LEN_BYTES*8
+                # wait for all bytes of a CRC
+                check_len_bits = audioSettings.FRAME_CHECK_LEN_BYTES[self.telegram.frame_format]*8
+                if (self.telegram_bits_end_pos - self.telegram_bits_start_pos) < check_len_bits:
+                    return
+                # bytes from ADDRESS to END
+                checked_bits = self.telegram_bits[self.telegram.address_pos:self.telegram_bits_start_pos]
+                self.telegram.checksum = ba2int(self.telegram_bits[self.telegram_bits_start_pos:self.telegram_bits_start_pos+check_len_bits])
+                self.telegram_bits_start_pos += check_len_bits
                 logging.info("CHECKSUM = "+str(self.telegram.checksum))
                 # calculate checksum
                 start = 85 # = b"\x55"
-                checksum = 0 # = b"\x00" # start value
-                checksum = checksum^start
-                checksum = checksum^self.telegram.address
-                checksum = checksum^self.telegram.seqNr
-                checksum = checksum^self.telegram.seqNrAck
-                checksum = checksum^self.telegram.command
-                checksum = checksum^self.telegram.data_length
-                for i in range(self.telegram.decodedDataBytes):
-                    checksum = checksum^self.telegram.data[i]
+                if self.telegram.frame_format == audioSettings.FRAME_FORMAT_CRC16:
+                    checksum = self.crc16.calculate(bytes([start]) + checked_bits.tobytes())
+                elif self.telegram.frame_format == audioSettings.FRAME_FORMAT_CRC32:
+                    checksum = self.crc32.calculate(bytes([start]) + checked_bits.tobytes())
+                else:
+                    checksum = 0 # = b"\x00" # start value
+                    checksum = checksum^start
+                    checksum = checksum^self.telegram.address
+                    checksum = checksum^self.telegram.seqNr
+                    checksum = checksum^self.telegram.seqNrAck
+                    checksum = checksum^self.telegram.command
+                    checksum = checksum^self.telegram.data_length
+                    for i in range(self.telegram.decodedDataBytes):
+                        checksum = checksum^self.telegram.data[i]
                 logging.info("Calculated CHECKSUM = "+str(checksum))
                 # is checksum ok?
                 if checksum == self.telegram.checksum:
+                    # damaged copies of this telegram are not needed anymore
+                    if self.harq_buffer:
+                        for key in [key for key in self.harq_buffer if key[0] == self.telegram.seqNr]:
+                            del self.harq_buffer[key]
+                    if self.harq_combined:
+                        self.harq_combined = False
+                        logging.info("HARQ: telegram recovered with combined soft bits")
                     # process command
                     ###########
                     masked_command = (self.telegram.command & audioSettings.COMMAND_MASK)
                     # TODO: remove use of resetSeqNrFlags
                     ### resetSeqNrFlags = False
                     if self.telegram.seqNrRepeated == False:
-                        # now update seqNrAck (the complete telegram was correct and had an increased seqNr)
-                        self.seqNrAck[0] = (self.seqNrAck[0] + 1)%255
-                        # statistics
-                        self.telRxOk += 1
-                        # process commands with increased seqNr
-                        ########################
-                        if masked_command == audioSettings.COMMAND_CHAT_DATA:
-                            # TODO: need to consider "\n" or hyperlink stuff, etc. ?
-                            decryptor = self.cipher[0].decryptor()
-                            data = decryptor.update(self.telegram.data[:self.telegram.decodedDataBytes]) + decryptor.finalize()
-                            unpadder = padding.PKCS7(configuration.PADDING_BITS_LEN).unpadder()
-                            unpadded_data = unpadder.update(data)
-                            decryptedData = unpadded_data + unpadder.finalize()
-                            decryptedData = decryptedData.decode('utf-8')
-                            self.inMessageQueue.put(decryptedData)
-                            self.inCommStatusQueue.put("RX: DATA")
-                            logging.info("Received DATA: "+str(decryptedData))
-                        elif masked_command == audioSettings.COMMAND_CHAT_DATA_START:
-                            self.part_end_idx = 0
-                            # TODO: need to consider "\n" or hyperlink stuff, etc. ?
-                            self.data_part[self.part_end_idx:self.part_end_idx + self.telegram.decodedDataBytes] = self.telegram.data[:self.telegram.decodedDataBytes]
-                            self.part_end_idx += self.telegram.decodedDataBytes
-                            self.inCommStatusQueue.put("RX: Receiving data..")
-                            self.inCommStatusQueue.put("RX: DATA START")
-                            logging.info("Received DATA START: "+str(self.telegram.data[:self.telegram.decodedDataBytes]))
-                        elif masked_command == audioSettings.COMMAND_CHAT_DATA_PART:
-                            # TODO: need to consider "\n" or hyperlink stuff, etc. ?
-                            self.data_part[self.part_end_idx:self.part_end_idx + self.telegram.decodedDataBytes] = self.telegram.data[:self.telegram.decodedDataBytes]
-                            self.part_end_idx += self.telegram.decodedDataBytes
-                            self.inCommStatusQueue.put("RX: DATA PART")
-                            logging.info("Received DATA PART: "+str(self.telegram.data[:self.telegram.decodedDataBytes]))
-                        elif masked_command == audioSettings.COMMAND_CHAT_DATA_END:
-                            # TODO: need to consider "\n" or hyperlink stuff, etc. ?
-                            self.data_part[self.part_end_idx:self.part_end_idx + self.telegram.decodedDataBytes] = self.telegram.data[:self.telegram.decodedDataBytes]
-                            self.part_end_idx += self.telegram.decodedDataBytes
-                            decryptor = self.cipher[0].decryptor()
-                            data = decryptor.update(self.data_part[0:self.part_end_idx]) + decryptor.finalize()
-                            unpadder = padding.PKCS7(configuration.PADDING_BITS_LEN).unpadder()
-                            unpadded_data = unpadder.update(data)
-                            decryptedData = unpadded_data + unpadder.finalize()
-                            decryptedData = decryptedData.decode('utf-8')
-                            self.inMessageQueue.put(decryptedData)
-                            self.inCommStatusQueue.put("RX: DATA END")
-                            logging.info("Received DATA END: "+str(decryptedData))
-                        elif masked_command == audioSettings.COMMAND_CALL_REJECTED:
-                            self.call_rejected = True
-                            self.inCommStatusQueue.put("RX: CALL REJECTED")
-                            logging.info("Received CALL REJECTED")
-                        elif masked_command == audioSettings.COMMAND_CALL_END:
-                            # set flag to reset sequence numbers
-                            # TODO: check this removal from 2021.02.07-15:24 - remove permanently
-                            # we need to ACK already with reset SeqNr because recepient has already reset seqNr too..
-                            ### resetSeqNrFlags = True
-                            self.seqNrAck[0] = 0
-                            self.seqNrAckRx[0] = 0
-                            self.seqNrTx[0] = 0
-                            # set flag
-                            self.call_end = True
-                            self.inCommStatusQueue.put("RX: CALL END")
-                            logging.info("Received CALL END")
-                            logging.info("SeqNrs reset!")
-                        elif (masked_command == audioSettings.COMMAND_STARTUP_DATA_COMPLETE):
-                            # TODO: add check against reception of retransmissions?
-                            decryptor = self.cipher[0].decryptor()
-                            data = decryptor.update(self.telegram.data[:self.telegram.decodedDataBytes]) + decryptor.finalize()
-                            unpadder = padding.PKCS7(configuration.PADDING_BITS_LEN).unpadder()
-                            unpadded_data = unpadder.update(data)
-                            self.startup_data.comm_partner = unpadded_data + unpadder.finalize()
-                            self.startup_data.comm_partner = self.startup_data.comm_partner.decode('utf-8')
-                            self.startup_data_received = True
-                            self.inCommStatusQueue.put("RX: STARTUP COMPLETE")
-                            logging.info("Received STARTUP_DATA COMPLETE, COMM_PARTNER: "+str(self.startup_data.comm_partner))
-                        # elif XXX: TODO: add here processing of other commands..
-                        ##################################
+                        # in order?
+                        if self.telegram.seqNr == (self.seqNrAck[0] + 1)%255:
+                            self.processSequencedTelegram(masked_command, self.telegram.data[:self.telegram.decodedDataBytes])
+                            # process the telegrams received before out of order which follow now in order
+                            while (self.seqNrAck[0] + 1)%255 in self.reorder_buffer:
+                                self.processSequencedTelegram(*self.reorder_buffer.pop((self.seqNrAck[0] + 1)%255))
+                        else:
+                            # windowed ARQ: keep a copy until the missing telegrams arrive
+                            self.reorder_buffer[self.telegram.seqNr] = (masked_command, bytes(self.telegram.data[:self.telegram.decodedDataBytes]))
+                            self.inCommStatusQueue.put("RX: "+audioSettings.CMD_STR[masked_command]+" (out of order)")
+                            logging.info("Received telegram out of order with SeqNr = "+str(self.telegram.seqNr)+", buffered until SeqNr = "+str((self.seqNrAck[0] + 1)%255))
                     # process command without increased seqNr
                     #########################
                     elif masked_command == audioSettings.COMMAND_CALL:
                         # TODO: handle reception of retransmissions ?
                         # handle communication token
-                        comm_token_partner = int.from_bytes(self.telegram.data[:self.telegram.decodedDataBytes], byteorder='big', signed=False)
+                        comm_token_partner = self.telegram.data[0]
+                        # capabilities of the other side (not sent by older versions)
+                        if self.telegram.decodedDataBytes > 1:
+                            self.peer_capabilities[0] = self.telegram.data[1]
+                        else:
+                            self.peer_capabilities[0] = 0
                         if comm_token_partner > self.comm_token[0]:
                             self.have_token = False
                         elif comm_token_partner == self.comm_token[0]:
                             self.comm_token[0] = random.randint(0, 255)
+                        # a new call begins with new sequence numbers
+                        self.reorder_buffer.clear()
                         # set flag
                         self.call = True
                         # statistics
@@ -878,6 +1571,11 @@ class AudioReceiver():
                         logging.info("Received CALL, we dont trigger ACK in this case..")
                     elif masked_command == audioSettings.COMMAND_CALL_ACCEPTED:
                         if self.rx_state == IDLE:
+                            # capabilities of the other side (not sent by older versions)
+                            if self.telegram.decodedDataBytes > 0:
+                                self.peer_capabilities[0] = self.telegram.data[0]
+                            else:
+                                self.peer_capabilities[0] = 0
                             self.rx_state  = CALL_ACCEPTED
                             self.call_accepted = True
                             self.inCommStatusQueue.put("RX: CALL ACCEPTED")
@@ -941,6 +1639,15 @@ class AudioReceiver():
                         self.startup_data_received = True
                         self.inCommStatusQueue.put("RX: STARTUP")
                         logging.info("Received STARTUP_DATA, COMM_PARTNER: "+str(self.startup_data.comm_partner))
+                    elif masked_command == audioSettings.COMMAND_TELEGRAM_NACK:
+                        # the other side received a damaged telegram, the transmitter re-sends the requested seqNr at once
+                        if self.telegram.decodedDataBytes > 0:
+                            self.nack_received[1] = self.telegram.data[0]
+                            self.nack_received[0] = True
+                        # statistics
+                        self.telRxOk += 1
+                        self.inCommStatusQueue.put("RX: NACK")
+                        logging.info("Received NACK for SeqNr = "+str(self.nack_received[1]))
                     elif self.telegram.command  != audioSettings.COMMAND_TELEGRAM_ACK:
                         # statistics
                         self.telRxOk += 1 # TODO: can this be considered a CORRECT telegram? but it is repeated...hmm..
@@ -948,6 +1655,9 @@ class AudioReceiver():
                         logging.info("Telegram with repeated SeqNr. Discard it BUT Acknowledge it.")
                     # process ACK
                     if (self.telegram.command & audioSettings.ACK_MASK) == audioSettings.COMMAND_TELEGRAM_ACK:
+                        # a pure ACK of the windowed ARQ contains the receive window of the other side and its selective ACKs
+                        if (masked_command == audioSettings.COMMAND_NONE) and (self.telegram.decodedDataBytes > 0):
+                            self.sack_received[0], self.sack_received[1] = decodeSelectiveAck(self.telegram.seqNrAck, self.telegram.data[:self.telegram.decodedDataBytes])
                         self.seqNrAckRx[0] = self.telegram.seqNrAck
                         self.ack_received[0] = True
                         self.ack_received[1] = cProfileTimer()
@@ -959,10 +1669,16 @@ class AudioReceiver():
                         if  (masked_command == audioSettings.COMMAND_CHAT_DATA) or (masked_command == audioSettings.COMMAND_CHAT_DATA_START) or \
                             (masked_command == audioSettings.COMMAND_CHAT_DATA_PART) or (masked_command == audioSettings.COMMAND_CHAT_DATA_END) or \
                             (masked_command == audioSettings.COMMAND_CALL_REJECTED) or (masked_command == audioSettings.COMMAND_CALL_END) or \
-                            (masked_command == audioSettings.COMMAND_STARTUP_DATA_COMPLETE):
+                            (masked_command == audioSettings.COMMAND_STARTUP_DATA_COMPLETE) or (masked_command == audioSettings.COMMAND_AGGREGATE):
+                            # windowed ARQ: window advertisement and selective ACKs of telegrams received out of order
+                            if audioSettings.ARQ_WINDOW_SIZE > 1:
+                                self.sack_to_send[0] = encodeSelectiveAck(self.seqNrAck[0], self.reorder_buffer)
                             self.send_ack[0] = True
                             self.inCommStatusQueue.put("") # ("RX:")
                             logging.info("Trigger Send ACK")
+                    # wake up threads waiting for the flags set above (transmitter and handshake in soundDeviceManager)
+                    with self.comm_event:
+                        self.comm_event.notify_all()
                     self.parse_state = SEARCH_PREAMBLE
                     # WARNING: always reset sub-state when going back to SEARCH_PREAMBLE
                     self.decode_state = DECODE_ADDRESS
@@ -984,9 +1700,13 @@ class AudioReceiver():
                         logging.info("SeqNrs reset!")
                     # '''
                     return # dont remove this line!
+                # hybrid ARQ: combine with previous damaged copies and decode again
+                elif audioSettings.HARQ_SOFT_COMBINING and self.combineSoftBits():
+                    continue
                 else:
                     # CHECKSUM ERROR: we just go back to PREAMBLE search state
-                    # the transmitter will re-send on timeout
+                    # we send a NACK so the transmitter re-sends at once (otherwise it will re-send on timeout)
+                    self.triggerNack()
                     self.parse_state = SEARCH_PREAMBLE
                     # WARNING: always reset sub-state when going back to SEARCH_PREAMBLE
                     self.decode_state = DECODE_ADDRESS
@@ -1006,162 +1726,265 @@ class AudioReceiver():
         ############
         while self.stream_on[0]:
             try:
-                # BLOCKING call on queue to obtain audio data from RX in
-                # TODO: define dataComplete as module variable to avoid memory allocation?
-                dataComplete = self.qin.get() # .get_nowait()
-                # decode / analyze / plot in chunks of size audioSettings.N = TELEGRAM_PREAMBLE_LEN_SAMPLES
-                rounds = int(audioSettings.AUDIO_RX_CHUNK_SAMPLES_LEN/audioSettings.N)
-                # flag
-                preamble_round = -100 # NOTE: do NOT initilaize to -1
-                # rounds, split audio-chunk 
-                ###############
-                for m in range(rounds):
-                    # indexes for part of dataComplete[]
-                    start_of_round = audioSettings.N*m
-                    end_of_round = audioSettings.N*(m+1)
-                    # DETECT PREAMBLE
-                    #############
-                    # TODO: shall we better use a data length which is 2^x  to calculate FFT ?
-                    ##########################################
-                    # authors of Numpy recommend using FFT from ScyPy instead
-                    # Windowing the signal with a dedicated window function helps mitigate spectral leakage,
-                    # but tests show better results without windowing...probably because of the reduced samples size.
-                    # rfft for real input is faster than fft
-                    ### w = blackman(audioSettings.N)
-                    ffty = rfft(dataComplete[start_of_round:end_of_round]) ### *w)
-                    absfft = 2.0 * abs(ffty[:audioSettings.N//2])/audioSettings.N
-                    # parse audio-chunk-part
-                    ##############
-                    if (self.parse_state == SEARCH_PREAMBLE) or (self.parse_state == SEARCH_START):
-                        preamble_fft = absfft[audioSettings.BIN_FREQUENCY_ONE]
-                        logging.debug(str(preamble_fft))
-                        # detected PREAMBLE
-                        #############
-                        if preamble_fft>audioSettings.FFT_DETECTION_LEVEL:
-                            # set flag
-                            preamble_round = m
-                            logging.info("Detected PREAMBLE in round "+str(m))
-                            # state transition (or set same state again unnecessarily - we avoid having an if statement)
-                            self.parse_state = SEARCH_START
-                            # search START of frame
-                            # we always take some samples from previous round in case START was cut
-                            # for first round with m==0 we need to recover previous samples from self.data_prev[]
-                            startSamplePosition = -1
-                            if m == 0:
-                                self.data_prev[self.PREVIOUS_SAMPLES:(self.PREVIOUS_SAMPLES + audioSettings.N)] = dataComplete[start_of_round:end_of_round]
-                                startSamplePosition = self.getStartSamplePosition(self.data_prev[0:(self.PREVIOUS_SAMPLES + audioSettings.N)])
-                            else:
-                                startSamplePosition = self.getStartSamplePosition(dataComplete[audioSettings.N*m - self.PREVIOUS_SAMPLES:audioSettings.N*(m+1)])
-                            # found START?
-                            if startSamplePosition >= 0:
-                                logging.info("Detected START in round "+str(m)+" at position "+str(startSamplePosition))
-                                self.parse_state = DECODE_FRAME
-                                # DECODE telegram
-                                ############
-                                self.decodeTelegram()
-                            elif m == (rounds-1):
-                                # START is probably not yet received or was cut...
-                                # store last samples of this last part, big enough to allocate last PREAMBLE byte and START
-                                # NOTE: data is already filtered..
-                                self.data_prev[0:self.PREVIOUS_SAMPLES] = dataComplete[audioSettings.N*(m+1) - self.PREVIOUS_SAMPLES:audioSettings.N*(m+1)]
-                        # no PREAMBLE detected
-                        ###############
-                        else:
-                            # detected PREAMBLE in previous round of this audio chunk ?
-                            if preamble_round == (m-1):
-                                # search START of frame
-                                startSamplePosition = self.getStartSamplePosition(dataComplete[audioSettings.N*m - self.PREVIOUS_SAMPLES:audioSettings.N*(m+1)])
-                                # found START in first part?
-                                if startSamplePosition >= 0:
-                                    logging.info("Detected START in round "+str(m)+" at position "+str(startSamplePosition))
-                                    self.parse_state = DECODE_FRAME
-                                    # DECODE telegram
-                                    ############
-                                    self.decodeTelegram()
-                                else:
-                                    # START not found although PREAMBLE was found in previous round
-                                    # TODO: discard silently when no START found! ...and comment this:
-                                    logging.info("START NOT found in round "+str(m))
-                                    # transition on error event back to initial state
-                                    self.parse_state = SEARCH_PREAMBLE
-                                    # WARNING: always reset sub-state when going back to SEARCH_PREAMBLE
-                                    self.decode_state = DECODE_ADDRESS
-                            # detected PREAMBLE in last round of previous audio chunk?
-                            elif self.parse_state == SEARCH_START:
-                                # TODO: remove this check if error message does NOT appear. It shall always be zero..but we actually GOT into the else: during tests...hmm..
-                                # 2021.01.06 started evaluation...
-                                # this shall be an assert instead...?
-                                if m == 0:
-                                    # search START of frame
-                                    self.data_prev[self.PREVIOUS_SAMPLES:(self.PREVIOUS_SAMPLES + audioSettings.N)] = dataComplete[start_of_round:end_of_round] # dataComplete[0:audioSettings.N]
-                                    startSamplePosition = self.getStartSamplePosition(self.data_prev[0:(self.PREVIOUS_SAMPLES + audioSettings.N)])
-                                    if startSamplePosition >= 0:
-                                        logging.info("Detected START in round "+str(m)+" at position "+str(startSamplePosition))
-                                        self.parse_state = DECODE_FRAME
-                                        # DECODE telegram
-                                        ############
-                                        self.decodeTelegram()
-                                    else:
-                                        # START not found although PREAMBLE was found in last round of previous audio-chunk
-                                        # TODO: discard silently when no START found! ...and comment this:
-                                        logging.info("START NOT found in round "+str(m))
-                                        # transition on error event back to initial state
-                                        self.parse_state = SEARCH_PREAMBLE
-                                        # WARNING: always reset sub-state when going back to SEARCH_PREAMBLE
-                                        self.decode_state = DECODE_ADDRESS
-                                else:
-                                    # during "evaluation period" we want to show a POPUP if this condition occurs...see TODO above to remove if-else condition for m==0
-                                    self.inMessageQueue.put("ERROR: PREAMBLE found BUT then STRANGE CONDITION?!\n")
-                                    logging.error("ERROR: PREAMBLE found BUT then STRANGE CONDITION?!\n")
-                                    # just to make sure..
-                                    self.parse_state = SEARCH_PREAMBLE
-                                    # WARNING: always reset sub-state when going back to SEARCH_PREAMBLE
-                                    self.decode_state = DECODE_ADDRESS
-                            else:
-                                # no preamble found while in state SEARCH_PREAMBLE...kepp on searching...
-                                pass
-                    elif self.parse_state == DECODE_FRAME:
-                    ############################
-                        # put sample data in bit array, it will be decoded as well
-                        self.putInBitArrayBuffer(dataComplete[start_of_round:end_of_round])
-                        # DECODE telegram
-                        # we check state again, putInBitArrayBuffer() may have forced  state change due to decoding errors...
-                        #########################################################
-                        if self.parse_state == DECODE_FRAME:
+                # idle listening: blocks without code-like parts are discarded without decoding
+                if self.idle_listening and self.listenIdle():
+                    continue
+                # BLOCKING call on ring buffer to obtain the next part of audio data from RX in,
+                # we decode / analyze in parts of size audioSettings.N = TELEGRAM_PREAMBLE_LEN_SAMPLES
+                # (with timeout to check stream_on regularly)
+                if self.rxRingBuffer.wait(READER_DECODER, audioSettings.N, DECODE_WAIT_TIMEOUT_SEC) == False:
+                    continue
+                dataComplete = self.updateDecoderBuffer(self.rxRingBuffer.read(READER_DECODER, audioSettings.N))
+                # decoder too slow? then the oldest samples were lost
+                if self.rxRingBuffer.getOverruns(READER_DECODER) != self.rx_overruns:
+                    self.rx_overruns = self.rxRingBuffer.getOverruns(READER_DECODER)
+                    logging.error("ERROR: RX overrun, decoder lost samples (nr. of overruns = "+str(self.rx_overruns)+")")
+                dataPart = dataComplete[self.PREVIOUS_SAMPLES:]
+                # DETECT PREAMBLE
+                #############
+                # TODO: shall we better use a data length which is 2^x  to calculate FFT ?
+                ##########################################
+                # authors of Numpy recommend using FFT from ScyPy instead
+                # Windowing the signal with a dedicated window function helps mitigate spectral leakage,
+                # but tests show better results without windowing...probably because of the reduced samples size.
+                # rfft for real input is faster than fft
+                # With DETECT_USING_GROETZEL we only evaluate FREQ_ONE and the reference frequencies of the CFAR detector around it.
+                ### w = blackman(audioSettings.N)
+                # NOTE: BIN_FREQUENCY_ONE is the same for N samples at SAMPLING_FREQUENCY and DECODER_N samples at DECODER_SAMPLING_FREQUENCY
+                # NOTE: the levels are only needed to search a PREAMBLE (with PN_PREAMBLE we search with the correlation detector only)
+                searching = ((self.parse_state == SEARCH_PREAMBLE) or (self.parse_state == SEARCH_START)) and not audioSettings.PN_PREAMBLE
+                # staged detection: the energy gate (level of FREQ_ONE and FREQ_ZERO in O(N)) decides if we need the spectrum
+                gate_levels = getToneLevels(dataPart, self.gate_basis)[0]
+                self.updateIdleListening(gate_levels)
+                if searching and not self.preambleDetector.precheck(gate_levels[0], self.preamble_bin):
+                    # nothing to detect in this part, no spectrum needed
+                    searching = False
+                    preamble_detected = False
+                elif searching and self.detect_using_goertzel:
+                    bin_levels = goertzel.goertzel_level(dataPart, audioSettings.DECODER_SAMPLING_FREQUENCY, self.preamble_frequencies)[0]
+                    bin_one = 0
+                elif searching:
+                    ffty = rfft(dataPart) ### *w)
+                    bin_levels = 2.0 * abs(ffty[:audioSettings.DECODER_N//2])/audioSettings.DECODER_N
+                    bin_one = audioSettings.BIN_FREQUENCY_ONE
+                # parse audio-part
+                ##############
+                if ((self.parse_state == SEARCH_PREAMBLE) or (self.parse_state == SEARCH_START)) and audioSettings.PN_PREAMBLE:
+                    # correlation lock: a telegram with short PN PREAMBLE has no long tone to be detected first,
+                    # so we correlate each part with code signal (single pass, which also finds START after a long PREAMBLE),
+                    # the energy gate (CFAR on the levels of FREQ_ONE and FREQ_ZERO) passes this part or passed the previous one (START cut at its end)
+                    gate_passed = self.preambleDetector.precheck(np.max(gate_levels), self.preamble_bin)
+                    if gate_passed or self.previous_gate_passed:
+                        sync = self.synchronizeFrame(dataComplete)
+                    else:
+                        sync = (-1, 0.0, None)
+                    self.previous_gate_passed = gate_passed
+                    if sync[1] >= SYNC_LOCK_MIN_QUALITY:
+                        logging.info("Detected PREAMBLE by correlation with quality = "+str(sync[1]))
+                        startSamplePosition = self.getStartSamplePosition(dataComplete, sync, SYNC_LOCK_MIN_QUALITY)
+                        # found START?
+                        if startSamplePosition >= 0:
+                            logging.info("Detected START at position "+str(startSamplePosition))
+                            self.parse_state = DECODE_FRAME
+                            # DECODE telegram
+                            ############
                             self.decodeTelegram()
-                    # pass data to plot
-                    ###########
-                    if configuration.SHOW_PLOT:
-                        ############################
-                        # filter coding-range (remove left and right frequencies with Voice content)
-                        ###########################################
-                        if configuration.PLOT_CODE_ONLY:
-                            dataComplete[start_of_round:end_of_round], self.z = signal.sosfilt(self.sos_bandpass, dataComplete[start_of_round:end_of_round], zi=self.z)
-                        # plot FFT or time signal
-                        if configuration.PLOT_FFT:
-                            # TODO: shall we better use a data length which is 2^x  to calculate FFT ?
-                            ##########################################
-                            # authors of Numpy recommend using FFT from ScyPy instead
-                            # Windowing the signal with a dedicated window function helps mitigate spectral leakage,
-                            # but tests show better results without windowing, probably due to the reduced number of samples.
-                            # rfft for real input is faster than fft
-                            if configuration.PLOT_CODE_ONLY:
-                                ### w = blackman(audioSettings.N)
-                                ffty = rfft(dataComplete[start_of_round:end_of_round]) ###*w)
-                                absfft = 2.0 * abs(ffty[:audioSettings.N//2])/audioSettings.N
-                            # downsample FFT of data before plotting
-                            absfft_downsampled = absfft[::audioSettings.DOWNSAMPLE]
-                            self.qplot.put(absfft_downsampled)
+                            self.resumeSearch(dataComplete)
+                elif (self.parse_state == SEARCH_PREAMBLE) or (self.parse_state == SEARCH_START):
+                    # adaptive threshold (CFAR), if the part passed the energy gate
+                    if searching:
+                        logging.debug(str(bin_levels[bin_one]))
+                        preamble_detected = self.preambleDetector.detect(bin_levels, bin_one)
+                    if preamble_detected:
+                        logging.info("Detected PREAMBLE with level = "+str(bin_levels[bin_one])+" > threshold = "+str(self.preambleDetector.getThreshold(bin_one)))
+                        if self.parse_state == SEARCH_PREAMBLE:
+                            self.preambleDetector.nr_of_triggers += 1
+                    # search START of frame if PREAMBLE detected in this part or in the previous part
+                    if preamble_detected or (self.parse_state == SEARCH_START):
+                        startSamplePosition = self.getStartSamplePosition(dataComplete)
+                        # found START?
+                        if startSamplePosition >= 0:
+                            logging.info("Detected START at position "+str(startSamplePosition))
+                            self.parse_state = DECODE_FRAME
+                            # DECODE telegram
+                            ############
+                            self.decodeTelegram()
+                            self.resumeSearch(dataComplete)
+                        elif preamble_detected:
+                            # START probably not received yet, search again in the next part
+                            self.parse_state = SEARCH_START
                         else:
-                            # downsample data before plotting
-                            data_downsampled = dataComplete[start_of_round:end_of_round][::audioSettings.DOWNSAMPLE]
-                            self.qplot.put(data_downsampled)
+                            # START not found although PREAMBLE was found in previous part
+                            # TODO: discard silently when no START found! ...and comment this:
+                            logging.info("START NOT found")
+                            self.preambleDetector.nr_of_false_triggers += 1
+                            # transition on error event back to initial state
+                            self.parse_state = SEARCH_PREAMBLE
+                            # WARNING: always reset sub-state when going back to SEARCH_PREAMBLE
+                            self.decode_state = DECODE_ADDRESS
+                    else:
+                        # no preamble found while in state SEARCH_PREAMBLE...kepp on searching...
+                        pass
+                elif self.parse_state == DECODE_FRAME:
+                ############################
+                    # put sample data in bit array, it will be decoded as well
+                    self.putInBitArrayBuffer(dataPart)
+                    # DECODE telegram
+                    # we check state again, putInBitArrayBuffer() may have forced  state change due to decoding errors...
+                    #########################################################
+                    if self.parse_state == DECODE_FRAME:
+                        self.decodeTelegram()
+                    self.resumeSearch(dataComplete)
             except Exception as e:
                 logging.error("Exception in AudioReceiver.thread_decode():"+str(e)+"\n")
                 # TEST: continue despite Exception...???
                 ###break
         logging.info("leave thread AudioReceiver.thread_decode()..")
         
+    # band-select and decimate the next part of N samples to DECODER_N samples, pass them through the bit detector
+    # and append them to the decoder buffer, which is returned.
+    # We keep the new part after the last PREVIOUS_SAMPLES of the previous part in case START was cut at the end of the previous part,
+    # delayed by the bit detector (if required) so that its traces match the samples.
+    # NOTE: called for every part, works only in pre-allocated buffers (see tests/test_realtime_allocations.py)
+    def updateDecoderBuffer(self, samples):
+        dataDecimated = self.decimator.process(samples)
+        # every sample passes once through the bit detector
+        self.levelTracker.update(dataDecimated)
+        dataComplete = self.decoder_buffer
+        dataComplete[:self.PREVIOUS_SAMPLES] = dataComplete[audioSettings.DECODER_N:]
+        delay = len(self.delay_line)
+        if delay > 0:
+            dataComplete[self.PREVIOUS_SAMPLES:self.PREVIOUS_SAMPLES + delay] = self.delay_line
+            self.delay_line[:] = dataDecimated[audioSettings.DECODER_N - delay:]
+            dataComplete[self.PREVIOUS_SAMPLES + delay:] = dataDecimated[:audioSettings.DECODER_N - delay]
+        else:
+            dataComplete[self.PREVIOUS_SAMPLES:] = dataDecimated
+        return dataComplete
+
+    # forget the decoded samples, the state of the decimator and the traces of the bit detector
+    def resetDecoderBuffer(self):
+        self.decimator.reset()
+        self.levelTracker.reset()
+        self.decoder_buffer[:] = 0.0
+        self.delay_line[:] = 0.0
+
+    # back-to-back telegrams: when a telegram ends inside the buffer (e.g. decoded or discarded on error),
+    # the search of the next telegram resumes right after it in the rest of the same buffer, because the next telegram may follow without gap.
+    # sample_buffer shall end with the last part decoded.
+    def resumeSearch(self, sample_buffer):
+        while self.parse_state == SEARCH_PREAMBLE:
+            frame_end_pos = self.getFrameEndSamplePosition(len(sample_buffer))
+            # NOTE: the rest of the buffer still ends with the last part, as required by the bit detector
+            rest_buffer = sample_buffer[frame_end_pos:]
+            sync = self.synchronizeFrame(rest_buffer)
+            if sync[1] >= SYNC_LOCK_MIN_QUALITY:
+                startSamplePosition = self.getStartSamplePosition(rest_buffer, sync, SYNC_LOCK_MIN_QUALITY)
+                # found START?
+                if startSamplePosition >= 0:
+                    logging.info("Detected START at position "+str(frame_end_pos + startSamplePosition)+" after the previous telegram")
+                    self.parse_state = DECODE_FRAME
+                    # DECODE telegram (which may end in this buffer as well)
+                    ############
+                    self.decodeTelegram()
+                    continue
+            # PREAMBLE of the next telegram begins at the end of the buffer? then we search START in the next part,
+            # where the rest of the PREAMBLE may be too short to be detected
+            # (not needed with PN_PREAMBLE, we correlate each part anyway)
+            if (not audioSettings.PN_PREAMBLE) and self.isPreambleAtEnd(rest_buffer):
+                logging.info("Detected PREAMBLE after the previous telegram")
+                self.preambleDetector.nr_of_triggers += 1
+                self.parse_state = SEARCH_START
+            return
+        
+    # sample position in the buffer (which ends with the last part decoded) after the last bit consumed by decodeTelegram()
+    def getFrameEndSamplePosition(self, buffer_len):
+        remaining_bits = self.telegram_bits_end_pos - self.telegram_bits_start_pos
+        frame_end_pos = buffer_len + self.next_bit_pos - remaining_bits*(audioSettings.DECODER_LEN_BIT_ONE + self.bit_len_correction)
+        return min(max(int(frame_end_pos), 0), buffer_len)
+        
+    # True if most of the last bits (after TERMINATOR) are strong ONEs, as in the PREAMBLE
+    def isPreambleAtEnd(self, sample_buffer):
+        nr_of_bits = min(len(sample_buffer)//audioSettings.DECODER_LEN_BIT_ONE - audioSettings.TELEGRAM_TERMINATOR_LEN_BYTES*8, 8)
+        if nr_of_bits <= 0:
+            return False
+        level_one, level_zero = self.bitLevels(sample_buffer, len(sample_buffer) - nr_of_bits*audioSettings.DECODER_LEN_BIT_ONE, nr_of_bits)
+        return np.count_nonzero(level_one > np.maximum(level_zero, audioSettings.FFT_DETECTION_LEVEL)) > nr_of_bits//2
+        
+    # called from the "main loop" of the GUI, which reads the RX ring buffer with its own cursor
+    def isPlotDataAvailable(self):
+        return self.rxRingBuffer.available(READER_PLOTTER) >= audioSettings.N
+        
+    # returns FFT or time signal of the most recent part of size N, older parts not plotted yet are skipped
+    def getPlotData(self):
+        plot_data = self.rxRingBuffer.readLatest(READER_PLOTTER, audioSettings.N)
+        if plot_data is None:
+            return None
+        ############################
+        # filter coding-range (remove left and right frequencies with Voice content)
+        ###########################################
+        # NOTE: sosfilt returns a new array, the view on the ring buffer is NOT modified
+        if configuration.PLOT_CODE_ONLY:
+            plot_data, self.z = signal.sosfilt(self.sos_bandpass, plot_data, zi=self.z)
+        # plot FFT or time signal
+        if configuration.PLOT_FFT:
+            # TODO: shall we better use a data length which is 2^x  to calculate FFT ?
+            ##########################################
+            # authors of Numpy recommend using FFT from ScyPy instead
+            # Windowing the signal with a dedicated window function helps mitigate spectral leakage,
+            # but tests show better results without windowing, probably due to the reduced number of samples.
+            # rfft for real input is faster than fft
+            ### w = blackman(audioSettings.N)
+            ffty = rfft(plot_data) ###*w)
+            absfft = 2.0 * abs(ffty[:audioSettings.N//2])/audioSettings.N
+            # downsample FFT of data before plotting
+            return absfft[::audioSettings.DOWNSAMPLE]
+        # downsample data before plotting
+        return plot_data[::audioSettings.DOWNSAMPLE]
+        
+    def getRxOverruns(self):
+        return self.rx_overruns
+        
+    # Idle listening (no call active): blocks of IDLE_LISTENING_PARTS parts are evaluated only with the energy gate on the input samples,
+    # without decimation, bit detector nor spectrum.
+    # The last part of a block is evaluated again at the beginning of the next block, so there is always a part before the first code-like part,
+    # which is decoded as well to fill the buffers of the decoder again.
+    # Returns True if the block was discarded, False if the decoding shall continue (idle listening was left).
+    def listenIdle(self):
+        block_len = IDLE_LISTENING_PARTS*audioSettings.N
+        if self.rxRingBuffer.wait(READER_DECODER, block_len, DECODE_WAIT_TIMEOUT_SEC) == False:
+            return True
+        levels = getToneLevels(self.rxRingBuffer.peek(READER_DECODER, block_len), self.idle_basis)
+        code_like = np.flatnonzero(np.max(levels, axis=1) > IDLE_GATE_FACTOR*self.preambleDetector.getThreshold(self.preamble_bin))
+        if len(code_like) == 0:
+            # the noise floor follows also during idle listening (the first part was evaluated with the previous block)
+            for level in levels[1:, 0]:
+                self.preambleDetector.precheck(level, self.preamble_bin)
+            self.rxRingBuffer.skip(READER_DECODER, block_len - audioSettings.N)
+            return True
+        # decode beginning with the part before the first code-like part,
+        # the samples of the decoder from before idle listening are not continuous with it
+        self.rxRingBuffer.skip(READER_DECODER, max(code_like[0] - 1, 0)*audioSettings.N)
+        self.resetDecoderBuffer()
+        self.idle_listening = False
+        self.quiet_parts = 0
+        logging.debug("leave idle listening")
+        return False
+        
+    # enter idle listening after IDLE_LISTENING_PARTS parts without code-like levels while no call is active and no telegram is being decoded
+    def updateIdleListening(self, gate_levels):
+        if audioSettings.IDLE_LISTENING and (self.rx_state == IDLE) and (self.parse_state == SEARCH_PREAMBLE) and \
+            (np.max(gate_levels) <= IDLE_GATE_FACTOR*self.preambleDetector.getThreshold(self.preamble_bin)):
+            self.quiet_parts += 1
+            if self.quiet_parts >= IDLE_LISTENING_PARTS:
+                self.idle_listening = True
+                logging.debug("enter idle listening")
+        else:
+            self.quiet_parts = 0
+        
+    # PREAMBLE detections which did not lead to a START, per part of audio searched
+    def getPreambleFalseTriggerRate(self):
+        return self.preambleDetector.getFalseTriggerRate()
+        
     # to visualize RX volume
     def updateRxVolume(self, data):
         tempMax = np.amax(data)*100.0
@@ -1284,6 +2107,9 @@ class AudioReceiver():
         self.seqNrAck[0] = 0
         self.seqNrAckRx[0] = 0
         self.seqNrTx[0] = 0
+        self.reorder_buffer.clear()
+        self.harq_buffer.clear()
+        self.peer_capabilities[0] = 0
         self.call_end = False
         # TODO: reset here also other flags, counters, etc.???
         '''
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import threading
+
+'''
+Preallocated ring buffer for audio samples with a single writer (the audio callback)
+and several independent readers (e.g. decoder, plotter, recorder), each with its own read cursor.
+
+The samples are stored twice, in two consecutive halves of the buffer (mirror),
+so that ANY window of up to capacity samples is a contiguous slice, and readers obtain views instead of copies:
+
+    sample i is stored at:   i%capacity   and   i%capacity + capacity
+
+     ______________________________________
+    |    first half       |    second half     |
+     --------------------------------------
+              |________________|
+                 window wrapping around the end of the first half = contiguous slice
+
+Cursors and the write counter are absolute sample counters (they never wrap).
+The writer never blocks nor allocates memory, a reader which falls behind by more than the capacity
+loses the oldest samples (overrun), which is counted, and continues with the most recent ones.
+'''
+
+
+class AudioRingBuffer():
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffer = np.zeros(2*capacity, dtype=np.float32)
+        # total nr. of samples written
+        self.write_count = 0
+        # read cursors, overrun counters and events of the readers, indexed by reader name
+        self.cursors = {}
+        self.overruns = {}
+        self.events = {}
+
+    def addReader(self, name):
+        # a new reader starts with the samples written from now on
+        self.cursors[name] = self.write_count
+        self.overruns[name] = 0
+        self.events[name] = threading.Event()
+
+    # called from the audio callback, len(samples) shall not exceed the capacity
+    def write(self, samples):
+        nr_of_samples = len(samples)
+        pos = self.write_count%self.capacity
+        first = min(nr_of_samples, self.capacity - pos)
+        self.buffer[pos:pos + first] = samples[:first]
+        self.buffer[pos + self.capacity:pos + self.capacity + first] = samples[:first]
+        if first < nr_of_samples:
+            rest = nr_of_samples - first
+            self.buffer[:rest] = samples[first:]
+            self.buffer[self.capacity:self.capacity + rest] = samples[first:]
+        # this increment makes the new samples visible to the readers
+        self.write_count += nr_of_samples
+        for event in self.events.values():
+            event.set()
+
+    def available(self, name):
+        return self.write_count - self.cursors[name]
+
+    # BLOCKING call until at least nr_of_samples are available for reader name or timeout (in seconds) expired
+    def wait(self, name, nr_of_samples, timeout=None):
+        event = self.events[name]
+        while self.available(name) < nr_of_samples:
+            event.clear()
+            # check again, the writer may have set the event before we cleared it
+            if self.available(name) >= nr_of_samples:
+                break
+            if event.wait(timeout) == False:
+                return False
+        return True
+
+    # Returns a view on the next nr_of_samples of reader name and advances its cursor,
+    # or None if not enough samples are available yet.
+    # The view begins history samples before the cursor, these samples were already returned in a previous read
+    # (e.g. needed to find a marker which was cut at the end of the previous read).
+    # NOTE: the view is only valid until the writer overwrites it, that is, as long as the reader does not fall behind by the capacity.
+    def read(self, name, nr_of_samples, history=0):
+        cursor = self.cursors[name]
+        if self.write_count - cursor < nr_of_samples:
+            return None
+        # overrun?
+        if self.write_count - (cursor - history) > self.capacity:
+            self.overruns[name] += 1
+            # continue with the most recent samples
+            cursor = self.write_count - nr_of_samples
+        self.cursors[name] = cursor + nr_of_samples
+        start = (cursor - history)%self.capacity
+        return self.buffer[start:start + history + nr_of_samples]
+
+    # Returns a view on the next nr_of_samples of reader name WITHOUT advancing its cursor (see skip()),
+    # or None if not enough samples are available yet.
+    def peek(self, name, nr_of_samples):
+        cursor = self.cursors[name]
+        if self.write_count - cursor < nr_of_samples:
+            return None
+        # overrun?
+        if self.write_count - cursor > self.capacity:
+            self.overruns[name] += 1
+            # continue with the most recent samples
+            cursor = self.write_count - nr_of_samples
+            self.cursors[name] = cursor
+        start = cursor%self.capacity
+        return self.buffer[start:start + nr_of_samples]
+
+    # advances the cursor of reader name by nr_of_samples (at most up to the samples written)
+    def skip(self, name, nr_of_samples):
+        self.cursors[name] = min(self.cursors[name] + nr_of_samples, self.write_count)
+
+    # Returns a view on the last nr_of_samples written and moves the cursor of reader name to the end (skipping older samples),
+    # or None if less than nr_of_samples were written since the last read.
+    def readLatest(self, name, nr_of_samples):
+        if self.available(name) < nr_of_samples:
+            return None
+        self.cursors[name] = self.write_count - nr_of_samples
+        return self.read(name, nr_of_samples)
+
+    def getOverruns(self, name):
+        return self.overruns[name]
@@ -73,8 +73,34 @@ CHANNEL_DELAY_MS = CHANNEL_DELAY_CABLE_MS
 CHANNEL_DELAY_SEC = float(CHANNEL_DELAY_MS/1000.0)
 # max. resends
 MAX_RESENDS = 3
-# detect using Grötzel algorithm NOT USED FOR NOW..
+# ARQ window: max. nr. of telegrams with sequence number sent and not yet acknowledged
+# 1 = stop-and-wait, > 1 = sliding window with selective repeat (shall be the same on both sides, max. ARQ_MAX_WINDOW_SIZE)
+ARQ_WINDOW_SIZE = 1
+ARQ_MAX_WINDOW_SIZE = 32
+# retransmission timeout adapted to the measured roundtrip time, otherwise the fixed TX_RETRANSMISSION_SEC is used
+ADAPTIVE_RTO = True
+# hybrid ARQ: combine the soft bits of damaged copies of a telegram (same seqNr) and check the checksum again
+HARQ_SOFT_COMBINING = True
+# forward error correction of telegrams (convolutional code with interleaver), used in a call if both sides enable it
+FEC_ENABLED = False
+# frame check of telegrams: 0 = XOR checksum, 16 = CRC-16, 32 = CRC-32 (CRC used in a call if the other side supports it)
+FRAME_CHECK_CRC_BITS = 16
+ALLOWED_FRAME_CHECK_CRC_BITS = [0, 16, 32]
+# short pseudo-noise PREAMBLE (PN_PREAMBLE_BYTES) instead of TELEGRAM_PREAMBLE_LEN_BYTES of 0xFF, used in a call if both sides enable it,
+# the receiver then searches telegrams with the correlation detector only (without the detection of FREQ_ONE in the long PREAMBLE)
+PN_PREAMBLE = False
+# adaptive threshold of the PREAMBLE detector, following the noise floor with a constant false alarm rate (FFT_DETECTION_LEVEL is then the min. threshold)
+PREAMBLE_CFAR = True
+# while no call is active, evaluate the input in blocks with an energy gate only (low CPU load when nothing is received)
+IDLE_LISTENING = True
+# frame aggregation: messages waiting in the TX queue are sent together in one telegram (COMMAND_AGGREGATE), used in a call if both sides enable it
+FRAME_AGGREGATION = True
+# detect using Grötzel algorithm instead of FFT (PREAMBLE and bits)
 DETECT_USING_GROETZEL = False
+# detect bits using a quadrature FM discriminator in complex baseband instead of the DFT bins of the bits (set on start)
+DETECT_USING_DISCRIMINATOR = False
+# modulate with continuous-phase FSK (phase accumulator) instead of ONE and ZERO snippets beginning each with phase 0 (set on start)
+CONTINUOUS_PHASE_FSK = False
 # value of "carrier" frequency determined during tests. 200Hz and 400Hz work also but nr. of samples not round.
 CARRIER_FREQUENCY_HZ = 375
 CARRIER_AMPLITUDE = 0.01 # 0.01 # 0.05
@@ -117,6 +143,9 @@ TELEGRAM_MAX_LEN_BYTES = 32 # 32 # 256 # 512 # 1024 # 2048 # 4096 ...
 # TELEGRAM_PREAMBLE_LEN_BYTES can be 2,4,8,16,...,max= TELEGRAM_MAX_LEN_BYTES/MAX_NR_OF_CHUNKS_PER_TELEGRAM
 # that is, it has to fit exactly a number of times inside AUDIO_RX_CHUNK_SAMPLES_LEN so we can split incoming audio data into arrays of PREAMBLE length
 TELEGRAM_PREAMBLE_LEN_BYTES = 4 # 4 # 8 # NOTE: *** shall be "exactly" divisible by TELEGRAM_PREAMBLE_LEN_BYTES so we obtain an int rounds in thread_decode
+# short PREAMBLE: the bits of PN_PREAMBLE_BYTES followed by START have low autocorrelation sidelobes (max. 5 of 16 bits),
+# so the correlation detector locks on START without the long PREAMBLE (saves 3 bytes per telegram)
+PN_PREAMBLE_BYTES = b"\xE2"
 START_LEN_BYTES = 1
 ADDRESS_LEN_BYTES = 1
 SEQ_NR_LEN_BYTES = 1
@@ -125,6 +154,8 @@ COMMAND_LEN_BYTES = 1
 DATA_SIZE_LEN_BYTES = 1 # limits max. data-len to 255 bytes
 END_LEN_BYTES = 1
 CHECKSUM_LEN_BYTES = 1
+CRC16_LEN_BYTES = 2
+CRC32_LEN_BYTES = 4
 # WORKAROUND: the "Terminator" shall get rid of signal deformation at the end of the bit-stream, or even "echoes" produced by previous ones which may falsify the last bits of the checksum.
 TELEGRAM_TERMINATOR_LEN_BYTES = 1 # 1 # TELEGRAM_PREAMBLE_LEN_BYTES
 HEADER_LEN_BYTES = START_LEN_BYTES + ADDRESS_LEN_BYTES + SEQ_NR_LEN_BYTES + SEQ_NR_LEN_BYTES + COMMAND_LEN_BYTES + DATA_SIZE_LEN_BYTES
@@ -152,6 +183,8 @@ COMMAND_CHAT_DATA_START = 0x0A
 COMMAND_CHAT_DATA_PART = 0x0B
 COMMAND_CHAT_DATA_END = 0x0C
 COMMAND_CHAT_DATA = 0x0D
+COMMAND_TELEGRAM_NACK = 0x0E # sent on reception of a damaged telegram, data = expected seqNr - NOT answered with ACK
+COMMAND_AGGREGATE = 0x0F # data = several sub-messages COMMAND | DATA_SIZE | DATA, with increased seqNr, answered with ACK
 # especial commands 
 COMMAND_ERROR = 0x7E
 COMMAND_BROADCAST = 0x7F
@@ -160,6 +193,18 @@ COMMAND_TELEGRAM_ACK = 0x80
 # masks
 COMMAND_MASK = 0x7F
 ACK_MASK = 0x80
+# capabilities announced in CALL and CALL ACCEPTED (one byte of data), a feature is used in the call if both sides support it
+CAPABILITY_FEC = 0x01
+CAPABILITY_CRC = 0x02 # reception of FRAME_FORMAT_CRC16 and FRAME_FORMAT_CRC32
+CAPABILITY_PN_PREAMBLE = 0x04 # reception of telegrams with PN_PREAMBLE_BYTES
+CAPABILITY_AGGREGATE = 0x08 # reception of COMMAND_AGGREGATE
+# length of the header of each sub-message in COMMAND_AGGREGATE
+AGGREGATE_SUB_HEADER_LEN_BYTES = COMMAND_LEN_BYTES + DATA_SIZE_LEN_BYTES
+# frame formats, identified by the ADDRESS byte (Hamming distance of at least 4 to each other and to telegramFec.FEC_MARKER)
+FRAME_FORMAT_XOR = 0x01 # XOR checksum (CHECKSUM_LEN_BYTES) calculated on bytes from START to last byte of DATA
+FRAME_FORMAT_CRC16 = 0x0E # CRC-16 (CRC16_LEN_BYTES) calculated on bytes from START to END
+FRAME_FORMAT_CRC32 = 0xF1 # CRC-32 (CRC32_LEN_BYTES) calculated on bytes from START to END
+FRAME_CHECK_LEN_BYTES = {FRAME_FORMAT_XOR: CHECKSUM_LEN_BYTES, FRAME_FORMAT_CRC16: CRC16_LEN_BYTES, FRAME_FORMAT_CRC32: CRC32_LEN_BYTES}
 ######################
 # command strings
 CMD_STR = [""]*255
@@ -177,6 +222,8 @@ CMD_STR[COMMAND_CHAT_DATA_START] = "DATA START"
 CMD_STR[COMMAND_CHAT_DATA_PART] = "DATA PART"
 CMD_STR[COMMAND_CHAT_DATA_END] = "DATA END"
 CMD_STR[COMMAND_CHAT_DATA] = "DATA"
+CMD_STR[COMMAND_TELEGRAM_NACK] = "NACK"
+CMD_STR[COMMAND_AGGREGATE] = "AGGREGATE"
 CMD_STR[COMMAND_ERROR] = "ERROR"
 CMD_STR[COMMAND_BROADCAST] = "BROADCAST"
 CMD_STR[COMMAND_TELEGRAM_ACK] = "ACK"
@@ -331,6 +378,37 @@ try:
         if "MAX_RESENDS" in config["myConfig"]:
             audioSettings.MAX_RESENDS = config.getint('myConfig','MAX_RESENDS')
             print("MAX_RESENDS = ",  audioSettings.MAX_RESENDS)
+        if "ARQ_WINDOW_SIZE" in config["myConfig"]:
+            audioSettings.ARQ_WINDOW_SIZE = min(max(config.getint('myConfig','ARQ_WINDOW_SIZE'), 1), audioSettings.ARQ_MAX_WINDOW_SIZE)
+            print("ARQ_WINDOW_SIZE = ",  audioSettings.ARQ_WINDOW_SIZE)
+        if "ADAPTIVE_RTO" in config["myConfig"]:
+            audioSettings.ADAPTIVE_RTO = config.getboolean('myConfig','ADAPTIVE_RTO')
+            print("ADAPTIVE_RTO = ",  audioSettings.ADAPTIVE_RTO)
+        if "HARQ_SOFT_COMBINING" in config["myConfig"]:
+            audioSettings.HARQ_SOFT_COMBINING = config.getboolean('myConfig','HARQ_SOFT_COMBINING')
+            print("HARQ_SOFT_COMBINING = ",  audioSettings.HARQ_SOFT_COMBINING)
+        if "FEC_ENABLED" in config["myConfig"]:
+            audioSettings.FEC_ENABLED = config.getboolean('myConfig','FEC_ENABLED')
+            print("FEC_ENABLED = ",  audioSettings.FEC_ENABLED)
+        if "FRAME_CHECK_CRC_BITS" in config["myConfig"]:
+            audioSettings.FRAME_CHECK_CRC_BITS = config.getint('myConfig','FRAME_CHECK_CRC_BITS')
+            print("FRAME_CHECK_CRC_BITS = ",  audioSettings.FRAME_CHECK_CRC_BITS)
+            # check FRAME_CHECK_CRC_BITS
+            if audioSettings.FRAME_CHECK_CRC_BITS not in ALLOWED_FRAME_CHECK_CRC_BITS:
+                print("ERROR: configuration problem, check the value of FRAME_CHECK_CRC_BITS in .ini file. Change to default 16.")
+                audioSettings.FRAME_CHECK_CRC_BITS = 16
+        if "PN_PREAMBLE" in config["myConfig"]:
+            audioSettings.PN_PREAMBLE = config.getboolean('myConfig','PN_PREAMBLE')
+            print("PN_PREAMBLE = ",  audioSettings.PN_PREAMBLE)
+        if "PREAMBLE_CFAR" in config["myConfig"]:
+            audioSettings.PREAMBLE_CFAR = config.getboolean('myConfig','PREAMBLE_CFAR')
+            print("PREAMBLE_CFAR = ",  audioSettings.PREAMBLE_CFAR)
+        if "IDLE_LISTENING" in config["myConfig"]:
+            audioSettings.IDLE_LISTENING = config.getboolean('myConfig','IDLE_LISTENING')
+            print("IDLE_LISTENING = ",  audioSettings.IDLE_LISTENING)
+        if "FRAME_AGGREGATION" in config["myConfig"]:
+            audioSettings.FRAME_AGGREGATION = config.getboolean('myConfig','FRAME_AGGREGATION')
+            print("FRAME_AGGREGATION = ",  audioSettings.FRAME_AGGREGATION)
         if "CARRIER_FREQUENCY_HZ" in config["myConfig"]:
             audioSettings.CARRIER_FREQUENCY_HZ = config.getint('myConfig','CARRIER_FREQUENCY_HZ')
             print("CARRIER_FREQUENCY_HZ = ",  audioSettings.CARRIER_FREQUENCY_HZ)
@@ -343,6 +421,15 @@ try:
         if "REMOVE_RX_CARRIER" in config["myConfig"]:
             audioSettings.REMOVE_RX_CARRIER = config.getboolean('myConfig','REMOVE_RX_CARRIER')
             print("REMOVE_RX_CARRIER = ",  audioSettings.REMOVE_RX_CARRIER)
+        if "DETECT_USING_GROETZEL" in config["myConfig"]:
+            audioSettings.DETECT_USING_GROETZEL = config.getboolean('myConfig','DETECT_USING_GROETZEL')
+            print("DETECT_USING_GROETZEL = ",  audioSettings.DETECT_USING_GROETZEL)
+        if "DETECT_USING_DISCRIMINATOR" in config["myConfig"]:
+            audioSettings.DETECT_USING_DISCRIMINATOR = config.getboolean('myConfig','DETECT_USING_DISCRIMINATOR')
+            print("DETECT_USING_DISCRIMINATOR = ",  audioSettings.DETECT_USING_DISCRIMINATOR)
+        if "CONTINUOUS_PHASE_FSK" in config["myConfig"]:
+            audioSettings.CONTINUOUS_PHASE_FSK = config.getboolean('myConfig','CONTINUOUS_PHASE_FSK')
+            print("CONTINUOUS_PHASE_FSK = ",  audioSettings.CONTINUOUS_PHASE_FSK)
 except (configparser.NoSectionError, configparser.MissingSectionHeaderError):
     print("Exception raised in init.loadConfigFile() trying to load config file!\n")
     pass
@@ -395,7 +482,13 @@ TX_RX_PROCESSING_SEC = (3*TX_POLL_PERIOD_SEC)*2 # *2 is security factor due to r
 AUDIO_CHUNK_DELAY_SEC = (AUDIO_TX_CHUNK_SAMPLES_LEN//SAMPLING_FREQUENCY)
 TX_RETRANSMISSION_SEC = (2*TELEGRAM_MAX_LEN_SECONDS + 2*CHANNEL_DELAY_SEC + TX_RX_PROCESSING_SEC + AUDIO_CHUNK_DELAY_SEC) 
 TX_RETRANSMISSION_POLL_PERIODS_SHORT = int(TX_RETRANSMISSION_SEC/TX_POLL_PERIOD_SEC)
-TX_RETRANSMISSION_POLL_PERIODS_LONG = int(1.5*TX_RETRANSMISSION_POLL_PERIODS_SHORT)
+# half of the times we retry after a longer time (factor applied to the fixed or to the adaptive retransmission timeout)
+TX_RETRANSMISSION_LONG_FACTOR = 1.5
+TX_RETRANSMISSION_POLL_PERIODS_LONG = int(TX_RETRANSMISSION_LONG_FACTOR*TX_RETRANSMISSION_POLL_PERIODS_SHORT)
+# limits of the adaptive retransmission timeout:
+# the ACK may come with the longest telegram of the other side, and a channel slower than configured may need more than TX_RETRANSMISSION_SEC
+RTO_MIN_SEC = 2*TELEGRAM_MAX_LEN_SECONDS
+RTO_MAX_SEC = 4*TX_RETRANSMISSION_SEC
 print("TX_RETRANSMISSION_POLL_PERIODS_SHORT = "+str(TX_RETRANSMISSION_POLL_PERIODS_SHORT))
 print("TX_RETRANSMISSION_POLL_PERIODS_LONG = "+str(TX_RETRANSMISSION_POLL_PERIODS_LONG))
 # NOTE: reduce AUDIO_RX_CHUNK_SAMPLES_LEN for faster recognition of
@@ -413,11 +506,25 @@ ONE = ONE.reshape(-1, 1)
 ZERO = ZERO.reshape(-1, 1)
 # carrier
 CARRIER = CARRIER_AMPLITUDE * np.sin(2 * np.pi * CARRIER_FREQUENCY_HZ * t[:AUDIO_TX_CHUNK_SAMPLES_LEN])
-CARRIER = CARRIER.reshape(-1, 1)
-SILENCE = [[0.0]]*AUDIO_TX_CHUNK_SAMPLES_LEN
+# NOTE: float32 as the output of the audio callbacks, so the carrier is added in place without a temporary cast
+CARRIER = CARRIER.reshape(-1, 1).astype(np.float32)
+SILENCE = np.zeros((AUDIO_TX_CHUNK_SAMPLES_LEN, 1))
 # for FFT, plot
 N = TELEGRAM_PREAMBLE_LEN_SAMPLES # //2 # *2 # FFT on audio-input-chunks..
 print("N = "+str(N))
+# decoder rate:
+# the receiver selects the code band and decimates by DECIMATION_FACTOR before synchronization and demodulation (see Decimator in audioReceiver).
+# The factor is the biggest divisor of LEN_BIT_ONE and LEN_BIT_ZERO (bits keep an integer nr. of samples) which still leaves
+# DECIMATION_MIN_SAMPLES_PER_CYCLE samples per cycle of the highest code frequency, e.g. 48kHz / 5 = 9.6kHz in channel 5.
+DECIMATION_MIN_SAMPLES_PER_CYCLE = 4
+DECIMATION_FACTOR = max(d for d in range(1, LEN_BIT_ONE + 1) if (LEN_BIT_ONE%d == 0) and (LEN_BIT_ZERO%d == 0) and
+                                      (SAMPLING_FREQUENCY/d >= DECIMATION_MIN_SAMPLES_PER_CYCLE*max(CODE_SINE_FREQUENCY_ONE, CODE_SINE_FREQUENCY_ZERO)))
+DECODER_SAMPLING_FREQUENCY = SAMPLING_FREQUENCY//DECIMATION_FACTOR
+DECODER_LEN_BIT_ONE = LEN_BIT_ONE//DECIMATION_FACTOR
+DECODER_START_LEN_SAMPLES = START_LEN_SAMPLES//DECIMATION_FACTOR
+DECODER_N = N//DECIMATION_FACTOR
+print("DECIMATION_FACTOR = "+str(DECIMATION_FACTOR))
+print("DECODER_SAMPLING_FREQUENCY = "+str(DECODER_SAMPLING_FREQUENCY))
 # sample spacing
 T = (1.0 / SAMPLING_FREQUENCY)
 # check:
@@ -474,7 +581,9 @@ def updateDerivedAudioSettings():
     audioSettings.AUDIO_CHUNK_RESOLUTION_DELAY_SEC = audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN/audioSettings.SAMPLING_FREQUENCY
     audioSettings.TX_RETRANSMISSION_SEC = 2*audioSettings.TELEGRAM_MAX_LEN_SECONDS + 2*audioSettings.CHANNEL_DELAY_SEC + audioSettings.TX_RX_PROCESSING_SEC + audioSettings.AUDIO_CHUNK_RESOLUTION_DELAY_SEC 
     audioSettings.TX_RETRANSMISSION_POLL_PERIODS_SHORT = int(audioSettings.TX_RETRANSMISSION_SEC/audioSettings.TX_POLL_PERIOD_SEC)
-    audioSettings.TX_RETRANSMISSION_POLL_PERIODS_LONG = int(1.5*audioSettings.TX_RETRANSMISSION_POLL_PERIODS_SHORT)
+    audioSettings.TX_RETRANSMISSION_POLL_PERIODS_LONG = int(audioSettings.TX_RETRANSMISSION_LONG_FACTOR*audioSettings.TX_RETRANSMISSION_POLL_PERIODS_SHORT)
+    audioSettings.RTO_MIN_SEC = 2*audioSettings.TELEGRAM_MAX_LEN_SECONDS
+    audioSettings.RTO_MAX_SEC = 4*audioSettings.TX_RETRANSMISSION_SEC
     audioSettings.t = np.linspace(0.0, audioSettings.TELEGRAM_MAX_LEN_SAMPLES, audioSettings.TELEGRAM_MAX_LEN_SAMPLES) / audioSettings.SAMPLING_FREQUENCY
     audioSettings.t = audioSettings.t.reshape(-1, 1)
     audioSettings.ONE = audioSettings.AMPLITUDE * np.sin(2 * np.pi * audioSettings.CODE_SINE_FREQUENCY_ONE * audioSettings.t[:audioSettings.LEN_BIT_ONE])
@@ -483,9 +592,15 @@ def updateDerivedAudioSettings():
     ###audioSettings.CARRIER[0:audioSettings.SAMPLING_FREQUENCY//audioSettings.CARRIER_FREQUENCY_HZ] = 5.0*audioSettings.CARRIER[0:audioSettings.SAMPLING_FREQUENCY//audioSettings.CARRIER_FREQUENCY_HZ]
     audioSettings.ONE = audioSettings.ONE.reshape(-1, 1)
     audioSettings.ZERO = audioSettings.ZERO.reshape(-1, 1)
-    audioSettings.CARRIER = audioSettings.CARRIER.reshape(-1, 1)
-    audioSettings.SILENCE = [[0.]]*audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN
+    audioSettings.CARRIER = audioSettings.CARRIER.reshape(-1, 1).astype(np.float32)
+    audioSettings.SILENCE = np.zeros((audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN, 1))
     audioSettings.N = audioSettings.TELEGRAM_PREAMBLE_LEN_SAMPLES # *2
+    audioSettings.DECIMATION_FACTOR = max(d for d in range(1, audioSettings.LEN_BIT_ONE + 1) if (audioSettings.LEN_BIT_ONE%d == 0) and (audioSettings.LEN_BIT_ZERO%d == 0) and
+                                      (audioSettings.SAMPLING_FREQUENCY/d >= audioSettings.DECIMATION_MIN_SAMPLES_PER_CYCLE*max(audioSettings.CODE_SINE_FREQUENCY_ONE, audioSettings.CODE_SINE_FREQUENCY_ZERO)))
+    audioSettings.DECODER_SAMPLING_FREQUENCY = audioSettings.SAMPLING_FREQUENCY//audioSettings.DECIMATION_FACTOR
+    audioSettings.DECODER_LEN_BIT_ONE = audioSettings.LEN_BIT_ONE//audioSettings.DECIMATION_FACTOR
+    audioSettings.DECODER_START_LEN_SAMPLES = audioSettings.START_LEN_SAMPLES//audioSettings.DECIMATION_FACTOR
+    audioSettings.DECODER_N = audioSettings.N//audioSettings.DECIMATION_FACTOR
     audioSettings.BIN_FREQUENCY_ONE = int(round(audioSettings.CODE_SINE_FREQUENCY_ONE*audioSettings.N/audioSettings.SAMPLING_FREQUENCY))
     audioSettings.BIN_FREQUENCY_ZERO = int(round(audioSettings.CODE_SINE_FREQUENCY_ZERO*audioSettings.N/audioSettings.SAMPLING_FREQUENCY))
     audioSettings.BIN_FREQUENCY_ONE_FINE = int(round(audioSettings.CODE_SINE_FREQUENCY_ONE*audioSettings.LEN_BIT_ONE/audioSettings.SAMPLING_FREQUENCY))
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import threading
+
+'''
+Preallocated ring of fixed-size audio slots (one telegram per slot) with a single producer (the sender thread)
+and a single consumer (the audio callback), without locks:
+
+    producer:   slot = reserve()  ->  write samples into slot  ->  commit(nr_of_samples)
+    consumer:   readChunk(out) copies (or adds) the next chunk of the oldest committed slot(s) into out
+
+     ___________________________________________
+    | slot 0 | slot 1 | slot 2 | ... | slot n-1 |
+     -------------------------------------------
+                 ^tail (consumer)      ^head (producer)
+
+head and tail are absolute slot counters (they never wrap), each one is written by only one side,
+so head - tail is the occupancy and the slot of a counter is counter%nr_of_slots.
+The producer publishes a slot by incrementing head AFTER writing its samples,
+the consumer releases a slot by incrementing tail AFTER copying its last chunk.
+The consumer never blocks nor allocates memory, the producer blocks in reserve() while all slots are occupied (backpressure)
+and is woken up by the consumer when it releases a slot.
+'''
+
+
+class AudioSlotRing():
+    def __init__(self, nr_of_slots, slot_len):
+        self.nr_of_slots = nr_of_slots
+        self.slot_len = slot_len
+        self.slots = np.zeros((nr_of_slots, slot_len), dtype=np.float32)
+        # nr. of valid samples of each slot, set in commit()
+        self.slot_samples = np.zeros(nr_of_slots, dtype=int)
+        # nr. of slots committed (producer) and released (consumer)
+        self.head = 0
+        self.tail = 0
+        # read position of the consumer inside the slot at tail
+        self.read_pos = 0
+        # signal from consumer to producer
+        self.slot_released = threading.Event()
+        # metrics
+        self.max_occupancy = 0
+        self.blocked_reserves = 0
+
+    def getOccupancy(self):
+        return self.head - self.tail
+
+    def getMaxOccupancy(self):
+        return self.max_occupancy
+
+    # nr. of times the producer had to wait for a free slot
+    def getBlockedReserves(self):
+        return self.blocked_reserves
+
+    # PRODUCER: BLOCKING call until a slot is free or timeout (in seconds) expired,
+    # returns the slot to be written (the complete slot, valid samples are set with commit()) or None on timeout.
+    def reserve(self, timeout=None):
+        if self.head - self.tail >= self.nr_of_slots:
+            self.blocked_reserves += 1
+            while self.head - self.tail >= self.nr_of_slots:
+                self.slot_released.clear()
+                # check again, the consumer may have released a slot before we cleared the event
+                if self.head - self.tail < self.nr_of_slots:
+                    break
+                if self.slot_released.wait(timeout) == False:
+                    return None
+        return self.slots[self.head%self.nr_of_slots]
+
+    # PRODUCER: publish the slot obtained with reserve() containing nr_of_samples
+    def commit(self, nr_of_samples):
+        self.slot_samples[self.head%self.nr_of_slots] = nr_of_samples
+        # this increment makes the slot visible to the consumer
+        self.head += 1
+        self.max_occupancy = max(self.max_occupancy, self.head - self.tail)
+
+    # CONSUMER: copy (or add, with add=True) the next len(out) samples into out,
+    # returns False if no slot is committed (out is not modified).
+    # NOTE: the slots are streamed back to back, a chunk may contain the end of a slot and the beginning of the next one.
+    #            The samples after the end of the last committed slot are zero-padded.
+    def readChunk(self, out, add=False):
+        if self.head == self.tail:
+            return False
+        out_pos = 0
+        while (out_pos < len(out)) and (self.head != self.tail):
+            slot = self.tail%self.nr_of_slots
+            chunk_len = min(len(out) - out_pos, self.slot_samples[slot] - self.read_pos)
+            chunk = self.slots[slot, self.read_pos:self.read_pos + chunk_len]
+            if add:
+                out[out_pos:out_pos + chunk_len] += chunk
+            else:
+                out[out_pos:out_pos + chunk_len] = chunk
+            out_pos += chunk_len
+            self.read_pos += chunk_len
+            if self.read_pos >= self.slot_samples[slot]:
+                self.read_pos = 0
+                # this increment releases the slot to the producer
+                self.tail += 1
+                self.slot_released.set()
+        if not add:
+            out[out_pos:] = 0.0
+        return True
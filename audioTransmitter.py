@@ -3,14 +3,18 @@
 import audioSettings
 import queue
 import numpy as np
-import bitarray
 from scipy import signal
-import math
 import configuration
 import time
-import threading
 from timeit import default_timer as cProfileTimer
+from ringModulator import RingModulator
+from telegramModulator import TelegramModulator
+from rtoEstimator import RtoEstimator
+from telegramFec import TelegramFec
+import telegramCrc
+from audioSlotRing import AudioSlotRing
 import logging
+from dataclasses import dataclass
 from cryptography.hazmat.primitives.asymmetric import x25519
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives import padding
@@ -61,6 +65,30 @@ Q = 3.0  # Quality factor
 # definitions for transmission state
 IDLE = 0
 WAIT_ACK = 1
+# thread_send_message wakes up on events (message queued, ACK received, ACK to be sent, stream off) or on the retransmission deadline,
+# without any event it checks its state anyway after this time
+TX_MAX_IDLE_WAIT_SEC = 1.0
+# while the TX slot ring is full we log a warning every
+TX_SLOT_RESERVE_TIMEOUT_SEC = 1.0
+# commands with increased seqNr, they need to be acknowledged by the other side
+SEQUENCED_COMMANDS = (audioSettings.COMMAND_CHAT_DATA, audioSettings.COMMAND_CHAT_DATA_START, audioSettings.COMMAND_CHAT_DATA_PART,
+                      audioSettings.COMMAND_CHAT_DATA_END, audioSettings.COMMAND_STARTUP_DATA_COMPLETE,
+                      audioSettings.COMMAND_CALL_REJECTED, audioSettings.COMMAND_CALL_END, audioSettings.COMMAND_AGGREGATE)
+# commands of the TX queue which can be sent together in one COMMAND_AGGREGATE (with increased seqNr, processed in order by the other side)
+AGGREGATABLE_COMMANDS = (audioSettings.COMMAND_CHAT_DATA, audioSettings.COMMAND_CHAT_DATA_START, audioSettings.COMMAND_CHAT_DATA_PART,
+                         audioSettings.COMMAND_CHAT_DATA_END, audioSettings.COMMAND_STARTUP_DATA_COMPLETE)
+
+
+# telegram in the window of the windowed ARQ, sent and not yet acknowledged
+@dataclass
+class SentTelegram:
+    command: int
+    data: bytearray
+    deadline: float # retransmission deadline (time.monotonic())
+    nr_of_resends: int
+    send_time: float # cProfileTimer() of first transmission, to calculate the roundtrip time
+    fast_retransmit: bool = False # retransmission requested with NACK, without backoff of the retransmission timeout
+    timer_start: float = 0.0 # time.monotonic() when the retransmission timer was (re)started
 
 
 class AudioTransmitter: 
@@ -69,7 +97,10 @@ class AudioTransmitter:
     # transmitting while receiving. Sometimes telegrams will just cross.
     # this is no problem because we have different lines for TX and for RX, unless we have "collissions", or in fact "disturbances due e.g. to EM-cross-talk"
     # For such cases we need to retransmit with a random timeout so we dont collide infinitely.
-    TX_RETRANSMISSION_POLL_PERIODS = 0
+    # The timeout itself is adapted to the measured roundtrip time.
+    rtoEstimator = None
+    # time.monotonic() of the last backoff of the RTO, timers started before expire with the same timeout event
+    last_backoff_time = 0.0
     # protocol
     seqNrTx = [0] # reference to sequence number TX
     seqNrAck = [0] # reference to sequence number for ACK
@@ -89,25 +120,12 @@ class AudioTransmitter:
     BPF_F2 = audioSettings.CODE_SINE_FREQUENCY_ZERO + BPF_RIGHT_MARGIN
     BSF_F1 = audioSettings.CODE_SINE_FREQUENCY_ONE - BSF_LEFT_MARGIN
     BSF_F2 = audioSettings.CODE_SINE_FREQUENCY_ZERO + BSF_RIGHT_MARGIN
-    # lock to manage concurrency between audio callback and transmission thread
-    messageLock = threading.Lock()
-    # variables to implement a circular buffer
-    telegramNrWrite = 0
-    telegramNrRead = 0
-    chunkNrWrite = 0
-    chunkNrRead = 0
-    telegramNrReadSize = None
     #################################################
-    # NOTE: about audioChunkRef[]
-    # old-fashioned-straight-forward-way using an indexed numpy ndarray is BETTER than
-    # other approaches like memoryview or objects supporting buffer protocol because:
-    # - also fast or even faster
-    # - easier to understand (KISS)
-    # - long-living solution -> other approaches change frequently!
-    # - can be protected against concurrency by using a lock on one index and a size variable
-    # - note that audioChunkRef itself does not need to be locked because we always access 
-    #   a different part of it, so concurrency is solved with indexes.
-    audioChunkRef = None
+    # NOTE: about txSlotRing
+    # single-producer (thread_send_message) single-consumer (audio callback) ring of telegram slots,
+    # a pre-allocated numpy ndarray accessed with indexes, without locks (see audioSlotRing.py).
+    # sendAudioMessageSeq() blocks while all slots are occupied, the callback copies one chunk per call.
+    txSlotRing = None
     #################################################
     # TODO: better module variable?
     noAudioInput = None
@@ -118,12 +136,27 @@ class AudioTransmitter:
     transmit_on_ref = None # reference to flag for half-duplex communication
     ack_received = [False, 0] # reference to flag for ACK received
     send_ack = [False] # reference to flag for send ACK
+    send_nack = [False] # reference to flag for send NACK
+    nack_received = [False, 0] # reference to flag for NACK received
+    # time of the last NACK sent (time.monotonic()), we send at most one NACK per retransmission timeout
+    last_nack_time = 0.0
     reject_call = False
     end_call = False
     comm_token = [0]
+    # condition notified on communication events, shared with audioReceiver and soundDeviceManager
+    comm_event = None
+    # windowed ARQ: telegrams sent and not yet acknowledged as {seqNr: SentTelegram},
+    # data of the ACK to be sent and window and selective ACKs received from the other side (set by audioReceiver)
+    send_window = None
+    sack_to_send = [bytearray(0)]
+    sack_received = [audioSettings.ARQ_WINDOW_SIZE, []]
+    # capabilities of the other side (e.g. CAPABILITY_FEC, set by audioReceiver)
+    peer_capabilities = [0]
     # queues
     outTextMessageQueue = queue.Queue()
     outCommStatusQueue = queue.Queue()
+    # message taken from outTextMessageQueue by aggregateMessages() which did not fit in the aggregate, it is sent next
+    look_ahead_message = None
     # time
     avg_tx_time_ms = 0.0
     time_old = 0.0
@@ -158,6 +191,8 @@ class AudioTransmitter:
         self.stream_on = glob_vars[0].stream_on
         self.ack_received = glob_vars[0].ack_received
         self.send_ack = glob_vars[0].send_ack
+        self.send_nack = glob_vars[0].send_nack
+        self.nack_received = glob_vars[0].nack_received
         self.seqNrAck = glob_vars[0].seqNrAck
         self.seqNrAckRx = glob_vars[0].seqNrAckRx
         self.seqNrTx = glob_vars[0].seqNrTx
@@ -166,22 +201,25 @@ class AudioTransmitter:
         self.transmit_on_ref = glob_vars[0].transmit_on_ref
         self.receive_on_ref = glob_vars[0].receive_on_ref
         self.comm_token = glob_vars[0].comm_token
+        self.comm_event = glob_vars[0].comm_event
+        self.sack_to_send = glob_vars[0].sack_to_send
+        self.sack_received = glob_vars[0].sack_received
+        self.peer_capabilities = glob_vars[0].peer_capabilities
+        self.send_window = {}
         self.telTxOk = 0
         self.telTxNok = 0
-        # size
-        self.telegramNrReadSize = [0]*audioSettings.MAX_NR_OF_TELEGRAMS_IN_PARALLEL
         # ACK timeout handling
-        self.TX_RETRANSMISSION_POLL_PERIODS = audioSettings.TX_RETRANSMISSION_POLL_PERIODS_SHORT
+        self.rtoEstimator = RtoEstimator(audioSettings.TX_RETRANSMISSION_SEC, audioSettings.RTO_MIN_SEC, audioSettings.RTO_MAX_SEC)
         logging.info("Initializing audioTransmitter")
-        logging.info("TX_RETRANSMISSION_POLL_PERIODS = "+str(self.TX_RETRANSMISSION_POLL_PERIODS))
+        logging.info("TX_RETRANSMISSION_SEC = "+str(audioSettings.TX_RETRANSMISSION_SEC))
         logging.info("Allocating memory...")
         #################################################
         ###print("Allocating memory...")
         # pre-allocate buffer (not allocating memory during runtime icreases performance!)
-        # this buffer allocates all samples of up to MAX_NR_OF_TELEGRAMS_IN_PARALLEL telegrams with each having up to MAX_NR_OF_CHUNKS_PER_TELEGRAM chunks
-        # under normal conditions we will transmit less than max.telegrams each having a different number of chunks generally smaller than max.chunks
-        # TODO: some day try instead using a queue as in audioReceiver, it may work better or reduce the complexity of the code.
-        self.audioChunkRef = np.array([[0.0]]*audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN*audioSettings.MAX_NR_OF_CHUNKS_PER_TELEGRAM*audioSettings.MAX_NR_OF_TELEGRAMS_IN_PARALLEL)
+        # this buffer allocates all samples of up to MAX_NR_OF_TELEGRAMS_IN_PARALLEL telegrams, each slot has space for the longest telegram,
+        # that is, a whole nr. of chunks for TELEGRAM_MAX_LEN_BITS bits of the longest code symbol.
+        chunks_per_slot = -(-max(audioSettings.LEN_BIT_ONE, audioSettings.LEN_BIT_ZERO)*audioSettings.TELEGRAM_MAX_LEN_BITS//audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN)
+        self.txSlotRing = AudioSlotRing(audioSettings.MAX_NR_OF_TELEGRAMS_IN_PARALLEL, chunks_per_slot*audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN)
         logging.info("Memory allocation finished.")
         ###print("Memory allocation finished.")
         #################################################
@@ -210,6 +248,16 @@ class AudioTransmitter:
         Z, P, K = signal.tf2zpk(b, a)
         self.sos_notch = signal.zpk2sos(Z, P, K)
         self.zNotch = np.zeros((self.sos_notch.shape[0], 2))
+        # distort voice with modulating frequency f0 (removed afterwards with the NOTCH filter)
+        self.distortModulator = RingModulator(f0, audioSettings.SAMPLING_FREQUENCY, audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN)
+        # modulator of CODE with cached PREAMBLE, START and TERMINATOR
+        self.telegramModulator = TelegramModulator()
+        # forward error correction of telegrams, used if negotiated with the other side
+        self.telegramFec = TelegramFec()
+        self.fec_max_body_len = self.telegramFec.getMaxBodyLen()
+        # frame check of telegrams with CRC
+        self.crc16 = telegramCrc.getCrc16(audioSettings.TELEGRAM_MAX_LEN_BYTES)
+        self.crc32 = telegramCrc.getCrc32(audioSettings.TELEGRAM_MAX_LEN_BYTES)
         # status
         self.outCommStatusQueue.put("") # ("TX:")
     
@@ -231,56 +279,29 @@ class AudioTransmitter:
         # put message to TX out:
         ##############
         try:
-            readMessage = False # to help reduce blocking time
-            readIndexTemp = 0
-            # BLOCKING code block...but acceptable because it blocks only very seldom and very shortly
-            ####################################################
-            with self.messageLock:
-                # NEW chunk ?
-                if (self.telegramNrRead != self.telegramNrWrite):
-                    readIndexTemp = self.telegramNrRead*audioSettings.MAX_NR_OF_CHUNKS_PER_TELEGRAM+self.chunkNrRead*audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN
-                    readMessage = True
-                    # set half-duplex flag
-                    if self.transmit_on_ref[0]  == False:
-                        self.transmit_on_ref[0] = True
-                        logging.info("TX ON")
-                else:
-                    # reset half-duplex flag
-                    if self.transmit_on_ref[0]:
-                        self.transmit_on_ref[0] = False
-                        logging.info("TX OFF")
-            # this part is not blocking any more
-            ####################################################
-            if readMessage == True:
-                # write chunk
-                outdata[:audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN] = self.audioChunkRef[readIndexTemp:readIndexTemp+audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN]
-                # increment chunk number
-                self.chunkNrRead = (self.chunkNrRead + 1)%self.telegramNrReadSize[self.telegramNrRead]
-                # increment telegram counter
-                if self.chunkNrRead == 0:
-                    self.telegramNrRead = (self.telegramNrRead + 1)%audioSettings.MAX_NR_OF_TELEGRAMS_IN_PARALLEL
+            # write chunk (lock-free, constant time)
+            if self.txSlotRing.readChunk(outdata[:audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN, audioSettings.DEFAULT_CHANNEL]):
+                # set half-duplex flag
+                if self.transmit_on_ref[0]  == False:
+                    self.transmit_on_ref[0] = True
+                    logging.info("TX ON")
             else:
-                outdata[:frames] = audioSettings.SILENCE
+                outdata[:frames].fill(0.0)
+                # reset half-duplex flag
+                if self.transmit_on_ref[0]:
+                    self.transmit_on_ref[0] = False
+                    logging.info("TX OFF")
             # add carrier
             ########
             if audioSettings.ADD_CARRIER:
                 # reduce amplitude of voice so we dont saturate output when adding carrier
-                outdata[:audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN] = (1.0 - audioSettings.CARRIER_AMPLITUDE)*outdata[:audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN]
+                # NOTE: in place, no temporary arrays in the audio callback
+                outdata[:audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN] *= (1.0 - audioSettings.CARRIER_AMPLITUDE)
                 # add carrier
                 outdata[:audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN] += audioSettings.CARRIER
         except Exception as e:
             logging.error("Exception in AudioTransmitter.callback_play():"+str(e)+"\n")
              
-    ##############################################################
-    # TODO: use or implement something better..
-    currSample = 0
-    def distortFunction(self,  x):
-        ret = x*math.sin(2 * np.pi *f0*self.currSample/audioSettings.SAMPLING_FREQUENCY)*2
-        self.currSample += 1
-        return ret
-    distort = np.vectorize(distortFunction)
-    ##############################################################
-            
     def callback_wire_out(self,  indata, outdata, frames, time, status):
         # store time
         self.avg_tx_time_ms = (float(time.currentTime) - self.time_old)*1000.0
@@ -292,9 +313,8 @@ class AudioTransmitter:
         if configuration.TRANSMIT_IN_TX_VOICE:
             # distort?
             if configuration.IN_TX_DISTORT:
-                self.currSample = 0
-                # DISTORT voice
-                outdata[:frames, audioSettings.DEFAULT_CHANNEL] = self.distort(self, indata[:frames, audioSettings.DEFAULT_CHANNEL])
+                # DISTORT voice (ring modulation with continuous phase across blocks)
+                self.distortModulator.process(indata[:frames, audioSettings.DEFAULT_CHANNEL], outdata[:frames, audioSettings.DEFAULT_CHANNEL])
                 # remove modulating frequency
                 outdata[:, audioSettings.DEFAULT_CHANNEL], self.zNotch = signal.sosfilt(self.sos_notch, outdata[:, audioSettings.DEFAULT_CHANNEL], zi=self.zNotch)
                 # deplete coding frequency range to not interfere with code
@@ -320,40 +340,23 @@ class AudioTransmitter:
         # add message to TX in
         #############
         try:
-            readMessage = False # to help reduce blocking time
-            readIndexTemp = 0
-            # BLOCKING code block...but acceptable because it blocks only very seldom and very shortly
-            ####################################################
-            with self.messageLock:
-                # NEW chunk ?
-                if (self.telegramNrRead != self.telegramNrWrite):
-                    readIndexTemp = self.telegramNrRead*audioSettings.MAX_NR_OF_CHUNKS_PER_TELEGRAM+self.chunkNrRead*audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN
-                    readMessage = True
-                    # set half-duplex flag
-                    if self.transmit_on_ref[0]  == False:
-                        self.transmit_on_ref[0] = True
-                        logging.info("TX ON")
-                else:
-                    # reset half-duplex flag
-                    if self.transmit_on_ref[0]:
-                        self.transmit_on_ref[0] = False
-                        logging.info("TX OFF")
-            # this part is not blocking any more
-            ####################################################
-            if readMessage == True:
-                # write chunk
-                outdata[:audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN] = outdata[:audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN] + \
-                                                                                                  self.audioChunkRef[readIndexTemp:readIndexTemp+audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN]
-                # increment chunk number
-                self.chunkNrRead = (self.chunkNrRead + 1)%self.telegramNrReadSize[self.telegramNrRead]
-                # increment telegram counter
-                if self.chunkNrRead == 0:
-                    self.telegramNrRead = (self.telegramNrRead + 1)%audioSettings.MAX_NR_OF_TELEGRAMS_IN_PARALLEL
+            # add chunk (lock-free, constant time)
+            if self.txSlotRing.readChunk(outdata[:audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN, audioSettings.DEFAULT_CHANNEL], add=True):
+                # set half-duplex flag
+                if self.transmit_on_ref[0]  == False:
+                    self.transmit_on_ref[0] = True
+                    logging.info("TX ON")
+            else:
+                # reset half-duplex flag
+                if self.transmit_on_ref[0]:
+                    self.transmit_on_ref[0] = False
+                    logging.info("TX OFF")
             # add carrier
             ########
             if audioSettings.ADD_CARRIER:
                 # reduce amplitude of voice so we dont saturate output when adding carrier
-                outdata[:audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN] = (1.0 - audioSettings.CARRIER_AMPLITUDE)*outdata[:audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN]
+                # NOTE: in place, no temporary arrays in the audio callback
+                outdata[:audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN] *= (1.0 - audioSettings.CARRIER_AMPLITUDE)
                 # add carrier
                 outdata[:audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN] += audioSettings.CARRIER
         except Exception as e: # queue.Empty:
@@ -363,29 +366,140 @@ class AudioTransmitter:
     # a chance to successfully transmit in case we are having collissions due to simultaneous transmissions from both sides.
     # NOTE: for TX and RX we have different physical channels, so it is NOT exactly COLLISSIONS what we have
     #            but probably interferences e.g. due to "cross-talk" (EM coupling between lines).
-    def randomRetryTimeout(self):
+    # The timeout is estimated from the measured roundtrip times (or fixed with ADAPTIVE_RTO = False), in seconds.
+    # Also called from soundDeviceManager for the timeouts of the handshake.
+    def getRetransmissionTimeout(self):
+        timeout = self.getBaseRetransmissionTimeout()
         rnd = np.random.randint(2)
-        if rnd:
-            self.TX_RETRANSMISSION_POLL_PERIODS = audioSettings.TX_RETRANSMISSION_POLL_PERIODS_SHORT
-        else:
-            self.TX_RETRANSMISSION_POLL_PERIODS = audioSettings.TX_RETRANSMISSION_POLL_PERIODS_LONG
+        if rnd == 0:
+            timeout *= audioSettings.TX_RETRANSMISSION_LONG_FACTOR
+        return timeout
+        
+    # retransmission timeout without random factor
+    def getBaseRetransmissionTimeout(self):
+        if audioSettings.ADAPTIVE_RTO:
+            return self.rtoEstimator.getRto()
+        return audioSettings.TX_RETRANSMISSION_SEC
+        
+    # called when no ACK or answer was received within the retransmission timeout
+    def backoffRetransmissionTimeout(self):
+        self.rtoEstimator.backoff()
+        self.last_backoff_time = time.monotonic()
+        
+    # roundtrip time in seconds measured with a telegram which was not retransmitted
+    def addRoundtripTimeSample(self, rtt):
+        self.rtoEstimator.addSample(rtt)
+        logging.info("RTT = "+str(rtt)+", RTO = "+str(self.rtoEstimator.getRto()))
             
     # called from soundDeviceManager, and it in turn from GUI-triggered-thread
     def call_once(self):
-        msg = [audioSettings.COMMAND_CALL, bytearray([self.comm_token[0]])]
+        msg = [audioSettings.COMMAND_CALL, bytearray([self.comm_token[0], self.getCapabilities()])]
         # will be processed in thread_send_message after get() from queue and call to sendAudioMessage()
-        self.outTextMessageQueue.put(msg) 
+        self.queueMessage(msg)
         
     def call_accept(self):
-        msg = [audioSettings.COMMAND_CALL_ACCEPTED, bytearray(0)]
+        msg = [audioSettings.COMMAND_CALL_ACCEPTED, bytearray([self.getCapabilities()])]
         # will be processed in thread_send_message after get() from queue and call to sendAudioMessage()
-        self.outTextMessageQueue.put(msg) 
+        self.queueMessage(msg)
         
     def call_reject(self):
         self.reject_call = True
+        self.notifyCommEvent()
         
     def call_end(self):
         self.end_call = True
+        self.notifyCommEvent()
+        
+    # our capabilities, announced in CALL and CALL ACCEPTED
+    def getCapabilities(self):
+        # we always receive telegrams with CRC
+        capabilities = audioSettings.CAPABILITY_CRC
+        if audioSettings.FEC_ENABLED:
+            capabilities |= audioSettings.CAPABILITY_FEC
+        if audioSettings.PN_PREAMBLE:
+            capabilities |= audioSettings.CAPABILITY_PN_PREAMBLE
+        if audioSettings.FRAME_AGGREGATION:
+            capabilities |= audioSettings.CAPABILITY_AGGREGATE
+        return capabilities
+        
+    # FEC is used if both sides support it
+    def isFecActive(self):
+        return audioSettings.FEC_ENABLED and ((self.peer_capabilities[0] & audioSettings.CAPABILITY_FEC) != 0)
+        
+    # short PN PREAMBLE is used if both sides support it
+    def isPnPreambleActive(self):
+        return audioSettings.PN_PREAMBLE and ((self.peer_capabilities[0] & audioSettings.CAPABILITY_PN_PREAMBLE) != 0)
+        
+    # frame aggregation is used if both sides support it
+    def isAggregationActive(self):
+        return audioSettings.FRAME_AGGREGATION and ((self.peer_capabilities[0] & audioSettings.CAPABILITY_AGGREGATE) != 0)
+        
+    # frame aggregation: the messages waiting in the queue right after the message just taken from it (command, data)
+    # are packed together with it in one COMMAND_AGGREGATE, as long as they fit in the DATA of one telegram.
+    # The sub-messages then share PREAMBLE, header, frame check, the ACK and the half-duplex turn.
+    # Returns command and data to be sent.
+    def aggregateMessages(self, command, data):
+        if (not self.isAggregationActive()) or (command not in AGGREGATABLE_COMMANDS):
+            return command, data
+        max_len = self.getDataMaxLenBytes()
+        aggregated_data = bytearray([command, len(data)]) + data
+        nr_of_messages = 1
+        msg = self.getNextMessage()
+        while msg is not None:
+            next_data = msg[1] if msg[1] is not None else bytearray(0)
+            if (msg[0] not in AGGREGATABLE_COMMANDS) or \
+                (len(aggregated_data) + audioSettings.AGGREGATE_SUB_HEADER_LEN_BYTES + len(next_data) > max_len):
+                # keep the message which does not fit, it is sent next
+                self.look_ahead_message = msg
+                break
+            aggregated_data += bytearray([msg[0], len(next_data)]) + next_data
+            nr_of_messages += 1
+            msg = self.getNextMessage()
+        if nr_of_messages == 1:
+            return command, data
+        logging.info("Aggregated "+str(nr_of_messages)+" messages in one telegram")
+        return audioSettings.COMMAND_AGGREGATE, aggregated_data
+        
+    # NON-blocking, returns the next message to be sent (the look-ahead message first) or None
+    def getNextMessage(self):
+        if self.look_ahead_message is not None:
+            msg = self.look_ahead_message
+            self.look_ahead_message = None
+            return msg
+        try:
+            return self.outTextMessageQueue.get_nowait()
+        except queue.Empty:
+            return None
+        
+    def isMessagePending(self):
+        return (self.look_ahead_message is not None) or (self.outTextMessageQueue.empty() == False)
+        
+    # frame format of the telegrams sent: with CRC if configured and supported by the other side
+    # (e.g. CALL is sent with XOR checksum because we dont know yet the capabilities of the other side)
+    def getFrameFormat(self):
+        if (self.peer_capabilities[0] & audioSettings.CAPABILITY_CRC) != 0:
+            if audioSettings.FRAME_CHECK_CRC_BITS == 32:
+                return audioSettings.FRAME_FORMAT_CRC32
+            elif audioSettings.FRAME_CHECK_CRC_BITS == 16:
+                return audioSettings.FRAME_FORMAT_CRC16
+        return audioSettings.FRAME_FORMAT_XOR
+        
+    # max. nr. of data bytes per telegram, lower with CRC and with FEC so that the telegrams are not longer
+    def getDataMaxLenBytes(self):
+        check_extra_len = audioSettings.FRAME_CHECK_LEN_BYTES[self.getFrameFormat()] - audioSettings.CHECKSUM_LEN_BYTES
+        if self.isFecActive():
+            return max(self.telegramFec.getMaxDataLen() - check_extra_len, 0)
+        return audioSettings.DATA_MAX_LEN_BYTES - check_extra_len
+        
+    # wake up threads waiting on comm_event (e.g. thread_send_message) to check their state immediately
+    def notifyCommEvent(self):
+        with self.comm_event:
+            self.comm_event.notify_all()
+        
+    def queueMessage(self, msg):
+        # will be processed in thread_send_message after get() from queue and call to sendAudioMessage()
+        self.outTextMessageQueue.put(msg)
+        self.notifyCommEvent()
         
     def pollErrorMessage(self):
         ret = self.errorMessage
@@ -396,35 +510,75 @@ class AudioTransmitter:
     def isTxStateWaitAck(self):
         return (self.tx_state == WAIT_ACK)
     
+    # called with comm_event locked, True if thread_send_message has something to do in the current state
+    def isTxEventPending(self):
+        if self.stream_on[0] == False:
+            return True
+        if self.send_nack[0] or self.nack_received[0]:
+            return True
+        if audioSettings.ARQ_WINDOW_SIZE > 1:
+            return self.ack_received[0] or self.send_ack[0] or \
+                (self.canSendNewTelegram() and (self.isMessagePending() or self.reject_call or self.end_call))
+        if self.tx_state == IDLE:
+            return self.isMessagePending() or self.reject_call or self.end_call or self.send_ack[0]
+        return self.ack_received[0]
+        
+    # deadline for the retransmission of the last telegram, using a monotonic clock
+    def getRetransmissionDeadline(self):
+        return time.monotonic() + self.getRetransmissionTimeout()
+    
     def thread_send_message(self, name):
         # store info for retransmissions
         old_data = bytearray(0)
         old_command = audioSettings.COMMAND_NONE
-        nr_polls = 0
+        retransmission_deadline = 0.0
         nr_of_resends = 0
+        fast_retransmit = False
         # statistics
         startRoundtripTime = 0.0
         logging.info("enter thread_send_message")
         # main loop of thread:
         while self.stream_on[0]:
             try:
-                # state machine
-                if self.tx_state == IDLE:
+                # received a damaged telegram? ask the other side to re-send it
+                if self.send_nack[0] == True:
+                    self.send_nack[0] = False
+                    self.sendNack()
+                # received a NACK? the other side received our telegram damaged, we re-send it at once (fast retransmit)
+                if self.nack_received[0] == True:
+                    self.nack_received[0] = False
+                    if audioSettings.ARQ_WINDOW_SIZE > 1:
+                        sent = self.send_window.get(self.nack_received[1])
+                        if sent is not None:
+                            sent.deadline = time.monotonic()
+                            sent.fast_retransmit = True
+                    elif (self.tx_state == WAIT_ACK) and (self.nack_received[1] == self.seqNrTx[0]):
+                        retransmission_deadline = time.monotonic()
+                        fast_retransmit = True
+                # windowed ARQ
+                if audioSettings.ARQ_WINDOW_SIZE > 1:
+                    self.processSendWindow()
+                    # next retransmission deadline
+                    if self.send_window:
+                        retransmission_deadline = min(sent.deadline for sent in self.send_window.values())
+                # state machine (stop-and-wait)
+                elif self.tx_state == IDLE:
                     msg = []
                     data = bytearray(0)
                     command = audioSettings.COMMAND_NONE
                     # BLOCKING call on queue to obtain TEXT MESSAGE data from GUI
                     #######################################
-                    if self.outTextMessageQueue.empty() == False:
-                        msg = self.outTextMessageQueue.get() # .get_nowait()
+                    if self.isMessagePending():
+                        msg = self.getNextMessage()
                         command = msg[0]
                         if msg[1] is not None:
                             data = msg[1]
+                        command, data = self.aggregateMessages(command, data)
                     # send command with or without data
                     # we may need to increment seqNr (but only for some commands!)
                     if  (command == audioSettings.COMMAND_CHAT_DATA) or (command == audioSettings.COMMAND_CHAT_DATA_START) or \
                         (command == audioSettings.COMMAND_CHAT_DATA_PART) or (command == audioSettings.COMMAND_CHAT_DATA_END) or \
-                        (command == audioSettings.COMMAND_STARTUP_DATA_COMPLETE):
+                        (command == audioSettings.COMMAND_STARTUP_DATA_COMPLETE) or (command == audioSettings.COMMAND_AGGREGATE):
                         self.seqNrTx[0] = (self.seqNrTx[0] + 1)%255
                         self.tx_state = WAIT_ACK
                     elif self.reject_call:
@@ -440,9 +594,8 @@ class AudioTransmitter:
                     # workaround
                     ########
                     elif command == audioSettings.COMMAND_CALL:
-                        self.seqNrAck[0] = 0
-                        self.seqNrAckRx[0] = 0
-                        self.seqNrTx[0] = 0
+                        # SeqNrs and RTO
+                        self.resetSendWindow()
                         logging.info("SeqNrs reset on CALL!")
                     # "append" ACK to command if required
                     if self.send_ack[0] == True:
@@ -451,9 +604,7 @@ class AudioTransmitter:
                     # send telegram
                     if  command != audioSettings.COMMAND_NONE:
                         # reset flags
-                        nr_polls = 0
                         nr_of_resends = 0
-                        self.randomRetryTimeout()
                         old_data = data
                         old_command = command
                         ##############
@@ -462,13 +613,10 @@ class AudioTransmitter:
                         ##############
                         # LONG-BLOCKING calls to sendAudioMessage()
                         self.sendAudioMessage(command, data)
+                        retransmission_deadline = self.getRetransmissionDeadline()
                         # status
                         self.outCommStatusQueue.put("TX: "+audioSettings.CMD_STR[command]) # +", data = "+str(data))
                         
-                        # TEST
-                        if audioSettings.CMD_STR[command] == "":
-                            time.sleep(1)
-                            
                         ########
                         # because of half-duplex communication we don't want to "force" the transmission of
                         # "consecutive" telegrams, especially in the case of ACKs which may be triggered right before or after
@@ -493,6 +641,9 @@ class AudioTransmitter:
                             #############
                             # update roundtrip time
                             self.avg_roundtrip_time_ms = (self.ack_received[1]- startRoundtripTime)*1000.0
+                            # only with telegrams which were not repeated, otherwise we dont know which one was acknowledged
+                            if nr_of_resends == 0:
+                                self.addRoundtripTimeSample(self.ack_received[1]- startRoundtripTime)
                             #############
                             self.tx_state = IDLE
                             # statistics
@@ -504,7 +655,7 @@ class AudioTransmitter:
                             self.telTxNok += 1
                             logging.error("ERROR: Got an ACK but not for the last telegram we sent!")
                     # retransmission timer expired?
-                    elif (self.tx_state == WAIT_ACK) and (nr_polls > self.TX_RETRANSMISSION_POLL_PERIODS):
+                    elif (self.tx_state == WAIT_ACK) and (time.monotonic() >= retransmission_deadline) and (nr_of_resends < audioSettings.MAX_RESENDS):
                         # "append" ACK to command if required
                         if self.send_ack[0]:
                             self.send_ack[0] = False
@@ -513,18 +664,17 @@ class AudioTransmitter:
                         # LONG-BLOCKING call
                         self.resendAudioMessage(old_command, old_data)
                         nr_of_resends += 1
-                        nr_polls = 0
-                        self.randomRetryTimeout()
+                        if fast_retransmit:
+                            fast_retransmit = False
+                        else:
+                            self.backoffRetransmissionTimeout()
+                        retransmission_deadline = self.getRetransmissionDeadline()
                         # statistics
                         self.telTxNok += 1
                         logging.info("Retransmitted message due to timeout! Nr. of retransmissions = "+str(nr_of_resends))
                         # status
                         self.outCommStatusQueue.put("TX: "+audioSettings.CMD_STR[old_command]+", resend "+str(nr_of_resends)) # +", data = "+str(old_data))
                         
-                        # TEST
-                        if audioSettings.CMD_STR[old_command] == "":
-                            time.sleep(1)
-                        
                         ########
                         # because of half-duplex communication we don't want to "force" the transmission of
                         # "consecutive" telegrams, especially in the case of ACKs which may be triggered right before or after
@@ -534,8 +684,8 @@ class AudioTransmitter:
                         ### time.sleep(audioSettings.TX_RETRANSMISSION_SEC/2)
                         # increment "retransmission timer" correspondingly
                         ### nr_polls += (audioSettings.TX_RETRANSMISSION_SEC/2)/audioSettings.TX_POLL_PERIOD_SEC
-                    # maximum number of resends exceeded?
-                    elif (self.tx_state == WAIT_ACK) and (nr_of_resends >= audioSettings.MAX_RESENDS):
+                    # maximum number of resends exceeded? (we also waited for the ACK to the last resend)
+                    elif (self.tx_state == WAIT_ACK) and (time.monotonic() >= retransmission_deadline):
                         # reset sequence numbers
                         if old_command == audioSettings.COMMAND_CALL_END:
                             self.seqNrAck[0] = 0
@@ -582,22 +732,166 @@ class AudioTransmitter:
                         # increment "retransmission timer" correspondingly
                         ###nr_polls += (audioSettings.TX_RETRANSMISSION_SEC/2)/audioSettings.TX_POLL_PERIOD_SEC
                     # '''
-                    # increment "retransmission timer"
-                    nr_polls += 1
-                # polling sleep pause
-                time.sleep(audioSettings.TX_POLL_PERIOD_SEC)
+                # wait for the next event or for the retransmission deadline
+                with self.comm_event:
+                    timeout = TX_MAX_IDLE_WAIT_SEC
+                    if self.tx_state == WAIT_ACK:
+                        timeout = min(timeout, max(retransmission_deadline - time.monotonic(), 0.0))
+                    self.comm_event.wait_for(self.isTxEventPending, timeout)
             except Exception as e:
                 logging.error("Exception in AudioTransmitter.thread_send_message():"+str(e)+"\n")
         logging.info("leave thread thread_send_message..")
         
+    # windowed ARQ: we can send a new telegram with increased seqNr if its seqNr fits in the window of the other side
+    # (after the last seqNr acknowledged cumulatively) and if the nr. of telegrams not yet acknowledged is below the advertised receive window
+    def canSendNewTelegram(self):
+        if (self.seqNrTx[0] + 1 - self.seqNrAckRx[0])%255 > audioSettings.ARQ_WINDOW_SIZE:
+            return False
+        return (len(self.send_window) == 0) or (len(self.send_window) < self.sack_received[0])
+        
+    # windowed ARQ: release all telegrams acknowledged cumulatively (up to seqNrAckRx) or selectively
+    def releaseAcknowledgedTelegrams(self):
+        for seqNr in list(self.send_window):
+            if ((self.seqNrAckRx[0] - seqNr)%255 < audioSettings.ARQ_WINDOW_SIZE) or (seqNr in self.sack_received[1]):
+                sent = self.send_window.pop(seqNr)
+                # update roundtrip time (only with telegrams which were not repeated, otherwise we dont know which one was acknowledged)
+                if sent.nr_of_resends == 0:
+                    self.avg_roundtrip_time_ms = (self.ack_received[1] - sent.send_time)*1000.0
+                    self.addRoundtripTimeSample(self.ack_received[1] - sent.send_time)
+                # statistics
+                self.telTxOk += 1
+                logging.info("ACK for SeqNr = "+str(seqNr))
+                # reset sequence numbers
+                if sent.command == audioSettings.COMMAND_CALL_END:
+                    self.resetSendWindow()
+                    logging.info("Reset SeqNrs")
+                    break
+        if not self.send_window:
+            # status
+            self.outCommStatusQueue.put("") # ("TX:")
+            
+    def resetSendWindow(self):
+        self.send_window.clear()
+        # new call or window dropped: the RTO is estimated again from the initial value
+        self.rtoEstimator.reset()
+        self.last_backoff_time = 0.0
+        self.sack_received[0] = audioSettings.ARQ_WINDOW_SIZE
+        self.sack_received[1] = []
+        self.seqNrAck[0] = 0
+        self.seqNrAckRx[0] = 0
+        self.seqNrTx[0] = 0
+        
+    # windowed ARQ (selective repeat), called from thread_send_message instead of the stop-and-wait state machine:
+    # several telegrams with increased seqNr may be sent without waiting for their ACKs, each one has its own
+    # retransmission timer and only the telegrams which are not acknowledged (cumulatively or selectively) are repeated.
+    def processSendWindow(self):
+        # received an ACK?
+        if self.ack_received[0] == True:
+            self.ack_received[0] = False
+            self.releaseAcknowledgedTelegrams()
+        # ACK to be sent? we send a pure ACK containing our receive window and the selective ACKs
+        if self.send_ack[0] == True:
+            self.send_ack[0] = False
+            self.sendAudioMessageSeq(audioSettings.COMMAND_TELEGRAM_ACK, self.sack_to_send[0], self.seqNrAckRx[0])
+        # selective repeat of telegrams with expired retransmission timer
+        now = time.monotonic()
+        for seqNr, sent in list(self.send_window.items()):
+            if now < sent.deadline:
+                continue
+            # maximum number of resends exceeded?
+            if sent.nr_of_resends >= audioSettings.MAX_RESENDS:
+                self.errorMessage = "TX ERROR: Max. nr. of Resends ("+str(audioSettings.MAX_RESENDS)+") exceeded with:\n"+\
+                " seqNr = "+str(seqNr)+"\n"\
+                " data = "+str(sent.data)+"\n"\
+                " command = "+str(sent.command)
+                # statistics
+                self.telTxNok += 1
+                logging.error("ERROR: Max. nr. of Resends ("+str(audioSettings.MAX_RESENDS)+") exceeded with SeqNr = "+str(seqNr)+", \
+                    we just give up here...and drop the complete window")
+                # status
+                self.outCommStatusQueue.put("TX: > resend max "+str(audioSettings.MAX_RESENDS)+", "+audioSettings.CMD_STR[sent.command])
+                self.resetSendWindow()
+                break
+            # retransmit telegram
+            # LONG-BLOCKING call
+            self.resendAudioMessage(sent.command, sent.data, seqNr)
+            sent.nr_of_resends += 1
+            if sent.fast_retransmit:
+                sent.fast_retransmit = False
+            elif sent.timer_start >= self.last_backoff_time:
+                # one backoff per timeout event: the timers of the other telegrams in flight, started before the last backoff,
+                # expire due to the same event (otherwise k telegrams in flight would increase the RTO by 2^k)
+                self.backoffRetransmissionTimeout()
+            sent.deadline = self.getRetransmissionDeadline()
+            sent.timer_start = time.monotonic()
+            # statistics
+            self.telTxNok += 1
+            logging.info("Retransmitted message with SeqNr = "+str(seqNr)+" due to timeout! Nr. of retransmissions = "+str(sent.nr_of_resends))
+            # status
+            self.outCommStatusQueue.put("TX: "+audioSettings.CMD_STR[sent.command]+", resend "+str(sent.nr_of_resends))
+        # send new telegrams while the window is not full
+        while self.canSendNewTelegram():
+            data = bytearray(0)
+            if self.reject_call:
+                self.reject_call = False
+                command = audioSettings.COMMAND_CALL_REJECTED
+            elif self.end_call:
+                self.end_call = False
+                command = audioSettings.COMMAND_CALL_END
+            elif self.isMessagePending():
+                msg = self.getNextMessage()
+                command = msg[0]
+                if msg[1] is not None:
+                    data = msg[1]
+                command, data = self.aggregateMessages(command, data)
+            else:
+                break
+            if command in SEQUENCED_COMMANDS:
+                self.seqNrTx[0] = (self.seqNrTx[0] + 1)%255
+                # LONG-BLOCKING call
+                self.sendAudioMessage(command, data)
+                self.send_window[self.seqNrTx[0]] = SentTelegram(command, data, self.getRetransmissionDeadline(), 0, cProfileTimer(), timer_start=time.monotonic())
+            else:
+                # workaround
+                ########
+                if command == audioSettings.COMMAND_CALL:
+                    self.resetSendWindow()
+                    logging.info("SeqNrs reset on CALL!")
+                # telegrams without increased seqNr repeat the last seqNr acknowledged by the other side
+                # LONG-BLOCKING call
+                self.sendAudioMessageSeq(command, data, self.seqNrAckRx[0])
+            # status
+            self.outCommStatusQueue.put("TX: "+audioSettings.CMD_STR[command])
+        if self.send_window:
+            self.tx_state = WAIT_ACK
+        else:
+            self.tx_state = IDLE
+        
+    # NACK requesting the retransmission of the telegram we expect, at most one NACK per retransmission timeout
+    # so that we dont flood the channel e.g. when noise is detected as damaged telegrams.
+    # The NACK is sent with the last seqNr acknowledged by the other side, so it is not processed as a new telegram.
+    def sendNack(self):
+        now = time.monotonic()
+        if (now - self.last_nack_time) < self.getBaseRetransmissionTimeout():
+            logging.info("NACK suppressed, last NACK sent "+str(now - self.last_nack_time)+" s ago")
+            return
+        self.last_nack_time = now
+        # LONG-BLOCKING call
+        self.sendAudioMessageSeq(audioSettings.COMMAND_TELEGRAM_NACK, bytearray([(self.seqNrAck[0] + 1)%255]), self.seqNrAckRx[0])
+        # status
+        self.outCommStatusQueue.put("TX: "+audioSettings.CMD_STR[audioSettings.COMMAND_TELEGRAM_NACK])
+        
     def sendAudioMessage(self, command, message):
         self.sendAudioMessageSeq(command, message)
             
-    def resendAudioMessage(self, command, message):
-        self.sendAudioMessageSeq(command, message)
+    def resendAudioMessage(self, command, message, seqNr=None):
+        self.sendAudioMessageSeq(command, message, seqNr)
     
     # LONG BLOCKNIG function called from internal thread_send_message
-    def sendAudioMessageSeq(self, command, byte_message):
+    # the telegram is sent with seqNr, by default with the current seqNrTx
+    def sendAudioMessageSeq(self, command, byte_message, seqNr=None):
+        if seqNr is None:
+            seqNr = self.seqNrTx[0]
         logging.info("TX MSG = "+str(byte_message))
         # trap telegrams which are too long
         # TODO: remove, this ASSERT is not needed anymore?
@@ -610,39 +904,44 @@ class AudioTransmitter:
         # get bit array
         # n-bytes PREAMBLE and ONE byte START
         start = 85 # = b"\x55"
-        address = 1 # = b"\x01"
+        # frame format in ADDRESS
+        # (telegrams which dont fit in TELEGRAM_MAX_LEN_BYTES with the longer CRC are sent with XOR checksum)
+        address = self.getFrameFormat()
+        if data_len > audioSettings.DATA_MAX_LEN_BYTES - (audioSettings.FRAME_CHECK_LEN_BYTES[address] - audioSettings.CHECKSUM_LEN_BYTES):
+            address = audioSettings.FRAME_FORMAT_XOR
         logging.info("TX CMD = "+str(command)+" ("+audioSettings.CMD_STR[command]+")")
-        logging.info("    SN = "+str(self.seqNrTx[0]))
+        logging.info("    SN = "+str(seqNr))
         logging.info("    SA = "+str(self.seqNrAck[0]))
-        checksum = 0 # = b"\x00" # start value
         end = b"\xAA" # = 170
-        checksum = checksum^start
-        checksum = checksum^address
-        checksum = checksum^self.seqNrTx[0]
-        checksum = checksum^self.seqNrAck[0]
-        checksum = checksum^command
-        checksum = checksum^data_len
-        for byte in byte_message:
-            checksum = checksum^byte
-        # form telegram bytearray
-        byte_telegram = b"\xFF"*audioSettings.TELEGRAM_PREAMBLE_LEN_BYTES +bytearray([start]) + \
-                                bytearray([address]) + bytearray([self.seqNrTx[0]]) + bytearray([self.seqNrAck[0]]) + \
-                                bytearray([command]) + bytearray([data_len]) + byte_message + end + bytearray([checksum]) + \
-                                b"\x00"*audioSettings.TELEGRAM_TERMINATOR_LEN_BYTES
-        bitarray_telegram = bitarray.bitarray()
-        # form telegram bitarray
-        bitarray_telegram.frombytes(byte_telegram)
-        # update write index
-        localWriteIndex = self.telegramNrWrite*audioSettings.MAX_NR_OF_CHUNKS_PER_TELEGRAM+self.chunkNrWrite*audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN
+        # form telegram bytearray (without the fixed PREAMBLE, START and TERMINATOR which are added by the modulator)
+        byte_body = bytearray([address]) + bytearray([seqNr]) + bytearray([self.seqNrAck[0]]) + \
+                                bytearray([command]) + bytearray([data_len]) + byte_message + end
+        # append frame check
+        if address == audioSettings.FRAME_FORMAT_CRC16:
+            byte_body += self.crc16.calculateBytes(bytearray([start]) + byte_body)
+        elif address == audioSettings.FRAME_FORMAT_CRC32:
+            byte_body += self.crc32.calculateBytes(bytearray([start]) + byte_body)
+        else:
+            checksum = 0 # = b"\x00" # start value
+            checksum = checksum^start
+            checksum = checksum^address
+            checksum = checksum^seqNr
+            checksum = checksum^self.seqNrAck[0]
+            checksum = checksum^command
+            checksum = checksum^data_len
+            for byte in byte_message:
+                checksum = checksum^byte
+            byte_body += bytearray([checksum])
+        # forward error correction (if negotiated in this call and if the coded telegram fits in TELEGRAM_MAX_LEN_BYTES,
+        # otherwise e.g. the parts of the public key are sent without FEC)
+        if self.isFecActive() and (len(byte_body) <= self.fec_max_body_len):
+            byte_body = self.telegramFec.encode(byte_body)
         # transform bits into audio samples
-        currPos = 0
-        for telegram_bit in bitarray_telegram:
-            if telegram_bit:
-                self.audioChunkRef[localWriteIndex + currPos:localWriteIndex + currPos + audioSettings.LEN_BIT_ONE] = audioSettings.ONE
-                currPos = currPos + audioSettings.LEN_BIT_ONE
-            else:
-                self.audioChunkRef[localWriteIndex + currPos:localWriteIndex + currPos + audioSettings.LEN_BIT_ZERO] = audioSettings.ZERO
-                currPos = currPos + audioSettings.LEN_BIT_ZERO
+        if self.isPnPreambleActive():
+            telegram_samples = self.telegramModulator.renderTelegram(start, byte_body, audioSettings.PN_PREAMBLE_BYTES)
+        else:
+            telegram_samples = self.telegramModulator.renderTelegram(start, byte_body)
+        currPos = len(telegram_samples)
         # soften borders of telegram with Gauss-/Normal- shape
         # this shall avoid generating high-frequencies when coding (beginning of sine from silence is like a step-signal):
         #
@@ -652,72 +951,25 @@ class AudioTransmitter:
         #
         # for now we use LEN_BIT_ZERO as a reference for the length because it's usually shorter than LEN_BIT_ONE
         for j in range(0, audioSettings.CODE_TRANSITION_SAMPLES):
-            self.audioChunkRef[localWriteIndex + j] = self.audioChunkRef[localWriteIndex + j] * self.gauss[j]
-            self.audioChunkRef[(localWriteIndex + currPos) - j] = self.audioChunkRef[(localWriteIndex + currPos) - j] * self.gauss[j]
-        # the telegram length in samples is given by the actual combination of ONES and ZEROS which may have different lengths
-        lenBitArray = bitarray_telegram.length()
-        nr_ones = bitarray_telegram.count()
-        nr_zeros = lenBitArray - nr_ones
-        currentTelLenInSamples = audioSettings.LEN_BIT_ONE*nr_ones + audioSettings.LEN_BIT_ZERO*nr_zeros
-        samplesInLastChunk = currPos%audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN
-        # calculate parts to split, that is, the number of chunks
-        if samplesInLastChunk == 0:
-            split_parts = int(currentTelLenInSamples/audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN)
-        else:
-            split_parts = int(currentTelLenInSamples/audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN) + 1
-            # PADDING: fill last empty part of chunk with silence..to have a full chunk filled with enough samples
-            self.audioChunkRef[localWriteIndex + currPos:localWriteIndex + currPos + (audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN - samplesInLastChunk)] = \
-                                                                                        audioSettings.SILENCE[:(audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN - samplesInLastChunk)]
-            currPos = currPos + (audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN - samplesInLastChunk)
-        # trap in case the buffer is full
-        while((self.telegramNrWrite+1)%audioSettings.MAX_NR_OF_TELEGRAMS_IN_PARALLEL == self.telegramNrRead):
-            logging.error("ERROR: biting our tail! Increase size of circular buffer for transmission")
-            # this short delay (positive assumption) may lead to re-entering this while loop several times..
-            time.sleep(audioSettings.AUDIO_CHUNK_DELAY_SEC)
-        # set size of telegram to read BEFORE incrementing writeIndex !!!
-        # NOTE: we don't need a lock here becuse we use a different index than the one possibly being read..
-        if split_parts < audioSettings.MAX_NR_OF_CHUNKS_PER_TELEGRAM:
-            with self.messageLock:
-                self.telegramNrReadSize[self.telegramNrWrite] = split_parts
-        else:
-            with self.messageLock:
-                # for the FIRST telegram - which is filled with max nr of chunks:
-                self.telegramNrReadSize[self.telegramNrWrite] = audioSettings.MAX_NR_OF_CHUNKS_PER_TELEGRAM
-        # LOOP to transmit chunks and telegrams
-        ########################
-        for index in range(split_parts):
-            # calculate index to be used as offset for current chunk position in buffer self.audioChunkRef
-            localWriteIndex = self.telegramNrWrite*audioSettings.MAX_NR_OF_CHUNKS_PER_TELEGRAM+self.chunkNrWrite*audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN
-            # filter signal with coded message because it usually contains frequencies outside the coding range...
-            # besides, we will add CODE "on top" of voice in time domain so they should be in different frequency-ranges to NOT saturate audio interface
-            # fiter CODE
-            self.audioChunkRef[localWriteIndex:localWriteIndex + audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN, audioSettings.DEFAULT_CHANNEL], self.z = \
-                    signal.sosfilt(self.sos_bandpass, self.audioChunkRef[localWriteIndex:localWriteIndex + audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN, audioSettings.DEFAULT_CHANNEL], zi=self.z) 
-            # dont filter CODE
-            ### self.audioChunkRef[localWriteIndex:localWriteIndex + audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN, audioSettings.DEFAULT_CHANNEL] = \
-                    ### self.audioChunkRef[localWriteIndex:localWriteIndex + audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN, audioSettings.DEFAULT_CHANNEL]
-            # increment chunk number
-            self.chunkNrWrite = (self.chunkNrWrite + 1)%audioSettings.MAX_NR_OF_CHUNKS_PER_TELEGRAM
-            # intermediate complete telegram?
-            if self.chunkNrWrite == 0:
-                # then we need to increment telegram counter, but before we update the length of telegram
-                # BLOCKING code block
-                with self.messageLock:
-                    # set telegram size to maximum
-                    self.telegramNrReadSize[self.telegramNrWrite] = audioSettings.MAX_NR_OF_CHUNKS_PER_TELEGRAM
-                    # this increment is like a SIGNAL to the callback
-                    self.telegramNrWrite = (self.telegramNrWrite + 1)%audioSettings.MAX_NR_OF_TELEGRAMS_IN_PARALLEL
-            # or last chunk?
-            elif index == (split_parts - 1):
-                # then we need to increment telegram counter, but before we update the length of telegram
-                # BLOCKING code block
-                with self.messageLock:
-                    # set telegram size to nr. of chunks used
-                    self.telegramNrReadSize[self.telegramNrWrite] = split_parts%audioSettings.MAX_NR_OF_CHUNKS_PER_TELEGRAM
-                    # this increment is like a SIGNAL to the callback
-                    self.telegramNrWrite = (self.telegramNrWrite + 1)%audioSettings.MAX_NR_OF_TELEGRAMS_IN_PARALLEL
-                # reset chunk counter
-                self.chunkNrWrite = 0
+            telegram_samples[j] = telegram_samples[j] * self.gauss[j]
+            telegram_samples[currPos - 1 - j] = telegram_samples[currPos - 1 - j] * self.gauss[j]
+        # get a free slot, BLOCKING while all slots are occupied (backpressure)
+        slot = None
+        while (slot is None) and self.stream_on[0]:
+            slot = self.txSlotRing.reserve(TX_SLOT_RESERVE_TIMEOUT_SEC)
+            if slot is None:
+                logging.warning("TX slot ring full, waiting for the audio output..")
+        if slot is None:
+            return
+        slot[:currPos] = telegram_samples
+        # NOTE: no PADDING to a full chunk, consecutive telegrams are streamed back to back
+        #            (the receiver resumes the search at the end of each telegram)
+        # filter signal with coded message because it usually contains frequencies outside the coding range...
+        # besides, we will add CODE "on top" of voice in time domain so they should be in different frequency-ranges to NOT saturate audio interface
+        # fiter CODE (the complete telegram at once, the filter state continues with the next telegram)
+        slot[:currPos], self.z = signal.sosfilt(self.sos_bandpass, slot[:currPos], zi=self.z)
+        # this call is like a SIGNAL to the callback
+        self.txSlotRing.commit(currPos)
         # end of sendAudioMessage()
         ################
         return
@@ -735,7 +987,7 @@ class AudioTransmitter:
         split_message = []
         msg =[]
         # TODO: any relation with configuration.ENRYPTION_BLOCK_BYTES_LEN ?
-        n =  audioSettings.DATA_MAX_LEN_BYTES
+        n =  self.getDataMaxLenBytes()
         # split?
         if len(encryptedMessage) > n:
             split_message = [encryptedMessage[i:i+n] for i in range(0, len(encryptedMessage), n)]
@@ -750,19 +1002,20 @@ class AudioTransmitter:
                     msg = [audioSettings.COMMAND_CHAT_DATA_END, split_message[i]]
                 else:
                     msg = [audioSettings.COMMAND_CHAT_DATA_PART, split_message[i]]
-                self.outTextMessageQueue.put(msg)
+                self.queueMessage(msg)
         else:
             msg = [audioSettings.COMMAND_CHAT_DATA, encryptedMessage]
             # will be processed in thread_send_message after get() from queue and call to sendAudioMessage()
-            self.outTextMessageQueue.put(msg)
+            self.queueMessage(msg)
     
     def generatePublicKey(self):
         # generate public key for this session
         self.private_key[0] = x25519.X25519PrivateKey.generate()
         public_key = self.private_key[0].public_key()
         public_key_bytes = public_key.public_bytes(encoding=serialization.Encoding.Raw, format=serialization.PublicFormat.Raw)
-        n = audioSettings.DATA_MAX_LEN_BYTES
-        if len(public_key_bytes) > n:
+        # two halves, so that both fit in a telegram with any frame check
+        n = -(-len(public_key_bytes)//2)
+        if len(public_key_bytes) > audioSettings.DATA_MAX_LEN_BYTES:
             public_key_bytes_split = [public_key_bytes[i:i+n] for i in range(0, len(public_key_bytes), n)]
             self.key_start = public_key_bytes_split[0]
             self.key_end = public_key_bytes_split[1]
@@ -773,12 +1026,12 @@ class AudioTransmitter:
     def send_key_start_once(self):
         msg = [audioSettings.COMMAND_KEY_START, self.key_start]
         # will be processed in thread_send_message after get() from queue and call to sendAudioMessage()
-        self.outTextMessageQueue.put(msg) 
+        self.queueMessage(msg)
         
     def send_key_end_once(self):
         msg = [audioSettings.COMMAND_KEY_END, self.key_end]
         # will be processed in thread_send_message after get() from queue and call to sendAudioMessage()
-        self.outTextMessageQueue.put(msg) 
+        self.queueMessage(msg)
         
     def send_startup_data_once(self, my_name):
         # encryption uses bytes but we have strings or bytearrays..
@@ -794,7 +1047,7 @@ class AudioTransmitter:
         encryptedMessage = encryptor.update(padded_data) + encryptor.finalize()
         msg = [audioSettings.COMMAND_STARTUP_DATA, encryptedMessage]
         # will be processed in thread_send_message after get() from queue and call to sendAudioMessage()
-        self.outTextMessageQueue.put(msg)
+        self.queueMessage(msg)
         
     # needs ACK, will be resend automatically up to max. nr. of times...
     def send_startup_data_complete(self, my_name):
@@ -811,7 +1064,7 @@ class AudioTransmitter:
         encryptedMessage = encryptor.update(padded_data) + encryptor.finalize()
         msg = [audioSettings.COMMAND_STARTUP_DATA_COMPLETE, encryptedMessage]
         # will be processed in thread_send_message after get() from queue and call to sendAudioMessage()
-        self.outTextMessageQueue.put(msg)
+        self.queueMessage(msg)
 
     def getAvgTxTimeMs(self):
         return self.avg_tx_time_ms
@@ -820,7 +1073,14 @@ class AudioTransmitter:
         return self.avg_roundtrip_time_ms
         
     def getTelegramCircularBufferSize(self):
-        return (self.telegramNrWrite - self.telegramNrRead)%audioSettings.MAX_NR_OF_TELEGRAMS_IN_PARALLEL
+        return self.txSlotRing.getOccupancy()
+        
+    def getTelegramCircularBufferMaxSize(self):
+        return self.txSlotRing.getMaxOccupancy()
+        
+    # nr. of times sendAudioMessageSeq() had to wait for a free slot
+    def getTxBackpressureCount(self):
+        return self.txSlotRing.getBlockedReserves()
         
     def getTelTxOk(self):
         return self.telTxOk
@@ -832,9 +1092,9 @@ class AudioTransmitter:
     def purge(self):
         # no method .clear() available..so:
         self.outTextMessageQueue = queue.Queue()
-        self.seqNrAck[0] = 0
-        self.seqNrAckRx[0] = 0
-        self.seqNrTx[0] = 0
+        self.look_ahead_message = None
+        # SeqNrs, send window and RTO
+        self.resetSendWindow()
         # TODO: reset here also other flags, counters, etc.???
         self.tx_state = IDLE
         self.outCommStatusQueue.put("TX: purged")
@@ -1,106 +1,52 @@
-# from 
+# Goertzel algorithm, originally based on
 # https://gist.github.com/sebpiq/4128537
 # NO license specified
 # dwightguth commented on Sep 5, 2018: What is the license on this code? -> no answer until 2020.11.08
+#
+# The original pure-Python version evaluated one window and iterated sample by sample in Python.
+# This version evaluates many windows x few frequencies in one call, running the Goertzel recursion
+# of all windows at once with scipy.signal.lfilter() (compiled code) along the window axis.
 
-import math
+import numpy as np
+from scipy import signal
 
-def goertzel(samples, sample_rate, *freqs):
-    """
-    Implementation of the Goertzel algorithm, useful for calculating individual
-    terms of a discrete Fourier transform.
-
-    `samples` is a windowed one-dimensional signal originally sampled at `sample_rate`.
-
-    The function returns 2 arrays, one containing the actual frequencies calculated,
-    the second the coefficients `(real part, imag part, power)` for each of those frequencies.
-    For simple spectral analysis, the power is usually enough.
 
-    Example of usage :
-        
-        freqs, results = goertzel(some_samples, 44100, (400, 500), (1000, 1100))
+def goertzel_power(windows, sample_rate, freqs):
     """
-    window_size = len(samples)
-    f_step = sample_rate / float(window_size)
-    f_step_normalized = 1.0 / window_size
-
-    # Calculate all the DFT bins we have to compute to include frequencies
-    # in `freqs`.
-    bins = set()
-    for f_range in freqs:
-        f_start, f_end = f_range
-        k_start = int(math.floor(f_start / f_step))
-        k_end = int(math.ceil(f_end / f_step))
-
-        if k_end > window_size - 1: raise ValueError('frequency out of range %s' % k_end)
-        bins = bins.union(range(k_start, k_end))
-
-    # For all the bins, calculate the DFT term
-    n_range = range(0, window_size)
-    freqs = []
-    results = []
-    for k in bins:
-
-        # Bin frequency and coefficients for the computation
-        f = k * f_step_normalized
-        w_real = 2.0 * math.cos(2.0 * math.pi * f)
-        w_imag = math.sin(2.0 * math.pi * f)
-
-        # Doing the calculation on the whole sample
-        d1, d2 = 0.0, 0.0
-        for n in n_range:
-            y  = samples[n] + w_real * d1 - d2
-            d2, d1 = d1, y
-
-        # Storing results `(real part, imag part, power)`
-        results.append((
-            0.5 * w_real * d1 - d2, w_imag * d1,
-            d2**2 + d1**2 - w_real * d1 * d2)
-        )
-        freqs.append(f * sample_rate)
-    return freqs, results
-
-
-'''
-if __name__ == '__main__':
-    # quick test
-    import numpy as np
-    import pylab
+    Vectorized implementation of the Goertzel algorithm, useful for calculating individual
+    terms of a discrete Fourier transform on many windows at once.
 
-    # generating test signals
-    SAMPLE_RATE = 44100
-    WINDOW_SIZE = 1024
-    t = np.linspace(0, 1, SAMPLE_RATE)[:WINDOW_SIZE]
-    sine_wave = np.sin(2*np.pi*440*t) + np.sin(2*np.pi*1020*t)
-    sine_wave = sine_wave * np.hamming(WINDOW_SIZE)
-    sine_wave2 = np.sin(2*np.pi*880*t) + np.sin(2*np.pi*1500*t)
-    sine_wave2 = sine_wave2 * np.hamming(WINDOW_SIZE)
-
-    # applying Goertzel on those signals, and plotting results
-    freqs, results = goertzel(sine_wave, SAMPLE_RATE, (400, 500),  (1000, 1100))
-
-    pylab.subplot(2, 2, 1)
-    pylab.title('(1) Sine wave 440Hz + 1020Hz')
-    pylab.plot(t, sine_wave)
-
-    pylab.subplot(2, 2, 3)
-    pylab.title('(1) Goertzel Algo, freqency ranges : [400, 500] and [1000, 1100]')
-    pylab.plot(freqs, np.array(results)[:,2], 'o')
-    pylab.ylim([0,100000])
-
-    freqs, results = goertzel(sine_wave2, SAMPLE_RATE, (400, 500),  (1000, 1100))
-
-    pylab.subplot(2, 2, 2)
-    pylab.title('(2) Sine wave 660Hz + 1200Hz')
-    pylab.plot(t, sine_wave2)
-
-    pylab.subplot(2, 2, 4)
-    pylab.title('(2) Goertzel Algo, freqency ranges : [400, 500] and [1000, 1100]')
-    pylab.plot(freqs, np.array(results)[:,2], 'o')
-    pylab.ylim([0,100000])
-
-    pylab.show()
-'''
+    `windows` is a 2D array (nr. of windows x window size), a 1D signal is treated as a single window.
+    `freqs` is a sequence of frequencies in Hz, they do NOT need to lie exactly on a DFT bin.
 
+    The function returns the power matrix (nr. of windows x len(freqs)),
+    which for frequencies on a DFT bin k is equal to abs(fft(window)[k])**2.
 
+    Example of usage :
 
+        power = goertzel_power(bit_windows, 48000, (1200.0, 2400.0))
+    """
+    windows = np.atleast_2d(windows)
+    window_size = windows.shape[1]
+    power = np.empty((windows.shape[0], len(freqs)))
+    if window_size < 2:
+        power[:] = np.abs(windows[:, :1])**2
+        return power
+    for k, f in enumerate(freqs):
+        # coefficient of the 2nd order recursion s[n] = x[n] + coeff*s[n-1] - s[n-2]
+        coeff = 2.0*np.cos(2.0*np.pi*f/sample_rate)
+        s = signal.lfilter([1.0], [1.0, -coeff, 1.0], windows, axis=1)
+        # only the last two states are needed
+        s1 = s[:, -1]
+        s2 = s[:, -2]
+        power[:, k] = s1*s1 + s2*s2 - coeff*s1*s2
+    return power
+
+
+def goertzel_level(windows, sample_rate, freqs):
+    """
+    Same as goertzel_power() but scaled to the amplitude of the tones,
+    that is, 2.0*abs(X)/window_size, which is the scaling used with rfft() in audioReceiver.
+    """
+    windows = np.atleast_2d(windows)
+    return (2.0/windows.shape[1])*np.sqrt(np.maximum(goertzel_power(windows, sample_rate, freqs), 0.0))
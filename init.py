@@ -185,10 +185,22 @@ class InitApp(object):
         self.config['myConfig']['FFT_DETECTION_LEVEL'] = str(audioSettings.FFT_DETECTION_LEVEL)
         self.config['myConfig']['CHANNEL_DELAY_MS'] = str(audioSettings.CHANNEL_DELAY_MS)
         self.config['myConfig']['MAX_RESENDS'] = str(audioSettings.MAX_RESENDS)
+        self.config['myConfig']['ARQ_WINDOW_SIZE'] = str(audioSettings.ARQ_WINDOW_SIZE)
+        self.config['myConfig']['ADAPTIVE_RTO'] = str(audioSettings.ADAPTIVE_RTO)
+        self.config['myConfig']['HARQ_SOFT_COMBINING'] = str(audioSettings.HARQ_SOFT_COMBINING)
+        self.config['myConfig']['FEC_ENABLED'] = str(audioSettings.FEC_ENABLED)
+        self.config['myConfig']['FRAME_CHECK_CRC_BITS'] = str(audioSettings.FRAME_CHECK_CRC_BITS)
+        self.config['myConfig']['PN_PREAMBLE'] = str(audioSettings.PN_PREAMBLE)
+        self.config['myConfig']['PREAMBLE_CFAR'] = str(audioSettings.PREAMBLE_CFAR)
+        self.config['myConfig']['IDLE_LISTENING'] = str(audioSettings.IDLE_LISTENING)
+        self.config['myConfig']['FRAME_AGGREGATION'] = str(audioSettings.FRAME_AGGREGATION)
         self.config['myConfig']['CARRIER_FREQUENCY_HZ'] = str(audioSettings.CARRIER_FREQUENCY_HZ)
         self.config['myConfig']['CARRIER_AMPLITUDE'] = str(audioSettings.CARRIER_AMPLITUDE)
         self.config['myConfig']['ADD_CARRIER'] = str(audioSettings.ADD_CARRIER)
         self.config['myConfig']['REMOVE_RX_CARRIER'] = str(audioSettings.REMOVE_RX_CARRIER)
+        self.config['myConfig']['DETECT_USING_GROETZEL'] = str(audioSettings.DETECT_USING_GROETZEL)
+        self.config['myConfig']['DETECT_USING_DISCRIMINATOR'] = str(audioSettings.DETECT_USING_DISCRIMINATOR)
+        self.config['myConfig']['CONTINUOUS_PHASE_FSK'] = str(audioSettings.CONTINUOUS_PHASE_FSK)
         
         with open(filename, 'w') as configfile:
             # write new settings into file
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import math
+
+'''
+Streaming ring modulator used to distort voice in TX (multiply by 2*sin(2*pi*f0*n/fs))
+and to undistort it in RX (divide by the same factor, zero where the sine is exactly zero).
+
+The factor is periodic with  fs/gcd(fs, f0)  samples (e.g. 1200 samples for 920 Hz at 48 kHz),
+so it is precomputed once in a table, extended by max_block_len samples,
+so that the factors of any block are a contiguous slice of the table beginning at the current phase.
+The phase continues across blocks, a block is processed with a single multiply without memory allocation.
+'''
+
+
+class RingModulator():
+    def __init__(self, frequency, sample_rate, max_block_len, inverse=False):
+        # length of one period of the factor in samples
+        # NOTE: a frequency with digits after the comma is rounded to the next integer
+        self.period = int(sample_rate//math.gcd(int(sample_rate), int(round(frequency))))
+        self.max_block_len = max_block_len
+        n = np.arange(self.period + max_block_len)
+        factor = 2.0*np.sin(2*np.pi*frequency*(n%self.period)/sample_rate)
+        if inverse:
+            # revert x*sin(F*n)*2 as x/(2*sin(F*n)), the samples where the sine is exactly zero are set to zero
+            nonzero = factor != 0.0
+            factor[nonzero] = 1.0/factor[nonzero]
+        self.table = factor
+        # current sample position modulo period
+        self.phase = 0
+
+    def reset(self):
+        self.phase = 0
+
+    # out may be the same array as samples (in place)
+    def process(self, samples, out):
+        nr_of_samples = len(samples)
+        # bigger blocks are processed in pieces which fit in the table
+        for i in range(0, nr_of_samples, self.max_block_len):
+            block_len = min(self.max_block_len, nr_of_samples - i)
+            np.multiply(samples[i:i + block_len], self.table[self.phase:self.phase + block_len], out=out[i:i + block_len])
+            self.phase = (self.phase + block_len)%self.period
+        return out
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+'''
+Estimator of the retransmission timeout (RTO) from the measured roundtrip times (RTT), similar to TCP (RFC 6298):
+
+    first sample:   SRTT = RTT,  RTTVAR = RTT/2
+    next samples:   RTTVAR = (1 - BETA)*RTTVAR + BETA*|SRTT - RTT|
+                    SRTT = (1 - ALPHA)*SRTT + ALPHA*RTT
+                    RTO = SRTT + K*RTTVAR  (limited to [min_rto, max_rto])
+
+Before the first sample the initial RTO is used (e.g. the fixed value derived from the channel delay).
+Each timeout doubles the RTO (exponential backoff), a new sample resets the backoff.
+Samples shall only be taken from telegrams which were not retransmitted (Karn's algorithm),
+otherwise we cannot know which transmission was acknowledged.
+'''
+
+# gains of the smoothed RTT and of the RTT variance, and factor of the variance
+ALPHA = 1.0/8.0
+BETA = 1.0/4.0
+K = 4.0
+
+
+class RtoEstimator():
+    def __init__(self, initial_rto, min_rto, max_rto):
+        self.initial_rto = initial_rto
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.reset()
+
+    def reset(self):
+        self.srtt = None
+        self.rttvar = 0.0
+        self.rto = self.initial_rto
+        self.backoff_factor = 1
+
+    # add a roundtrip time sample in seconds
+    def addSample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt/2.0
+        else:
+            self.rttvar = (1.0 - BETA)*self.rttvar + BETA*abs(self.srtt - rtt)
+            self.srtt = (1.0 - ALPHA)*self.srtt + ALPHA*rtt
+        self.rto = min(max(self.srtt + K*self.rttvar, self.min_rto), self.max_rto)
+        self.backoff_factor = 1
+
+    # called on timeout (no ACK or answer received)
+    def backoff(self):
+        if self.rto*self.backoff_factor < self.max_rto:
+            self.backoff_factor *= 2
+
+    # retransmission timeout in seconds
+    def getRto(self):
+        return min(self.rto*self.backoff_factor, self.max_rto)
+
+    # smoothed roundtrip time in seconds, None before the first sample
+    def getSrtt(self):
+        return self.srtt
@@ -10,7 +10,6 @@ import os
 from audioTransmitter import AudioTransmitter
 from audioReceiver import AudioReceiver
 import logging
-import numpy as np
 from dataclasses import dataclass
 
 
@@ -57,12 +56,18 @@ class SoundDeviceManager:
         receive_on_ref: bytearray # reference to flag for common use in audioTransmitter and audioReceiver
         ack_received: list # flag to informa about reception of ACK telegram
         send_ack: list # trigger to send and ACK, acknowledging seqNrAck
+        send_nack: list # trigger to send a NACK, requesting the retransmission of seqNrAck + 1
+        nack_received: list # flag to inform about reception of NACK telegram, and seqNr requested in it
         seqNrAck: list # seqNr to be Acknowledged - reference to seqNr AKCnowledged by transmitter
         seqNrAckRx: list # seqNr Acknowledged by the other side - reference to seqNr received from transmitter
         seqNrTx: list # seqNr TX
         private_key: list
         cipher: list
         comm_token: list
+        comm_event: threading.Condition # notified on communication events, e.g. message queued, ACK received or handshake answer received
+        sack_to_send: list # windowed ARQ: data of the ACK to be sent (receive window and selective ACKs)
+        sack_received: list # windowed ARQ: receive window and seqNrs acknowledged selectively by the other side
+        peer_capabilities: list # capabilities of the other side received in CALL or CALL ACCEPTED (e.g. CAPABILITY_FEC)
     globVars = GlobVars(
         [False], # stream_on
         bytearray([False]), # transmit_on
@@ -71,12 +76,18 @@ class SoundDeviceManager:
         None, # receive_on_ref
         [False, 0], # ack_received
         [False], # send_ack
+        [False], # send_nack
+        [False, 0], # nack_received
         [0], # seqNrAck
         [0], # seqNrAckRx
         [0], # seqNrTx
         [None], # private_key
         [None], # cipher
-        [0]) # comm_token
+        [0], # comm_token
+        threading.Condition(), # comm_event
+        [bytearray(0)], # sack_to_send
+        [audioSettings.ARQ_WINDOW_SIZE, []], # sack_received
+        [0]) # peer_capabilities
     globVars.transmit_on_ref = memoryview(globVars.transmit_on)
     globVars.receive_on_ref = memoryview(globVars.receive_on)
     # variable containing global variables shall be itself mutable, so:
@@ -96,7 +107,7 @@ class SoundDeviceManager:
     # transmitting while receiving. Sometimes telegrams will just cross.
     # this is no problem because we have different lines for TX and for RX, unless we have "collissions", or in fact "disturbances due e.g. to EM-cross-talk"
     # For such cases we need to retransmit with a random timeout so we dont collide infinitely.
-    TX_RETRANSMISSION_POLL_PERIODS = 0
+    answer_timeout_sec = 0.0
     # audio devices
     audio_devices = sd.query_devices() # returns DeviceList
     ad_index_by_name = {}
@@ -125,7 +136,7 @@ class SoundDeviceManager:
         self.plotdata = plotdata_arg
         self.lines = lines_arg
         # CALL timeout handling
-        self.TX_RETRANSMISSION_POLL_PERIODS = audioSettings.TX_RETRANSMISSION_POLL_PERIODS_SHORT
+        self.answer_timeout_sec = audioSettings.TX_RETRANSMISSION_SEC
         ### self.randomRetryTimeout()
     
     def thread_wire_in(self, name):
@@ -294,9 +305,15 @@ class SoundDeviceManager:
         # reset shared communication variables
         self.glob_vars[0].ack_received[0] = False
         self.glob_vars[0].send_ack[0] = False
+        self.glob_vars[0].send_nack[0] = False
+        self.glob_vars[0].nack_received[0] = False
         self.glob_vars[0].seqNrAck[0] = 0
         self.glob_vars[0].seqNrAckRx[0] = 0
         self.glob_vars[0].seqNrTx[0] = 0
+        self.glob_vars[0].sack_to_send[0] = bytearray(0)
+        self.glob_vars[0].sack_received[0] = audioSettings.ARQ_WINDOW_SIZE
+        self.glob_vars[0].sack_received[1] = []
+        self.glob_vars[0].peer_capabilities[0] = 0
         # class objects
         # TODO: pass all shared variables in a STRUCT
         ############################
@@ -342,16 +359,19 @@ class SoundDeviceManager:
         
     def stopDevices(self):
         self.glob_vars[0].stream_on[0] = False
+        # wake up waiting threads so they can leave
+        with self.glob_vars[0].comm_event:
+            self.glob_vars[0].comm_event.notify_all()
         
     # BLOCKING call 
     def sendMessage(self, message):
         self.audioTransmitter.sendMessage(message)
         
     def isPlotRxQueueEmpty(self):
-        return self.audioReceiver.qplot.empty()
+        return self.audioReceiver.isPlotDataAvailable() == False
         
     def plotRxQueueGetNoWait(self):
-        return self.audioReceiver.qplot.get_nowait()
+        return self.audioReceiver.getPlotData()
 
     def messageRxQueueGet(self):
         ret = None
@@ -379,6 +399,12 @@ class SoundDeviceManager:
     def getRxTimeMs(self):
         return self.audioReceiver.getRxTimeMs()
         
+    def getRxOverruns(self):
+        return self.audioReceiver.getRxOverruns()
+        
+    def getPreambleFalseTriggerRate(self):
+        return self.audioReceiver.getPreambleFalseTriggerRate()
+        
     def getRoundtripTimeMs(self):
         return self.audioTransmitter.getRoundtripTimeMs()
 
@@ -388,6 +414,12 @@ class SoundDeviceManager:
     def getTelegramCircularBufferSize(self):
         return self.audioTransmitter.getTelegramCircularBufferSize()
         
+    def getTelegramCircularBufferMaxSize(self):
+        return self.audioTransmitter.getTelegramCircularBufferMaxSize()
+        
+    def getTxBackpressureCount(self):
+        return self.audioTransmitter.getTxBackpressureCount()
+        
     def getAvgInAmplitudePercent(self):
         return self.audioReceiver.getAvgInAmplitudePercent()
         
@@ -415,18 +447,37 @@ class SoundDeviceManager:
         
     # In average, half of the time we retry after "double" the necessary time in order to give the other side a chance
     # to successfully transmit in case we are having collissions due to simultaneous transmissions from both sides.
-    # Half of the time we retry after an even longer time given by TX_RETRANSMISSION_POLL_PERIODS_LONG.
+    # Half of the time we retry after an even longer time given by TX_RETRANSMISSION_LONG_FACTOR.
     # NOTE: for TX and RX we have different physical channels, so it is NOT exactly COLLISSIONS what we have
     #            but probably interferences e.g. due to "cross-talk" (EM coupling between lines).
+    # The timeout is the retransmission timeout of audioTransmitter, adapted to the measured roundtrip time.
     def randomRetryTimeout(self):
-        rnd = np.random.randint(2)
-        if rnd:
-            self.TX_RETRANSMISSION_POLL_PERIODS = audioSettings.TX_RETRANSMISSION_POLL_PERIODS_SHORT
-        else:
-            self.TX_RETRANSMISSION_POLL_PERIODS = audioSettings.TX_RETRANSMISSION_POLL_PERIODS_LONG
+        self.answer_timeout_sec = self.audioTransmitter.getRetransmissionTimeout()
+        
+    # BLOCKING call until one of the checks returns True (then its answer is returned) or until timeout_sec expires (then COMMAND_ERROR is returned).
+    # checks is a list of (check-function, answer), the checks are evaluated again every time comm_event is notified.
+    # With backoff=True the retransmission timeout is increased when no answer is received (e.g. channel slower than estimated).
+    def waitForAnswer(self, checks, timeout_sec, backoff=False):
+        comm_event = self.glob_vars[0].comm_event
+        deadline = time.monotonic() + timeout_sec
+        with comm_event:
+            while self.glob_vars[0].stream_on[0]:
+                for check, answer in checks:
+                    if check():
+                        return answer
+                remaining = deadline - time.monotonic()
+                if remaining <= 0.0:
+                    break
+                comm_event.wait(remaining)
+        if backoff and self.glob_vars[0].stream_on[0]:
+            self.audioTransmitter.backoffRetransmissionTimeout()
+        return audioSettings.COMMAND_ERROR
+        
+    # timeout of handshake steps in seconds, set in randomRetryTimeout()
+    def getAnswerTimeout(self):
+        return self.answer_timeout_sec
         
     def call_once(self):
-        poll_counter = 0
         # random timeout to avoid collissions when simultaneous CALL from both sides
         self.randomRetryTimeout()
         # CALL once
@@ -434,120 +485,71 @@ class SoundDeviceManager:
         # process CALL answer
         # NOTE: this method will be called again immediately after returning...
         #            we may overload communication if we send too many CALLs, so we add a delay factor, e.g. of 3.
-        while poll_counter < self.TX_RETRANSMISSION_POLL_PERIODS*3:
-            if self.audioReceiver.isCallAccepted():
-                return audioSettings.COMMAND_CALL_ACCEPTED
-            elif self.audioReceiver.isCallRejected():
-                return audioSettings.COMMAND_CALL_REJECTED
-            # polling sleep pause
-            time.sleep(audioSettings.TX_POLL_PERIOD_SEC)
-            poll_counter += 1
-        return audioSettings.COMMAND_ERROR
+        return self.waitForAnswer([(self.audioReceiver.isCallAccepted, audioSettings.COMMAND_CALL_ACCEPTED),
+                                   (self.audioReceiver.isCallRejected, audioSettings.COMMAND_CALL_REJECTED)], self.getAnswerTimeout()*3, backoff=True)
         
     def send_key_start_once(self):
-        poll_counter = 0
         # random timeout to avoid collissions - TODO: check this?
         self.randomRetryTimeout()
         # send KEY START
         self.audioTransmitter.send_key_start_once()
         # process send_key_start() answer
-        while poll_counter < self.TX_RETRANSMISSION_POLL_PERIODS:
-            if self.audioReceiver.isKeyStartReceived():
-                return audioSettings.COMMAND_KEY_START
-            elif self.audioReceiver.isCallRejected():
-                return audioSettings.COMMAND_CALL_REJECTED
-            # polling sleep pause
-            time.sleep(audioSettings.TX_POLL_PERIOD_SEC)
-            poll_counter += 1
-        return audioSettings.COMMAND_ERROR
+        return self.waitForAnswer([(self.audioReceiver.isKeyStartReceived, audioSettings.COMMAND_KEY_START),
+                                   (self.audioReceiver.isCallRejected, audioSettings.COMMAND_CALL_REJECTED)], self.getAnswerTimeout(), backoff=True)
         
     def send_key_end_once(self):
-        poll_counter = 0
         # random timeout to avoid collissions - TODO: check this?
         self.randomRetryTimeout()
         # send KEY END
         self.audioTransmitter.send_key_end_once()
         # process send_key_end() answer
-        while poll_counter < self.TX_RETRANSMISSION_POLL_PERIODS:
-            if self.audioReceiver.isKeyEndReceived():
-                return audioSettings.COMMAND_KEY_END
-            elif self.audioReceiver.isCallRejected():
-                return audioSettings.COMMAND_CALL_REJECTED
-            # polling sleep pause
-            time.sleep(audioSettings.TX_POLL_PERIOD_SEC)
-            poll_counter += 1
-        return audioSettings.COMMAND_ERROR
+        return self.waitForAnswer([(self.audioReceiver.isKeyEndReceived, audioSettings.COMMAND_KEY_END),
+                                   (self.audioReceiver.isCallRejected, audioSettings.COMMAND_CALL_REJECTED)], self.getAnswerTimeout(), backoff=True)
         
     def respond_key_start_once(self):
-        poll_counter = 0
         # random timeout to avoid collissions - TODO: check this?
         self.randomRetryTimeout()
         # send KEY START as soon as we receive KEY START from the other side
         # check response
-        while poll_counter < self.TX_RETRANSMISSION_POLL_PERIODS:
-            if self.audioReceiver.isKeyStartReceived():
-                self.audioTransmitter.send_key_start_once()
-                return audioSettings.COMMAND_KEY_START
-            elif self.audioReceiver.isCallRejected():
-                return audioSettings.COMMAND_CALL_REJECTED
-            # polling sleep pause
-            time.sleep(audioSettings.TX_POLL_PERIOD_SEC)
-            poll_counter += 1
-        return audioSettings.COMMAND_ERROR
+        answer = self.waitForAnswer([(self.audioReceiver.isKeyStartReceived, audioSettings.COMMAND_KEY_START),
+                                     (self.audioReceiver.isCallRejected, audioSettings.COMMAND_CALL_REJECTED)], self.getAnswerTimeout())
+        if answer == audioSettings.COMMAND_KEY_START:
+            self.audioTransmitter.send_key_start_once()
+        return answer
         
     def respond_key_end_once(self):
-        poll_counter = 0
         # random timeout to avoid collissions - TODO: check this?
         self.randomRetryTimeout()
         # send KEY END as soon as we receive KEY END from the other side
-        while poll_counter < self.TX_RETRANSMISSION_POLL_PERIODS:
-            if self.audioReceiver.isKeyEndReceived():
-                self.audioTransmitter.send_key_end_once() 
-                return audioSettings.COMMAND_KEY_END
-            elif self.audioReceiver.isCallRejected():
-                return audioSettings.COMMAND_CALL_REJECTED
-            # polling sleep pause
-            time.sleep(audioSettings.TX_POLL_PERIOD_SEC)
-            poll_counter += 1
-        return audioSettings.COMMAND_ERROR
+        answer = self.waitForAnswer([(self.audioReceiver.isKeyEndReceived, audioSettings.COMMAND_KEY_END),
+                                     (self.audioReceiver.isCallRejected, audioSettings.COMMAND_CALL_REJECTED)], self.getAnswerTimeout())
+        if answer == audioSettings.COMMAND_KEY_END:
+            self.audioTransmitter.send_key_end_once() 
+        return answer
         
     def generatePublicKey(self):
         self.audioTransmitter.generatePublicKey()
         
     def send_startup_data_once(self, my_name):
-        poll_counter = 0
         # random timeout to avoid collissions - TODO: check this?
         self.randomRetryTimeout()
         # send STARTUP DATA
         self.audioTransmitter.send_startup_data_once(my_name)
         # process send_startup_data() answer
-        while poll_counter < self.TX_RETRANSMISSION_POLL_PERIODS:
-            if self.audioReceiver.isStartupDataReceived():
-                return audioSettings.COMMAND_STARTUP_DATA
-            elif self.audioReceiver.isCallRejected():
-                return audioSettings.COMMAND_CALL_REJECTED
-            # polling sleep pause
-            time.sleep(audioSettings.TX_POLL_PERIOD_SEC)
-            poll_counter += 1
-        return audioSettings.COMMAND_ERROR
+        return self.waitForAnswer([(self.audioReceiver.isStartupDataReceived, audioSettings.COMMAND_STARTUP_DATA),
+                                   (self.audioReceiver.isCallRejected, audioSettings.COMMAND_CALL_REJECTED)], self.getAnswerTimeout(), backoff=True)
         
     def respond_startup_data_once(self, my_name):
-        poll_counter = 0
         # random timeout to avoid collissions - TODO: check this?
         self.randomRetryTimeout()
         # send STARTUP_COMPLETE as soon as we receive STARTUP from the other side
-        while poll_counter < self.TX_RETRANSMISSION_POLL_PERIODS:
-            if self.audioReceiver.isStartupDataReceived():
-                # NOTE: we dont call send_startup_data() which is handled differently with ACK
-                #            this telegram will be retransmitted automatically "and non-blocking" up to max. nr. of retransmissions
-                self.audioTransmitter.send_startup_data_complete(my_name) 
-                return audioSettings.COMMAND_STARTUP_DATA
-            elif self.audioReceiver.isCallRejected():
-                return audioSettings.COMMAND_CALL_REJECTED
-            # polling sleep pause
-            time.sleep(audioSettings.TX_POLL_PERIOD_SEC)
-            poll_counter += 1
-        return audioSettings.COMMAND_ERROR
+        answer = self.waitForAnswer([(self.audioReceiver.isStartupDataReceived, audioSettings.COMMAND_STARTUP_DATA),
+                                     (self.audioReceiver.isCallRejected, audioSettings.COMMAND_CALL_REJECTED)], self.getAnswerTimeout())
+        if answer == audioSettings.COMMAND_STARTUP_DATA:
+            # NOTE: we dont call send_startup_data() which is handled differently with ACK
+            #            this telegram will be retransmitted automatically "and non-blocking" up to max. nr. of retransmissions
+            self.audioTransmitter.send_startup_data_complete(my_name) 
+        return answer
         
     def isTxStateWaitAck(self):
         return self.audioTransmitter.isTxStateWaitAck()
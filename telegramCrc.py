@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+'''
+Table-driven CRC of telegrams (frame check), calculated on all bytes of the telegram at once.
+
+The CRC is linear, so the CRC of a message of L bytes b[0..L-1] is:
+
+    CRC = T[L-1][b[0]] ^ T[L-2][b[1]] ^ ... ^ T[0][b[L-1]] ^ C[L]
+
+    T[k][b]     CRC (with init value 0 and without final XOR) of the byte b followed by k zero bytes
+    C[L]        CRC of L zero bytes (contains the init value and the final XOR)
+
+The tables are calculated once for messages of up to max_len bytes, so a telegram needs only one
+table lookup per byte and one XOR reduction (no loop over the bytes).
+Longer messages are calculated byte by byte with the usual table T[0].
+'''
+
+# CRC-16/CCITT-FALSE (check value of "123456789" = 0x29B1)
+CRC16_WIDTH = 16
+CRC16_POLYNOMIAL = 0x1021
+CRC16_INIT = 0xFFFF
+CRC16_REFLECTED = False
+CRC16_XOR_OUT = 0x0000
+# CRC-32 as in Ethernet and ZIP (check value of "123456789" = 0xCBF43926), reflected polynomial
+CRC32_WIDTH = 32
+CRC32_POLYNOMIAL = 0xEDB88320
+CRC32_INIT = 0xFFFFFFFF
+CRC32_REFLECTED = True
+CRC32_XOR_OUT = 0xFFFFFFFF
+
+
+class TelegramCrc():
+    def __init__(self, width, polynomial, init, reflected, xor_out, max_len):
+        self.width = width
+        self.mask = (1 << width) - 1
+        self.init = init
+        self.reflected = reflected
+        self.xor_out = xor_out
+        self.len_bytes = width//8
+        # table of one byte (init value 0)
+        byte_values = np.arange(256, dtype=np.uint64)
+        if reflected:
+            crc = byte_values.copy()
+            for _ in range(8):
+                crc = np.where(crc & 1, (crc >> np.uint64(1)) ^ np.uint64(polynomial), crc >> np.uint64(1))
+        else:
+            crc = byte_values << np.uint64(width - 8)
+            for _ in range(8):
+                crc = np.where(crc & np.uint64(1 << (width - 1)), ((crc << np.uint64(1)) ^ np.uint64(polynomial)) & np.uint64(self.mask), crc << np.uint64(1))
+        self.table = crc & np.uint64(self.mask)
+        # tables of one byte followed by k zero bytes, k = 0..max_len-1
+        self.tables = np.zeros((max(max_len, 1), 256), dtype=np.uint64)
+        self.tables[0] = self.table
+        for k in range(1, len(self.tables)):
+            self.tables[k] = self.updateZeroByte(self.tables[k - 1])
+        # CRC of L zero bytes, L = 0..max_len
+        self.zero_crc = np.zeros(len(self.tables) + 1, dtype=np.uint64)
+        crc = init
+        for n in range(len(self.zero_crc)):
+            self.zero_crc[n] = crc ^ xor_out
+            crc = int(self.updateZeroByte(np.uint64(crc)))
+        # positions of the tables in a message of max_len bytes (the first byte uses the last table)
+        self.table_rows = np.arange(len(self.tables) - 1, -1, -1)
+
+    # CRC register(s) after one more zero byte
+    def updateZeroByte(self, crc):
+        if self.reflected:
+            return (crc >> np.uint64(8)) ^ self.table[crc & np.uint64(0xFF)]
+        return ((crc << np.uint64(8)) & np.uint64(self.mask)) ^ self.table[crc >> np.uint64(self.width - 8)]
+
+    # CRC of the bytes in byte_array (bytes, bytearray or np.uint8 array) as an int
+    def calculate(self, byte_array):
+        message = np.frombuffer(bytes(byte_array), dtype=np.uint8)
+        nr_of_bytes = len(message)
+        if nr_of_bytes <= len(self.tables):
+            rows = self.table_rows[len(self.tables) - nr_of_bytes:]
+            return int(np.bitwise_xor.reduce(self.tables[rows, message], initial=np.uint64(0)) ^ self.zero_crc[nr_of_bytes])
+        # message longer than the tables
+        crc = self.init
+        for byte in message:
+            if self.reflected:
+                crc = (crc >> 8) ^ int(self.table[(crc ^ int(byte)) & 0xFF])
+            else:
+                crc = ((crc << 8) & self.mask) ^ int(self.table[(crc >> (self.width - 8)) ^ int(byte)])
+        return crc ^ self.xor_out
+
+    # CRC as bytes (MSB first), as sent at the end of the telegram
+    def calculateBytes(self, byte_array):
+        return self.calculate(byte_array).to_bytes(self.len_bytes, byteorder='big')
+
+
+def getCrc16(max_len):
+    return TelegramCrc(CRC16_WIDTH, CRC16_POLYNOMIAL, CRC16_INIT, CRC16_REFLECTED, CRC16_XOR_OUT, max_len)
+
+
+def getCrc32(max_len):
+    return TelegramCrc(CRC32_WIDTH, CRC32_POLYNOMIAL, CRC32_INIT, CRC32_REFLECTED, CRC32_XOR_OUT, max_len)
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+import audioSettings
+import numpy as np
+
+'''
+Forward error correction (FEC) of telegrams: convolutional code with soft-decision Viterbi decoding and bit interleaver.
+
+A telegram with FEC contains, after START:
+
+    FEC_MARKER | LENGTH (2 bytes) | coded BODY
+
+    FEC_MARKER  replaces ADDRESS (0x01) and is far from it (Hamming distance 8), so the format is recognized even with bit errors
+    LENGTH      nr. of bytes of BODY, each nibble coded with the extended Hamming code (8,4)
+    BODY        the same bytes as in a telegram without FEC (ADDRESS, SEQ_NR, ... END, CHECKSUM),
+                coded with the convolutional code K=7 (generators 171, 133 octal, terminated with 6 zero bits),
+                punctured to code rate 3/4 and interleaved in blocks of FEC_INTERLEAVER_ROWS rows,
+                so that a burst of up to FEC_INTERLEAVER_ROWS wrong bits is spread over the complete BODY.
+
+The decoder works with the soft bits of the receiver (> 0 = ONE, magnitude = reliability),
+punctured bits are decoded as soft bits with value 0 (no information).
+'''
+
+FEC_MARKER = 0xFE
+# max. nr. of wrong bits in a received FEC_MARKER
+FEC_MARKER_MAX_BIT_ERRORS = 2
+FEC_LENGTH_LEN_BYTES = 2
+# convolutional code
+CONSTRAINT_LENGTH = 7
+GENERATORS = (0o171, 0o133)
+NR_OF_STATES = 1 << (CONSTRAINT_LENGTH - 1)
+# puncturing pattern for code rate 3/4, for each generator the output bits kept in a period of 3 input bits
+PUNCTURING_PATTERN = np.array([[1, 1, 0], [1, 0, 1]], dtype=bool)
+FEC_INTERLEAVER_ROWS = 8
+# min. length of BODY: ADDRESS, SEQ_NR, SEQ_NR_ACK, COMMAND, DATA_SIZE, END, CHECKSUM
+FEC_MIN_BODY_LEN_BYTES = 7
+
+
+def isFecMarker(byte):
+    return bin(byte ^ FEC_MARKER).count("1") <= FEC_MARKER_MAX_BIT_ERRORS
+
+
+# generator taps as arrays, tap k multiplies the input bit k steps before
+def getGeneratorTaps():
+    return [np.array([(g >> (CONSTRAINT_LENGTH - 1 - k)) & 1 for k in range(CONSTRAINT_LENGTH)]) for g in GENERATORS]
+
+
+# extended Hamming code (8,4): codewords of all nibbles as bits (MSB first) and as soft values +1/-1
+def getHammingCodewords():
+    codewords = np.zeros((16, 8), dtype=np.uint8)
+    for nibble in range(16):
+        d = [(nibble >> (3 - i)) & 1 for i in range(4)]
+        p = [d[0] ^ d[1] ^ d[3], d[0] ^ d[2] ^ d[3], d[1] ^ d[2] ^ d[3]]
+        bits = d + p
+        codewords[nibble] = bits + [sum(bits) & 1]
+    return codewords
+
+
+HAMMING_CODEWORDS = getHammingCodewords()
+HAMMING_SOFT_CODEWORDS = 2.0*HAMMING_CODEWORDS - 1.0
+
+
+class TelegramFec():
+    def __init__(self):
+        self.taps = getGeneratorTaps()
+        # trellis: each state (last 6 input bits, the newest in the MSB) has 2 predecessor states,
+        # the input bit is the MSB of the state, and the expected output bits (+1/-1) of both transitions
+        states = np.arange(NR_OF_STATES)
+        self.input_bit = states >> (CONSTRAINT_LENGTH - 2)
+        self.predecessors = np.stack([(states & (NR_OF_STATES//2 - 1)) << 1, ((states & (NR_OF_STATES//2 - 1)) << 1) | 1], axis=1)
+        register = (self.input_bit[:, np.newaxis] << (CONSTRAINT_LENGTH - 1)) | self.predecessors
+        self.expected = np.stack([2.0*np.array([[bin(r & g).count("1") & 1 for r in row] for row in register]) - 1.0 for g in GENERATORS])
+        # positions of the coded bits and interleaver of each BODY length, calculated once
+        self.coded_positions_cache = {}
+        self.interleaver_cache = {}
+
+    # nr. of steps of the trellis for body_len bytes, including the termination
+    def getNrOfSteps(self, body_len):
+        return 8*body_len + CONSTRAINT_LENGTH - 1
+
+    # positions of the bits kept after puncturing in the stream of output bits c0[0], c1[0], c0[1], c1[1], ...
+    def getCodedPositions(self, body_len):
+        positions = self.coded_positions_cache.get(body_len)
+        if positions is None:
+            nr_of_steps = self.getNrOfSteps(body_len)
+            mask = PUNCTURING_PATTERN[:, np.arange(nr_of_steps)%PUNCTURING_PATTERN.shape[1]].T.ravel()
+            positions = np.flatnonzero(mask)
+            self.coded_positions_cache[body_len] = positions
+        return positions
+
+    # nr. of bits of the coded BODY, padded to whole bytes
+    def getCodedLenBits(self, body_len):
+        return -(-len(self.getCodedPositions(body_len))//8)*8
+
+    # transmitted bit i is the coded bit interleaver[i]
+    def getInterleaver(self, body_len):
+        interleaver = self.interleaver_cache.get(body_len)
+        if interleaver is None:
+            coded_len = self.getCodedLenBits(body_len)
+            interleaver = np.arange(coded_len).reshape(FEC_INTERLEAVER_ROWS, coded_len//FEC_INTERLEAVER_ROWS).T.ravel()
+            self.interleaver_cache[body_len] = interleaver
+        return interleaver
+
+    # max. length of BODY such that the telegram with FEC is not longer than TELEGRAM_MAX_LEN_BYTES
+    def getMaxBodyLen(self):
+        max_coded_bytes = audioSettings.TELEGRAM_MAX_LEN_BYTES - audioSettings.TELEGRAM_PREAMBLE_LEN_BYTES - audioSettings.START_LEN_BYTES - \
+            1 - FEC_LENGTH_LEN_BYTES - audioSettings.TELEGRAM_TERMINATOR_LEN_BYTES
+        body_len = max_coded_bytes*8*PUNCTURING_PATTERN.shape[1]//np.count_nonzero(PUNCTURING_PATTERN)//8
+        while (body_len > 0) and (self.getCodedLenBits(body_len) > max_coded_bytes*8):
+            body_len -= 1
+        return min(body_len, 255)
+
+    # max. nr. of data bytes in a telegram with FEC
+    def getMaxDataLen(self):
+        return max(self.getMaxBodyLen() - FEC_MIN_BODY_LEN_BYTES, 0)
+
+    # returns FEC_MARKER, LENGTH and coded BODY, to be sent after START instead of byte_body
+    def encode(self, byte_body):
+        body_len = len(byte_body)
+        info_bits = np.concatenate([np.unpackbits(np.frombuffer(bytes(byte_body), dtype=np.uint8)), np.zeros(CONSTRAINT_LENGTH - 1, dtype=np.uint8)])
+        # output bits of both generators (convolution modulo 2), one after the other
+        output_bits = np.stack([np.convolve(info_bits, taps)[:len(info_bits)]%2 for taps in self.taps], axis=1).ravel()
+        coded_bits = np.zeros(self.getCodedLenBits(body_len), dtype=np.uint8)
+        positions = self.getCodedPositions(body_len)
+        coded_bits[:len(positions)] = output_bits[positions]
+        length_bits = HAMMING_CODEWORDS[[body_len >> 4, body_len & 0x0F]].ravel()
+        return bytearray([FEC_MARKER]) + bytearray(np.packbits(length_bits).tobytes()) + \
+            bytearray(np.packbits(coded_bits[self.getInterleaver(body_len)]).tobytes())
+
+    # soft-decision decoding of LENGTH (2*8 soft bits)
+    def decodeLength(self, soft_bits):
+        nibbles = np.argmax(np.reshape(soft_bits, (2, 8)) @ HAMMING_SOFT_CODEWORDS.T, axis=1)
+        return int((nibbles[0] << 4) | nibbles[1])
+
+    # soft-decision Viterbi decoding of the coded BODY (getCodedLenBits(body_len) soft bits),
+    # returns the bits of BODY (8*body_len)
+    def decodeBody(self, soft_bits, body_len):
+        nr_of_steps = self.getNrOfSteps(body_len)
+        # de-interleave and de-puncture (punctured bits stay 0)
+        coded_soft = np.zeros(self.getCodedLenBits(body_len))
+        coded_soft[self.getInterleaver(body_len)] = soft_bits
+        positions = self.getCodedPositions(body_len)
+        received = np.zeros(2*nr_of_steps)
+        received[positions] = coded_soft[:len(positions)]
+        received = received.reshape(nr_of_steps, 2)
+        # forward: path metrics (correlation, the bigger the better) and decisions between both predecessors
+        path_metric = np.full(NR_OF_STATES, -np.inf)
+        path_metric[0] = 0.0
+        decisions = np.zeros((nr_of_steps, NR_OF_STATES), dtype=np.uint8)
+        for n in range(nr_of_steps):
+            candidates = path_metric[self.predecessors] + received[n, 0]*self.expected[0] + received[n, 1]*self.expected[1]
+            decisions[n] = candidates[:, 1] > candidates[:, 0]
+            path_metric = np.maximum(candidates[:, 0], candidates[:, 1])
+        # traceback from state 0 (terminated code)
+        bits = np.zeros(nr_of_steps, dtype=np.uint8)
+        state = 0
+        for n in range(nr_of_steps - 1, -1, -1):
+            bits[n] = self.input_bit[state]
+            state = self.predecessors[state, decisions[n, state]]
+        return bits[:8*body_len]
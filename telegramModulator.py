@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import audioSettings
+import numpy as np
+
+'''
+Modulator which renders the audio samples of a complete telegram in one vectorized step.
+
+The waveforms of the symbols ZERO and ONE are stored one after the other in a symbol table.
+The bits of the telegram are obtained with np.unpackbits() (MSB first, same order as bitarray.frombytes()),
+and every output sample is an index gather into the symbol table:
+
+    sample n of bit k  =  symbol_table[symbol_start[bit_k] + n]
+
+With CONTINUOUS_PHASE_FSK the symbols do not begin with phase 0 but continue the phase of the previous symbol
+(phase accumulator), so there are no phase jumps when a symbol does not contain a whole nr. of cycles.
+In that case the table contains the phase ramps of the symbols instead of their waveforms:
+
+    sample n of bit k  =  AMPLITUDE*sin(phase_k + phase_table[symbol_start[bit_k] + n])
+    phase_k+1          =  phase_k + symbol_phase[bit_k]
+
+The fixed parts of the telegram, that is, PREAMBLE + START at the beginning and TERMINATOR at the end,
+are rendered only once and cached (for each PREAMBLE, e.g. the long one or the short PN_PREAMBLE_BYTES), so only the variable bytes in between are rendered for each telegram.
+(with continuous phase the TERMINATOR depends on the phase at the end of the body and is rendered together with it)
+The samples are gathered directly into a pre-allocated buffer for the longest telegram,
+the returned array is a view on this buffer which is valid until the next call to renderTelegram().
+'''
+
+
+class TelegramModulator():
+    def __init__(self):
+        self.len_bit_one = audioSettings.LEN_BIT_ONE
+        self.len_bit_zero = audioSettings.LEN_BIT_ZERO
+        self.continuous_phase = audioSettings.CONTINUOUS_PHASE_FSK
+        # symbol table: ZERO followed by ONE, indexed with the bit value
+        self.symbol_table = np.concatenate([audioSettings.ZERO[:, 0], audioSettings.ONE[:, 0]])
+        self.symbol_start = np.array([0, self.len_bit_zero])
+        self.symbol_len = np.array([self.len_bit_zero, self.len_bit_one])
+        # phase increment per sample of ZERO and ONE, phase ramps and phase of complete symbols for the phase accumulator
+        phase_inc = 2.0*np.pi*np.array([audioSettings.CODE_SINE_FREQUENCY_ZERO, audioSettings.CODE_SINE_FREQUENCY_ONE])/audioSettings.SAMPLING_FREQUENCY
+        self.phase_table = np.concatenate([phase_inc[0]*np.arange(self.len_bit_zero), phase_inc[1]*np.arange(self.len_bit_one)])
+        self.symbol_phase = phase_inc*self.symbol_len
+        # phase at the end of the last rendered bytes
+        self.phase = 0.0
+        # with symbols of the same length the gather indexes of a bit are a row of this matrix
+        self.equal_len = (self.len_bit_one == self.len_bit_zero)
+        if self.equal_len:
+            self.symbol_index = self.symbol_start.reshape(-1, 1) + np.arange(self.len_bit_one)
+        # pre-allocated output for the longest telegram
+        self.telegram_samples = np.zeros(max(self.len_bit_one, self.len_bit_zero)*audioSettings.TELEGRAM_MAX_LEN_BITS)
+        # cached waveforms of the fixed parts of the telegram, the header is indexed by the PREAMBLE and START bytes
+        # and stored together with the phase at its end
+        self.header_cache = {}
+        self.long_preamble = b"\xFF"*audioSettings.TELEGRAM_PREAMBLE_LEN_BYTES
+        self.trailer = self.renderBytes(b"\x00"*audioSettings.TELEGRAM_TERMINATOR_LEN_BYTES)
+
+    # gather indexes into the symbol table for all samples of bits
+    def getSampleIndexes(self, bits):
+        if self.equal_len:
+            return self.symbol_index[bits].ravel()
+        # symbols of different length: every bit begins at the cumulated length of the previous bits
+        bit_len = self.symbol_len[bits]
+        bit_end = np.cumsum(bit_len)
+        offset = np.repeat(self.symbol_start[bits] - (bit_end - bit_len), bit_len)
+        return offset + np.arange(len(offset))
+
+    # returns the samples of byte_data, in a new array or at the beginning of out
+    # with continuous phase the first bit begins with the given phase, the phase at the end is stored in self.phase
+    def renderBytes(self, byte_data, out=None, phase=0.0):
+        bits = np.unpackbits(np.frombuffer(bytes(byte_data), dtype=np.uint8))
+        sample_indexes = self.getSampleIndexes(bits)
+        if out is None:
+            out = np.empty(len(sample_indexes))
+        out = out[:len(sample_indexes)]
+        if not self.continuous_phase:
+            return np.take(self.symbol_table, sample_indexes, out=out)
+        # phase accumulator: phase at the beginning of each bit
+        bit_phase = np.cumsum(self.symbol_phase[bits])
+        self.phase = (phase + bit_phase[-1])%(2.0*np.pi) if len(bits) > 0 else phase
+        bit_phase = phase + bit_phase - self.symbol_phase[bits]
+        np.take(self.phase_table, sample_indexes, out=out)
+        out += np.repeat(bit_phase, self.symbol_len[bits])
+        np.sin(out, out=out)
+        out *= audioSettings.AMPLITUDE
+        return out
+
+    def getHeader(self, start, preamble):
+        header = self.header_cache.get((preamble, start))
+        if header is None:
+            header = (self.renderBytes(preamble + bytearray([start])), self.phase)
+            self.header_cache[(preamble, start)] = header
+        return header
+
+    # renders PREAMBLE + START + byte_body + TERMINATOR,
+    # byte_body contains the bytes after START up to the checksum (inclusive),
+    # preamble = None is the long PREAMBLE of TELEGRAM_PREAMBLE_LEN_BYTES bytes 0xFF
+    def renderTelegram(self, start, byte_body, preamble=None):
+        if preamble is None:
+            preamble = self.long_preamble
+        header, header_phase = self.getHeader(start, bytes(preamble))
+        curr_pos = len(header)
+        self.telegram_samples[:curr_pos] = header
+        if self.continuous_phase:
+            byte_body = bytes(byte_body) + b"\x00"*audioSettings.TELEGRAM_TERMINATOR_LEN_BYTES
+        curr_pos += len(self.renderBytes(byte_body, out=self.telegram_samples[curr_pos:], phase=header_phase))
+        if not self.continuous_phase:
+            self.telegram_samples[curr_pos:curr_pos + len(self.trailer)] = self.trailer
+            curr_pos += len(self.trailer)
+        return self.telegram_samples[:curr_pos]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import threading
+from types import SimpleNamespace
+import pytest
+
+# the modules of AC4QGP are in the root folder of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audioSettings
+
+
+# shared variables as in SoundDeviceManager.GlobVars (without importing sounddevice, so no audio device is needed),
+# stream_on is set to False at the end of the test, which stops the decoder threads
+@pytest.fixture
+def glob_vars():
+    globVars = SimpleNamespace(
+        stream_on=[True],
+        transmit_on=bytearray([False]),
+        receive_on=bytearray([False]),
+        ack_received=[False, 0],
+        send_ack=[False],
+        send_nack=[False],
+        nack_received=[False, 0],
+        seqNrAck=[0],
+        seqNrAckRx=[0],
+        seqNrTx=[0],
+        private_key=[None],
+        cipher=[None],
+        comm_token=[0],
+        comm_event=threading.Condition(),
+        sack_to_send=[bytearray(0)],
+        sack_received=[audioSettings.ARQ_WINDOW_SIZE, []],
+        peer_capabilities=[0])
+    globVars.transmit_on_ref = memoryview(globVars.transmit_on)
+    globVars.receive_on_ref = memoryview(globVars.receive_on)
+    yield [globVars]
+    globVars.stream_on[0] = False
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import time
+import numpy as np
+import pytest
+import audioSettings
+from audioReceiver import AudioReceiver, READER_DECODER
+from audioTransmitter import AudioTransmitter
+
+'''
+Zero-gap bursts: telegrams committed together are streamed back to back by callback_play() (no padding, no pause),
+the receiver shall resume the search at the end of each telegram and decode all of them.
+'''
+NR_OF_TELEGRAMS = 6
+NOISE_AMPLITUDE = 0.01
+# max. nr. of chunks written ahead of the decoder (the RX ring buffer holds RX_RING_BUFFER_CHUNKS)
+MAX_CHUNKS_AHEAD = 4
+DECODE_TIMEOUT_SEC = 10.0
+
+
+# callback time info as passed by sounddevice (only currentTime is used)
+class CallbackTime:
+    currentTime = 0.0
+
+
+@pytest.mark.parametrize("pn_preamble", [False, True])
+def test_zero_gap_burst(glob_vars, monkeypatch, pn_preamble):
+    monkeypatch.setattr(audioSettings, "PN_PREAMBLE", pn_preamble)
+    glob_vars[0].peer_capabilities[0] = audioSettings.CAPABILITY_CRC | audioSettings.CAPABILITY_PN_PREAMBLE
+    audioTransmitter = AudioTransmitter(glob_vars)
+    audioReceiver = AudioReceiver(glob_vars)
+    rng = np.random.default_rng(0)
+    chunk_len = audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN
+    # all telegrams are committed before playing, so callback_play() streams them without gap
+    assert NR_OF_TELEGRAMS <= audioSettings.MAX_NR_OF_TELEGRAMS_IN_PARALLEL
+    for i in range(NR_OF_TELEGRAMS):
+        audioTransmitter.sendAudioMessageSeq(audioSettings.COMMAND_CALL, bytearray([i]*int(rng.integers(1, 12))))
+    # silence before and after the burst
+    chunks = [np.zeros((chunk_len, 1), dtype=np.float32) for i in range(2)]
+    while audioTransmitter.txSlotRing.getOccupancy() > 0:
+        outdata = np.zeros((chunk_len, 1), dtype=np.float32)
+        audioTransmitter.callback_play(outdata, chunk_len, CallbackTime, None)
+        chunks.append(outdata)
+    chunks += [np.zeros((chunk_len, 1), dtype=np.float32) for i in range(8)]
+    for indata in chunks:
+        indata += (NOISE_AMPLITUDE*rng.standard_normal(indata.shape)).astype(np.float32)
+        while audioReceiver.rxRingBuffer.available(READER_DECODER) > MAX_CHUNKS_AHEAD*chunk_len:
+            time.sleep(0.001)
+        audioReceiver.callback_rx_in(indata, chunk_len, CallbackTime, None)
+    deadline = time.monotonic() + DECODE_TIMEOUT_SEC
+    while (audioReceiver.getTelRxOk() < NR_OF_TELEGRAMS) and (time.monotonic() < deadline):
+        time.sleep(0.01)
+    assert audioReceiver.getTelRxOk() == NR_OF_TELEGRAMS
+    assert audioReceiver.getTelRxNok() == 0
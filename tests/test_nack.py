@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import time
+import numpy as np
+import audioSettings
+from audioReceiver import AudioReceiver, READER_DECODER
+from audioTransmitter import AudioTransmitter
+
+'''
+NACK in stop-and-wait mode when our ACK was lost:
+the other side received our last telegram (its seqNrAck is one ahead) but we did not receive its ACK (our seqNrAckRx lags behind),
+so the NACK sent by us with seqNrAckRx is one behind the seqNrAck of the other side and shall be processed anyway.
+'''
+NOISE_AMPLITUDE = 0.01
+# max. nr. of chunks written ahead of the decoder (the RX ring buffer holds RX_RING_BUFFER_CHUNKS)
+MAX_CHUNKS_AHEAD = 4
+DECODE_TIMEOUT_SEC = 10.0
+# last seqNr acknowledged by the other side, as seen by us (the ACK of LAST_SEQ_NR was lost)
+LAST_SEQ_NR = 4
+
+
+# callback time info as passed by sounddevice (only currentTime is used)
+class CallbackTime:
+    currentTime = 0.0
+
+
+def test_nack_after_lost_ack(glob_vars, monkeypatch):
+    monkeypatch.setattr(audioSettings, "ARQ_WINDOW_SIZE", 1)
+    audioTransmitter = AudioTransmitter(glob_vars)
+    audioReceiver = AudioReceiver(glob_vars)
+    rng = np.random.default_rng(0)
+    chunk_len = audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN
+    # NACK sent by us with the seqNr of the telegram whose ACK we did not receive
+    glob_vars[0].seqNrAckRx[0] = LAST_SEQ_NR - 1
+    audioTransmitter.sendNack()
+    chunks = [np.zeros((chunk_len, 1), dtype=np.float32) for i in range(2)]
+    while audioTransmitter.txSlotRing.getOccupancy() > 0:
+        outdata = np.zeros((chunk_len, 1), dtype=np.float32)
+        audioTransmitter.callback_play(outdata, chunk_len, CallbackTime, None)
+        chunks.append(outdata)
+    chunks += [np.zeros((chunk_len, 1), dtype=np.float32) for i in range(8)]
+    # NACK received by the other side, which already received LAST_SEQ_NR
+    glob_vars[0].seqNrAck[0] = LAST_SEQ_NR
+    for indata in chunks:
+        indata += (NOISE_AMPLITUDE*rng.standard_normal(indata.shape)).astype(np.float32)
+        while audioReceiver.rxRingBuffer.available(READER_DECODER) > MAX_CHUNKS_AHEAD*chunk_len:
+            time.sleep(0.001)
+        audioReceiver.callback_rx_in(indata, chunk_len, CallbackTime, None)
+    deadline = time.monotonic() + DECODE_TIMEOUT_SEC
+    while (glob_vars[0].nack_received[0] == False) and (time.monotonic() < deadline):
+        time.sleep(0.01)
+    assert glob_vars[0].nack_received[0] == True
+    assert audioReceiver.getTelRxNok() == 0
+    # the NACK is not processed as a telegram of the sequence
+    assert glob_vars[0].seqNrAck[0] == LAST_SEQ_NR
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import tracemalloc
+import numpy as np
+import pytest
+import audioSettings
+from audioReceiver import AudioReceiver, READER_DECODER
+from audioTransmitter import AudioTransmitter
+
+'''
+Steady state of the real-time sample path without allocations:
+    - callback_rx_in() writing the input to the RX ring buffer,
+    - the front end of the decoder loop, AudioReceiver.updateDecoderBuffer() (decimation, bit detector and decoder buffer),
+    - callback_play() playing a telegram, and silence (with and without carrier).
+Python still creates small objects (e.g. views on the buffers) but no buffer of samples shall be allocated,
+so the peak of traced memory stays below the size of one decimated part, and the traced memory does not grow.
+NOT in scope: the voice filters (scipy.signal.sosfilt() returns new arrays) of callback_wire_in() and callback_wire_out(),
+and the search of PREAMBLE and START and the decoding done once per part.
+'''
+# calls before tracing, so caches of numpy are filled
+WARMUP_CALLS = 300
+MEASURED_CALLS = 50
+# size of one decimated part
+MAX_ALLOCATED_BYTES = audioSettings.DECODER_N*np.dtype(np.float64).itemsize
+
+
+# callback time info as passed by sounddevice (only currentTime is used)
+class CallbackTime:
+    currentTime = 0.0
+
+
+# returns (growth, peak) of the traced memory in bytes while calling function nr_of_calls times
+def traceMemory(function, nr_of_calls):
+    tracemalloc.start()
+    try:
+        # the first calls may still create internal objects of tracemalloc and numpy
+        for i in range(5):
+            function()
+        tracemalloc.reset_peak()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        for i in range(nr_of_calls):
+            function()
+        memory_after, memory_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return memory_after - memory_before, memory_peak - memory_before
+
+
+@pytest.mark.parametrize("detect_using_discriminator", [False, True])
+def test_rx_sample_path(glob_vars, monkeypatch, detect_using_discriminator):
+    monkeypatch.setattr(audioSettings, "DETECT_USING_DISCRIMINATOR", detect_using_discriminator)
+    # no decoder thread, the parts are read here
+    glob_vars[0].stream_on[0] = False
+    audioReceiver = AudioReceiver(glob_vars)
+    rng = np.random.default_rng(0)
+    indata = rng.standard_normal((audioSettings.AUDIO_RX_CHUNK_SAMPLES_LEN, 1)).astype(np.float32)
+
+    def processChunk():
+        audioReceiver.callback_rx_in(indata, len(indata), CallbackTime, None)
+        while audioReceiver.rxRingBuffer.available(READER_DECODER) >= audioSettings.N:
+            audioReceiver.updateDecoderBuffer(audioReceiver.rxRingBuffer.read(READER_DECODER, audioSettings.N))
+
+    for i in range(WARMUP_CALLS):
+        processChunk()
+    growth, peak = traceMemory(processChunk, MEASURED_CALLS)
+    assert growth < MAX_ALLOCATED_BYTES
+    assert peak < MAX_ALLOCATED_BYTES
+
+
+@pytest.mark.parametrize("add_carrier", [False, True])
+def test_tx_callback_play(glob_vars, monkeypatch, add_carrier):
+    monkeypatch.setattr(audioSettings, "ADD_CARRIER", add_carrier)
+    audioTransmitter = AudioTransmitter(glob_vars)
+    outdata = np.zeros((audioSettings.AUDIO_TX_CHUNK_SAMPLES_LEN, 1), dtype=np.float32)
+
+    def playChunk():
+        audioTransmitter.callback_play(outdata, len(outdata), CallbackTime, None)
+
+    # two telegrams back to back (the first calls are not measured)
+    for i in range(2):
+        audioTransmitter.sendAudioMessageSeq(audioSettings.COMMAND_CHAT_DATA, bytearray(audioSettings.DATA_MAX_LEN_BYTES))
+    nr_of_chunks = int(np.sum(audioTransmitter.txSlotRing.slot_samples))//len(outdata)
+    growth, peak = traceMemory(playChunk, nr_of_chunks - 6)
+    assert audioTransmitter.txSlotRing.getOccupancy() > 0
+    assert growth < MAX_ALLOCATED_BYTES
+    assert peak < MAX_ALLOCATED_BYTES
+    # silence
+    for i in range(WARMUP_CALLS):
+        playChunk()
+    growth, peak = traceMemory(playChunk, MEASURED_CALLS)
+    assert growth < MAX_ALLOCATED_BYTES
+    assert peak < MAX_ALLOCATED_BYTES
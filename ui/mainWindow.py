@@ -282,7 +282,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
                 
     # called perdiodically by matplotlib animation (in the "main loop") to update the plot
     # Typically, audio callbacks happen more frequently than plot updates,
-    # therefore the queue tends to contain multiple blocks of audio data
+    # therefore the RX ring buffer tends to contain multiple blocks of audio data, only the most recent one is plotted
     def update_plot(self, frame):       
         data = None
         # loop all rx data until queue is empty
@@ -1119,8 +1119,6 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.leMaxChannelDelayMs.setText(str(audioSettings.CHANNEL_DELAY_MS))
         self.leMaxNrOfResends.setText(str(audioSettings.MAX_RESENDS))
         self.cbGroetzel.setChecked(audioSettings.DETECT_USING_GROETZEL)
-        # deactivated for now, DETECT_USING_GROETZEL not used 
-        self.cbGroetzel.setEnabled(False)
         self.cbRemoveRxCarrier.setChecked(audioSettings.REMOVE_RX_CARRIER)
         self.cbAddTxCarrier.setChecked(audioSettings.ADD_CARRIER)
     
@@ -1601,7 +1599,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
     @pyqtSlot()
     def on_cbGroetzel_clicked(self):
         audioSettings.DETECT_USING_GROETZEL = self.cbGroetzel.isChecked()
-        tkinter.messagebox.showwarning(title="WARNING", message="Save and restart in order to plot correctly.")
+        tkinter.messagebox.showwarning(title="WARNING", message="Restart needed to apply this setting.\nPress Save button to keep this setting after a new start.")
         # NOTE: call root.mainloop() to enable the program to respond to events. 
         root.update()
     